@@ -1,6 +1,31 @@
+import os
+import time
 from django.apps import AppConfig
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from face_recognition.runtime_config import configure_runtime
+
+        # Thread budgets for FACENET_RUNTIME_ROLE (stream or upload) must be
+        # in place before TensorFlow or BLAS start their pools.
+        configure_runtime()
+
+        # Vision models load lazily, once in each process that uses them.
+        # Web workers that serve recognition set FACENET_WARMUP=1 to load
+        # them at boot instead of on the first request; migrate, shells and
+        # other processes never touch them. With FACENET_INFERENCE_SOCKET
+        # detection and FaceNet both live in the inference server and a
+        # worker only loads its Haar cascade.
+        if os.environ.get("FACENET_WARMUP", "0").strip().lower() not in {"1", "true", "yes"}:
+            return
+        from .facenet import warmup
+        from .detectors import warmup_detectors
+
+        started = time.perf_counter()
+        warmup()
+        warmup_detectors()
+        print(f"[INFO] Vision models warmed up in {time.perf_counter() - started:.1f}s")
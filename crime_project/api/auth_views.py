@@ -5,15 +5,13 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.conf import settings
 from investigator_module.models import Investigator
-from crime_database.models import Criminal, CrimeRecord, Evidence
-from .facenet import reload_embeddings
+from crime_database.models import Criminal, CrimeRecord, Evidence, RetrainJob
+from .retrain_jobs import enqueue_retrain, serialize_job
 from pathlib import Path
 from datetime import datetime
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 import json
-import sys
-import subprocess
 import uuid
 
 
@@ -212,8 +210,6 @@ def _coerce_crime_date(value):
 
 
 DATASET_DIR = Path(settings.BASE_DIR) / "dataset"
-FACE_RECOGNITION_DIR = Path(settings.BASE_DIR) / "face_recognition"
-EMBEDDING_SCRIPT = FACE_RECOGNITION_DIR / "build_embeddings.py"
 ALLOWED_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
 
 
@@ -256,24 +252,13 @@ def _rename_dataset_folder(old_label, new_label):
         old_folder.rename(new_folder)
 
 
-def _rebuild_embeddings():
-    if not EMBEDDING_SCRIPT.exists():
-        return False, "Embedding script not found"
+def _queue_enrollment(face_label, previous_label=None):
+    """Queue a gallery update for one identity; the request does not wait for it.
 
-    completed = subprocess.run(
-        [sys.executable, EMBEDDING_SCRIPT.name],
-        cwd=str(FACE_RECOGNITION_DIR),
-        capture_output=True,
-        text=True,
-        check=False,
-    )
-
-    if completed.returncode != 0:
-        message = completed.stderr.strip() or completed.stdout.strip() or "Embedding rebuild failed"
-        return False, message
-
-    reload_embeddings()
-    return True, "Face dataset re-trained successfully"
+    Only the job id is returned: the outcome is read from admin/retrain/<job_id>/.
+    """
+    job = enqueue_retrain(RetrainJob.KIND_ENROLL, face_label, previous_label or "")
+    return job.id
 
 
 @csrf_exempt
@@ -502,15 +487,14 @@ def admin_criminals(request):
         for upload in training_files:
             _save_upload_to_dataset(upload, criminal.face_label)
 
-        trained, training_message = _rebuild_embeddings()
-        message = "Criminal created and dataset updated." if trained else "Criminal created, but dataset training failed."
+        training_job_id = _queue_enrollment(criminal.face_label)
 
         return JsonResponse(
             {
                 "success": True,
-                "message": message,
-                "training_success": trained,
-                "training_message": training_message,
+                "message": f"Criminal created; dataset training queued (job #{training_job_id}).",
+                "training_job_id": training_job_id,
+                "training_status": RetrainJob.STATUS_QUEUED,
                 "criminal": _serialize_criminal(criminal),
             }
         )
@@ -571,19 +555,20 @@ def admin_criminal_detail(request, criminal_id):
             _save_upload_to_dataset(upload, criminal.face_label)
             dataset_changed = True
 
-        trained = True
-        training_message = "No dataset change detected"
+        training_job_id = None
+        training_status = None
+        message = "Criminal updated."
         if dataset_changed:
-            trained, training_message = _rebuild_embeddings()
-
-        message = "Criminal updated and dataset synchronized." if trained else "Criminal updated, but dataset training failed."
+            training_job_id = _queue_enrollment(criminal.face_label, old_face_label)
+            training_status = RetrainJob.STATUS_QUEUED
+            message = f"Criminal updated; dataset training queued (job #{training_job_id})."
 
         return JsonResponse(
             {
                 "success": True,
                 "message": message,
-                "training_success": trained,
-                "training_message": training_message,
+                "training_job_id": training_job_id,
+                "training_status": training_status,
                 "criminal": _serialize_criminal(criminal),
             }
         )
@@ -597,20 +582,42 @@ def admin_retrain_embeddings(request):
     if not admin_user:
         return JsonResponse({"success": False, "message": "Unauthorized"}, status=401)
 
+    if request.method == "GET":
+        jobs = RetrainJob.objects.order_by("-id")[:20]
+        return JsonResponse({"success": True, "jobs": [serialize_job(job) for job in jobs]})
+
     if request.method != "POST":
         return JsonResponse({"success": False, "message": "Method not allowed"}, status=405)
 
-    trained, training_message = _rebuild_embeddings()
-    status = 200 if trained else 500
+    job = enqueue_retrain(RetrainJob.KIND_FULL)
     return JsonResponse(
         {
-            "success": trained,
-            "message": training_message,
+            "success": True,
+            "message": f"Dataset re-training queued (job #{job.id})",
+            "job_id": job.id,
+            "status": RetrainJob.STATUS_QUEUED,
         },
-        status=status,
+        status=202,
     )
 
 
+@csrf_exempt
+def admin_retrain_job(request, job_id):
+    admin_user = _admin_authenticated(request)
+    if not admin_user:
+        return JsonResponse({"success": False, "message": "Unauthorized"}, status=401)
+
+    if request.method != "GET":
+        return JsonResponse({"success": False, "message": "Method not allowed"}, status=405)
+
+    try:
+        job = RetrainJob.objects.get(id=job_id)
+    except RetrainJob.DoesNotExist:
+        return JsonResponse({"success": False, "message": "Retrain job not found"}, status=404)
+
+    return JsonResponse({"success": True, "job": serialize_job(job)})
+
+
 @csrf_exempt
 def admin_crime_records(request):
     admin_user = _admin_authenticated(request)
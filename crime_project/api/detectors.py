@@ -0,0 +1,117 @@
+import threading
+from contextlib import contextmanager
+from face_recognition.face_detector import FaceDetector, load_haar_cascade
+from face_recognition.facenet_encoder import detection_corners, downscale_for_detection
+from face_recognition.inference_client import InferenceClient, InferenceServerError
+from .facenet import INFERENCE_FALLBACK, INFERENCE_SOCKET
+
+# One detector per process, shared by the live stream and every upload.
+# With FACENET_INFERENCE_SOCKET it is a RemoteFaceDetector and YOLO/MTCNN
+# load only in the inference server; otherwise they load once here. Haar
+# cascades are pooled because one classifier must not run in two threads
+# at once.
+_REGISTRY_LOCK = threading.Lock()
+_face_detector = None
+_haar_idle = []
+_haar_loaded = 0
+
+
+class RemoteFaceDetector:
+    """FaceDetector stand-in that detects in the host's inference_server.py.
+
+    The frame is shrunk here first, so only a DETECT_MAX_SIDE copy crosses
+    the socket. When the server fails, a local FaceDetector is loaded on
+    first need, or nothing is detected with FACENET_INFERENCE_FALLBACK=0.
+    """
+
+    mode = "REMOTE"
+
+    def __init__(self, client):
+        self.client = client
+        self.local = None
+        self._warned = False
+
+    def detect(self, frame, scale=1.0):
+        small, own_scale = downscale_for_detection(frame)
+        try:
+            return self.client.detect(small, scale * own_scale)
+        except (OSError, InferenceServerError) as exc:
+            if not self._warned:
+                self._warned = True
+                fallback = "detecting locally" if INFERENCE_FALLBACK else "skipping detection"
+                print(f"[WARNING] Inference server detection failed ({exc}); {fallback}")
+            if not INFERENCE_FALLBACK:
+                return []
+        return self._local_detector().detect(small, scale=scale * own_scale)
+
+    def detect_faces(self, frame):
+        return [detection_corners(detection) for detection in self.detect(frame)]
+
+    def _local_detector(self):
+        if self.local is None:
+            with _REGISTRY_LOCK:
+                if self.local is None:
+                    self.local = FaceDetector()
+        return self.local
+
+
+def get_face_detector():
+    """The process-wide YOLO/MTCNN detector, created on first use."""
+    global _face_detector
+    if _face_detector is None:
+        with _REGISTRY_LOCK:
+            if _face_detector is None:
+                if INFERENCE_SOCKET:
+                    _face_detector = RemoteFaceDetector(InferenceClient(INFERENCE_SOCKET))
+                else:
+                    _face_detector = FaceDetector()
+    return _face_detector
+
+
+def _load_haar():
+    global _haar_loaded
+    cascade = load_haar_cascade()
+    with _REGISTRY_LOCK:
+        _haar_loaded += 1
+    return cascade
+
+
+@contextmanager
+def haar_cascade():
+    """Borrow a Haar cascade for the duration of one detection.
+
+    Sequential callers reuse the same instance; a new one is only loaded
+    when every pooled cascade is busy in another thread.
+    """
+    with _REGISTRY_LOCK:
+        cascade = _haar_idle.pop() if _haar_idle else None
+    if cascade is None:
+        cascade = _load_haar()
+    try:
+        yield cascade
+    finally:
+        with _REGISTRY_LOCK:
+            _haar_idle.append(cascade)
+
+
+def warmup_detectors():
+    """Load the face detector and one Haar cascade ahead of the first request."""
+    detector = get_face_detector()
+    with _REGISTRY_LOCK:
+        need_haar = not _haar_loaded
+    if need_haar:
+        try:
+            with haar_cascade():
+                pass
+        except Exception as exc:
+            print(f"[WARNING] Haar cascade unavailable ({exc})")
+    return detector
+
+
+def detector_status():
+    with _REGISTRY_LOCK:
+        return {
+            "face_detector": _face_detector.mode if _face_detector is not None else None,
+            "haar_loaded": _haar_loaded,
+            "haar_idle": len(_haar_idle),
+        }
@@ -0,0 +1,445 @@
+import itertools
+import os
+import time
+from collections import deque
+import cv2
+import numpy as np
+from face_recognition.facenet_encoder import detection_corners, detection_from_corners, quality_gate
+
+# The detector runs on every FACE_DETECT_INTERVAL-th frame (a keyframe); the
+# frames in between only move the last boxes with FACE_TRACKER.
+DETECT_INTERVAL = max(1, int(os.environ.get("FACE_DETECT_INTERVAL", "5")))
+TRACKER = os.environ.get("FACE_TRACKER", "flow").strip().lower()
+
+# Re-detect triggers besides the interval. A flow track is lost when fewer
+# than TRACK_MIN_POINTS of its feature points, or less than
+# TRACK_MIN_SURVIVAL of them, survive the forward-backward check.
+TRACK_MIN_POINTS = max(3, int(os.environ.get("FACE_TRACK_MIN_POINTS", "6")))
+TRACK_MIN_SURVIVAL = float(os.environ.get("FACE_TRACK_MIN_SURVIVAL", "0.5"))
+TRACK_MAX_FB_ERROR = float(os.environ.get("FACE_TRACK_MAX_FB_ERROR", "1.5"))
+# Mean grey-level change between frames above which the scene is treated as
+# cut (camera moved, lights switched) and the detector runs again.
+REDETECT_MOTION = float(os.environ.get("FACE_REDETECT_MOTION", "20"))
+
+# A keyframe detection takes over a track it overlaps by at least this IoU.
+TRACK_MATCH_IOU = float(os.environ.get("FACE_TRACK_MATCH_IOU", "0.3"))
+# Keyframes a track survives without a matching detection, so one missed
+# detection does not hand the face a new track ID.
+TRACK_MAX_MISSES = max(0, int(os.environ.get("FACE_TRACK_MAX_MISSES", "1")))
+
+# A track whose identity has settled is only embedded again after
+# FACE_IDENTITY_RECHECK_SECONDS, when its box has drifted below
+# FACE_IDENTITY_DRIFT_IOU overlap with the box it was verified on, or when
+# its crop is FACE_IDENTITY_QUALITY_GAIN times sharper than that one was.
+IDENTITY_RECHECK_SECONDS = float(os.environ.get("FACE_IDENTITY_RECHECK_SECONDS", "2"))
+IDENTITY_DRIFT_IOU = float(os.environ.get("FACE_IDENTITY_DRIFT_IOU", "0.5"))
+IDENTITY_QUALITY_GAIN = float(os.environ.get("FACE_IDENTITY_QUALITY_GAIN", "1.5"))
+# A new embedding this far from the track's fused one means the track now
+# follows someone else; the fused embedding starts over.
+IDENTITY_RESET_SIMILARITY = float(os.environ.get("FACE_IDENTITY_RESET_SIMILARITY", "0.4"))
+
+TRACKERS = ("flow", "kcf", "mosse", "csrt", "mil")
+_OPENCV_TRACKERS = {
+    "kcf": "TrackerKCF_create",
+    "mosse": "TrackerMOSSE_create",
+    "csrt": "TrackerCSRT_create",
+    "mil": "TrackerMIL_create",
+}
+_FLOW_PARAMS = {
+    "winSize": (15, 15),
+    "maxLevel": 2,
+    "criteria": (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+}
+
+
+def _opencv_tracker_factory(method):
+    name = _OPENCV_TRACKERS.get(method)
+    if name is None:
+        return None
+    # KCF, MOSSE and CSRT ship with opencv-contrib-python; MOSSE only
+    # under cv2.legacy in OpenCV 4.5+.
+    for module in (cv2, getattr(cv2, "legacy", None)):
+        if module is not None and hasattr(module, name):
+            return getattr(module, name)
+    return None
+
+
+def resolve_tracker(method):
+    """``(method, factory)`` for ``method``, falling back to optical flow."""
+    if method == "flow":
+        return "flow", None
+    factory = _opencv_tracker_factory(method)
+    if factory is None:
+        print(f"[WARNING] OpenCV tracker {method!r} is not available in this build; tracking with optical flow")
+        return "flow", None
+    return method, factory
+
+
+def box_iou(a, b):
+    ax1, ay1, ax2, ay2 = a
+    bx1, by1, bx2, by2 = b
+    inter_w = max(0, min(ax2, bx2) - max(ax1, bx1))
+    inter_h = max(0, min(ay2, by2) - max(ay1, by1))
+    inter = inter_w * inter_h
+    union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class _Track:
+    def __init__(self, track_id, detection):
+        self.track_id = track_id
+        self.misses = 0
+        self.lost = False
+        self.points = None
+        self.tracker = None
+        self.reset(detection)
+
+    def reset(self, detection):
+        x, y, w, h = (float(value) for value in detection["box"])
+        self.center = np.array([x + w / 2.0, y + h / 2.0])
+        self.size = np.array([w, h])
+        self.confidence = detection.get("confidence")
+        keypoints = detection.get("keypoints")
+        self.keypoints = (
+            {name: np.asarray(point, dtype=np.float64) for name, point in keypoints.items()} if keypoints else None
+        )
+
+    def corners(self):
+        x1, y1 = self.center - self.size / 2.0
+        x2, y2 = self.center + self.size / 2.0
+        return x1, y1, x2, y2
+
+    def move(self, shift, scale, frame_shape):
+        """Apply a shift and scale about the box centre; False if the face left the frame."""
+        old_center = self.center
+        self.center = old_center + shift
+        self.size = self.size * scale
+        if self.keypoints:
+            self.keypoints = {
+                name: (point - old_center) * scale + self.center for name, point in self.keypoints.items()
+            }
+        height, width = frame_shape[:2]
+        x1, y1, x2, y2 = self.corners()
+        visible_w = min(x2, width) - max(x1, 0)
+        visible_h = min(y2, height) - max(y1, 0)
+        return visible_w >= self.size[0] / 2.0 and visible_h >= self.size[1] / 2.0
+
+    def detection(self, frame_shape):
+        height, width = frame_shape[:2]
+        x1, y1, x2, y2 = self.corners()
+        keypoints = None
+        if self.keypoints:
+            keypoints = {name: (float(point[0]), float(point[1])) for name, point in self.keypoints.items()}
+        detection = detection_from_corners(
+            max(0, round(x1)), max(0, round(y1)), min(width, round(x2)), min(height, round(y2)),
+            self.confidence, keypoints,
+        )
+        detection["track_id"] = self.track_id
+        return detection
+
+
+class FaceTracker:
+    """Runs ``detect`` on keyframes and tracks the faces in between.
+
+    A keyframe comes every ``interval`` frames, or sooner when a track is
+    lost or the caller passes ``force_detect``. Each face keeps its
+    ``track_id`` from keyframe to keyframe while the new detection
+    overlaps its tracked box.
+    """
+
+    def __init__(self, detect, interval=DETECT_INTERVAL, method=TRACKER):
+        self.detect = detect
+        self.interval = max(1, int(interval))
+        self.method, self.factory = resolve_tracker(method)
+        self.tracks = []
+        self.prev_gray = None
+        self.since_keyframe = None
+        self.track_ids = itertools.count(1)
+        self.frames = 0
+        self.keyframes = 0
+
+    def update(self, frame, gray=None, force_detect=False):
+        """Detections for ``frame`` in MTCNN's format, each with a ``track_id``."""
+        if gray is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.frames += 1
+
+        keyframe = force_detect or self.since_keyframe is None or self.since_keyframe + 1 >= self.interval
+        if not keyframe and not self._track(frame, gray):
+            keyframe = True
+        if keyframe:
+            self._redetect(frame, gray)
+            self.since_keyframe = 0
+        else:
+            self.since_keyframe += 1
+        self.prev_gray = gray
+        return [track.detection(frame.shape) for track in self.tracks]
+
+    def stats(self):
+        return {
+            "tracker": self.method,
+            "interval": self.interval,
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "tracks": len(self.tracks),
+        }
+
+    def _redetect(self, frame, gray):
+        self.keyframes += 1
+        detections = self.detect(frame)
+
+        # Greedy IoU matching keeps each face's track ID.
+        pairs = sorted(
+            (
+                (box_iou(track.corners(), detection_corners(detection)), track_index, detection_index)
+                for track_index, track in enumerate(self.tracks)
+                for detection_index, detection in enumerate(detections)
+            ),
+            reverse=True,
+        )
+        matched_tracks, matched_detections = {}, set()
+        for iou, track_index, detection_index in pairs:
+            if iou < TRACK_MATCH_IOU:
+                break
+            if track_index in matched_tracks or detection_index in matched_detections:
+                continue
+            matched_tracks[track_index] = detection_index
+            matched_detections.add(detection_index)
+
+        tracks = []
+        for track_index, track in enumerate(self.tracks):
+            if track_index in matched_tracks:
+                track.reset(detections[matched_tracks[track_index]])
+                track.misses = 0
+            elif track.misses < TRACK_MAX_MISSES and not track.lost:
+                track.misses += 1
+            else:
+                continue
+            tracks.append(track)
+        for detection_index, detection in enumerate(detections):
+            if detection_index not in matched_detections:
+                tracks.append(_Track(next(self.track_ids), detection))
+
+        for track in tracks:
+            track.lost = False
+            self._seed(track, frame, gray)
+        self.tracks = tracks
+
+    def _seed(self, track, frame, gray):
+        if self.factory is not None:
+            x, y, w, h = track.detection(frame.shape)["box"]
+            track.tracker = self.factory()
+            track.tracker.init(frame, (int(x), int(y), max(1, int(w)), max(1, int(h))))
+            return
+
+        # Features from the inner face only, so background corners inside
+        # the box do not drag it along.
+        x1, y1, x2, y2 = track.corners()
+        w, h = track.size
+        mask = np.zeros_like(gray)
+        mask[
+            max(0, int(y1 + 0.1 * h)) : max(0, int(y2 - 0.1 * h)),
+            max(0, int(x1 + 0.15 * w)) : max(0, int(x2 - 0.15 * w)),
+        ] = 255
+        track.points = cv2.goodFeaturesToTrack(gray, maxCorners=40, qualityLevel=0.01, minDistance=4, mask=mask)
+
+    def _track(self, frame, gray):
+        """Move every track to ``frame``; False as soon as one is lost."""
+        if not self.tracks:
+            return True
+        if self.factory is not None:
+            return all(self._track_opencv(track, frame) for track in self.tracks)
+        return self._track_flow(frame, gray)
+
+    def _track_opencv(self, track, frame):
+        ok, box = track.tracker.update(frame)
+        if not ok:
+            track.lost = True
+            return False
+        x, y, w, h = (float(value) for value in box)
+        shift = np.array([x + w / 2.0, y + h / 2.0]) - track.center
+        scale = w / track.size[0] if track.size[0] > 0 else 1.0
+        if not track.move(shift, scale, frame.shape):
+            track.lost = True
+            return False
+        return True
+
+    def _track_flow(self, frame, gray):
+        if any(track.points is None or len(track.points) < TRACK_MIN_POINTS for track in self.tracks):
+            for track in self.tracks:
+                track.lost = track.points is None or len(track.points) < TRACK_MIN_POINTS
+            return False
+
+        # One pyramidal Lucas-Kanade pass for all faces, forward and back;
+        # points that do not return to where they started are dropped.
+        points = np.concatenate([track.points for track in self.tracks]).astype(np.float32)
+        forward, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, points, None, **_FLOW_PARAMS)
+        backward, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, forward, None, **_FLOW_PARAMS)
+        error = np.linalg.norm((points - backward).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < TRACK_MAX_FB_ERROR)
+
+        all_ok = True
+        offset = 0
+        for track in self.tracks:
+            count = len(track.points)
+            keep = good[offset : offset + count]
+            old = points[offset : offset + count].reshape(-1, 2)[keep]
+            new = forward[offset : offset + count].reshape(-1, 2)[keep]
+            offset += count
+            if len(new) < TRACK_MIN_POINTS or len(new) < TRACK_MIN_SURVIVAL * count:
+                track.lost = True
+                all_ok = False
+                continue
+
+            shift = np.median(new - old, axis=0)
+            # Scale from how pairwise distances between the points changed.
+            first, second = np.triu_indices(len(new), k=1)
+            old_spread = np.linalg.norm(old[first] - old[second], axis=1)
+            new_spread = np.linalg.norm(new[first] - new[second], axis=1)
+            usable = old_spread > 1.0
+            scale = float(np.median(new_spread[usable] / old_spread[usable])) if usable.any() else 1.0
+            # Shift is measured at the points; move the box centre with them.
+            pivot = np.median(old, axis=0)
+            center_shift = shift + (track.center - pivot) * (scale - 1.0)
+            if not track.move(center_shift, scale, frame.shape):
+                track.lost = True
+                all_ok = False
+                continue
+            track.points = new.reshape(-1, 1, 2)
+        return all_ok
+
+
+class _Identity:
+    def __init__(self, window):
+        self.votes = deque(maxlen=window)
+        self.fused_sum = None
+        self.fused = None
+        self.result = None
+        self.verified_at = None
+        self.verified_box = None
+        self.verified_quality = 0.0
+        self.verifications = 0
+
+    def fuse(self, embedding, weight):
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        embedding = embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+        if self.fused is not None and float(self.fused @ embedding) < IDENTITY_RESET_SIMILARITY:
+            self.fused_sum = None
+            self.votes.clear()
+        # Quality-weighted running mean, so sharp frames count for more.
+        weighted = max(weight, 0.05) * embedding
+        self.fused_sum = weighted if self.fused_sum is None else self.fused_sum + weighted
+        self.fused = self.fused_sum / max(float(np.linalg.norm(self.fused_sum)), 1e-12)
+
+
+class TrackIdentities:
+    """Recognition results cached per track ID.
+
+    A new track is embedded on every frame until its votes settle: some
+    label reaches ``min_hits`` candidate votes, or ``window`` verifications
+    pass without one. After that the cached result is reused and the track
+    is only re-verified on the IDENTITY_* triggers. Each verification folds
+    the new embedding into the track's fused embedding, and the fused
+    embedding is what gets matched.
+
+    ``embed(frame, detections)`` returns ``(embedding, meta)`` pairs and
+    ``match(embedded)`` turns them into ``(label, confidence, details)``.
+    """
+
+    def __init__(self, embed, match, window, min_hits, min_confidence):
+        self.embed = embed
+        self.match = match
+        self.window = window
+        self.min_hits = min_hits
+        self.min_confidence = min_confidence
+        self.identities = {}
+        self.lookups = 0
+        self.embedded = 0
+
+    def update(self, frame, detections, now=None):
+        """``(label, confidence, details)`` for each tracked detection in ``frame``."""
+        now = time.monotonic() if now is None else now
+        live = {detection["track_id"] for detection in detections}
+        for track_id in [track_id for track_id in self.identities if track_id not in live]:
+            del self.identities[track_id]
+        if not detections:
+            return []
+        self.lookups += len(detections)
+
+        boxes = [detection_corners(detection) for detection in detections]
+        quality = self._crop_quality(frame, boxes)
+        due = []
+        for index, detection in enumerate(detections):
+            identity = self.identities.setdefault(detection["track_id"], _Identity(self.window))
+            if (
+                not self._settled(identity)
+                or now - identity.verified_at >= IDENTITY_RECHECK_SECONDS
+                or box_iou(identity.verified_box, boxes[index]) < IDENTITY_DRIFT_IOU
+                or quality[index] > IDENTITY_QUALITY_GAIN * identity.verified_quality
+            ):
+                due.append(index)
+        if due:
+            self._verify(frame, detections, boxes, quality, due, now)
+
+        results = []
+        for index, detection in enumerate(detections):
+            label, confidence, details = self.identities[detection["track_id"]].result
+            details = dict(details, track_id=detection["track_id"], cached=index not in due)
+            results.append((label, confidence, details))
+        return results
+
+    def votes(self):
+        """Each live track's recent candidate votes, for temporal voting."""
+        return [identity.votes for identity in self.identities.values()]
+
+    def stats(self):
+        return {"tracks": len(self.identities), "lookups": self.lookups, "embedded": self.embedded}
+
+    def _settled(self, identity):
+        if identity.result is None:
+            return False
+        if len(identity.votes) >= self.window:
+            return True
+        counts = {}
+        for vote in identity.votes:
+            if vote is not None:
+                counts[vote["face_label"]] = counts.get(vote["face_label"], 0) + 1
+        return max(counts.values(), default=0) >= self.min_hits
+
+    @staticmethod
+    def _crop_quality(frame, boxes):
+        """Thumbnail sharpness of each box, 0 where the quality gate rejects it."""
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in boxes]
+        usable = [index for index, crop in enumerate(crops) if crop.size]
+        scores = [0.0] * len(crops)
+        if usable:
+            reasons, _, sharpness = quality_gate([crops[index] for index in usable], relaxed=True)
+            for row, index in enumerate(usable):
+                scores[index] = 0.0 if reasons[row] else float(sharpness[row])
+        return scores
+
+    def _verify(self, frame, detections, boxes, quality, due, now):
+        embedded = self.embed(frame, [detections[index] for index in due])
+        self.embedded += len(due)
+
+        queries, fresh = [], []
+        for index, (embedding, meta) in zip(due, embedded):
+            identity = self.identities[detections[index]["track_id"]]
+            identity.verified_at = now
+            identity.verified_box = boxes[index]
+            identity.verified_quality = quality[index]
+            identity.verifications += 1
+            if embedding is not None:
+                identity.fuse(embedding, float(meta.get("quality_score", 1.0)))
+            fresh.append(embedding is not None)
+            # A rejected crop still matches on what the track has fused so far.
+            queries.append((identity.fused, meta))
+
+        for index, is_fresh, result in zip(due, fresh, self.match(queries)):
+            identity = self.identities[detections[index]["track_id"]]
+            label, confidence, details = result
+            details = dict(details, verifications=identity.verifications)
+            identity.result = (label, float(confidence), details)
+            # Only a new embedding is new evidence worth a vote.
+            candidate = is_fresh and label != "unknown" and float(confidence) >= self.min_confidence
+            identity.votes.append({"face_label": label, "confidence": float(confidence)} if candidate else None)
@@ -1,94 +1,576 @@
 import os
-import pickle
+import threading
+import time
 import numpy as np
-from face_recognition.facenet_encoder import get_face_embedding
+from face_recognition.facenet_encoder import (
+    embed_prepared,
+    get_face_embeddings,
+    prepare_detections,
+    warmup as warmup_encoder,
+)
+from face_recognition.inference_client import InferenceClient, InferenceServerError
+from face_recognition.runtime_config import embedding_slot
+from face_recognition.gallery_index import INDEX_KINDS, IVFIndex
+from face_recognition.embedding_store import (
+    INDEX_PATH,
+    PICKLE_PATH as EMBEDDINGS_PATH,
+    STORE_PATH,
+    identity_stats,
+    label_bounds,
+    load_gallery,
+    read_store,
+    thresholds_from_stats,
+)
 
-EMBEDDINGS_PATH = "face_recognition/facenet_embeddings.pkl"
+INDEX_BACKEND = os.environ.get("FACENET_INDEX", "exact").strip().lower()
+INDEX_SHORTLIST = max(1, int(os.environ.get("FACENET_INDEX_SHORTLIST", "64")))
+INDEX_NPROBE = os.environ.get("FACENET_IVF_NPROBE")
+GALLERY_DTYPE = os.environ.get("FACENET_GALLERY_DTYPE", "float32").strip().lower()
+RERANK_LABELS = max(1, int(os.environ.get("FACENET_RERANK_LABELS", "8")))
+GALLERY_DTYPES = ("float32", "float16", "int8")
+COARSE_CHUNK_ROWS = 16384
+RELOAD_CHECK_SECONDS = float(os.environ.get("FACENET_RELOAD_CHECK_SECONDS", "2"))
+CENTROID_PRUNING = os.environ.get("FACENET_CENTROID_PRUNE", "0").strip().lower() in {"1", "true", "yes"}
+# Above this share of surviving labels, pruning saves less than the bounds
+# cost and every label is scored in one matmul instead.
+PRUNE_MAX_KEEP = float(os.environ.get("FACENET_PRUNE_MAX_KEEP", "0.5"))
 THRESHOLD = float(os.environ.get("FACENET_MATCH_THRESHOLD", "0.62"))
+IDENTITY_THRESHOLDS = os.environ.get("FACENET_IDENTITY_THRESHOLDS", "1").strip().lower() not in {"0", "false", "no"}
 TOP_K_TEMPLATES = max(1, int(os.environ.get("FACENET_TOP_K", "3")))
 MIN_CANDIDATE_CONFIDENCE = float(os.environ.get("FACENET_MIN_CANDIDATE_CONF", "70"))
+DETAIL_TOP_N = max(1, int(os.environ.get("FACENET_DETAIL_TOP_N", "5")))
+# With a socket set, embeddings come from the host's inference_server.py
+# and this process never loads the models unless the server is down and
+# fallback is on.
+INFERENCE_SOCKET = os.environ.get("FACENET_INFERENCE_SOCKET", "").strip()
+INFERENCE_FALLBACK = os.environ.get("FACENET_INFERENCE_FALLBACK", "1").strip().lower() not in {"0", "false", "no"}
 
+# Similarity assigned to padding slots of the label grid; below any real cosine.
+_PAD_SIMILARITY = -2.0
+# Slack on centroid bounds so float rounding never prunes a real winner.
+_BOUND_EPSILON = 1e-5
+# Rows of unwanted labels scored anyway to keep a span of wanted ones contiguous.
+_SPAN_GAP_ROWS = 256
 
-def _l2_normalize(vec):
-    norm = np.linalg.norm(vec)
-    if norm <= 1e-12:
-        return vec
-    return vec / norm
+_RELOAD_LOCK = threading.Lock()
+_INFERENCE_CLIENT = InferenceClient(INFERENCE_SOCKET) if INFERENCE_SOCKET else None
+_INFERENCE_WARNED = False
+_STATS_LOCK = threading.Lock()
+MATCH_STATS = {"queries": 0, "labels_total": 0, "labels_pruned": 0}
 
 
-def _normalize_database(raw_database):
-    normalized = {}
-    for label, templates in raw_database.items():
-        cleaned = []
-        for emb in templates:
-            arr = np.asarray(emb, dtype=np.float32).reshape(-1)
-            if arr.size == 0:
-                continue
-            cleaned.append(_l2_normalize(arr))
-        if cleaned:
-            normalized[label] = cleaned
-    return normalized
+def _label_buckets(counts, starts, pad_row):
+    """Group labels into power-of-two template-count classes.
+
+    Returns ``(label_ids, grid)`` pairs; ``grid[j]`` lists the rows of label
+    ``label_ids[j]`` starting at ``starts``, padded with ``pad_row`` up to the
+    widest label in the class, so padding never exceeds twice a label's own
+    template count.
+    """
+    classes = np.ceil(np.log2(np.maximum(counts, 1))).astype(np.int64)
+    buckets = []
+    for cls in np.unique(classes):
+        label_ids = np.flatnonzero(classes == cls)
+        bucket_counts = counts[label_ids]
+        slots = np.arange(int(bucket_counts.max()), dtype=np.int64)
+        grid = np.where(
+            slots[None, :] < bucket_counts[:, None],
+            starts[label_ids, None] + slots[None, :],
+            pad_row,
+        )
+        buckets.append((label_ids, grid))
+    return buckets
+
+
+class Gallery:
+    """Normalized templates packed into one contiguous float32 matrix.
+
+    Rows of ``matrix`` are grouped by label: label ``i`` owns rows
+    ``offsets[i]:offsets[i + 1]``. ``buckets`` splits the labels by template
+    count into power-of-two width classes, each a ``(label_ids, grid)`` pair
+    whose grid is padded only to that class's widest label (pad slots point
+    at row ``len(matrix)``), so per-label top-k reductions stay vectorized
+    without one large identity widening every label. ``matrix`` is usually a
+    read-only memory map of the embedding store, shared by every worker.
+
+    A quantized gallery also holds ``codes`` (float16, or int8 with a
+    per-dimension ``code_scale``) for coarse scoring; ``matrix`` then only
+    serves the exact rerank.
+
+    ``centroids`` and the per-template ``spreads`` around them bound each
+    label's distance to a probe, which lets matching skip labels that
+    provably cannot win.
+
+    ``thresholds`` holds each label's acceptance threshold: the build-time
+    per-identity value capped by FACENET_MATCH_THRESHOLD.
+    """
+
+    def __init__(self, labels, counts, matrix, centroids=None, spreads=None, thresholds=None):
+        self.labels = list(labels)
+        self.counts = np.asarray(counts, dtype=np.int64).reshape(-1)
+        self.offsets = np.zeros(len(self.labels) + 1, dtype=np.int64)
+        np.cumsum(self.counts, out=self.offsets[1:])
+        self.matrix = matrix if len(self.labels) else np.zeros((0, 0), dtype=np.float32)
+
+        self.buckets = _label_buckets(self.counts, self.offsets[:-1], len(self.matrix))
+        self.top_k_counts = np.minimum(self.counts, TOP_K_TEMPLATES).astype(np.float32)
+        self.row_labels = np.repeat(np.arange(len(self.labels), dtype=np.int64), self.counts)
+        if centroids is None or spreads is None or len(spreads) != len(self.matrix):
+            centroids, spreads = label_bounds(self.counts, self.matrix)
+        self.centroids = centroids
+        self._init_spread_bounds(np.asarray(spreads, dtype=np.float32))
+        self.thresholds = np.full(len(self.labels), THRESHOLD, dtype=np.float32)
+        if IDENTITY_THRESHOLDS and len(self.labels):
+            if thresholds is None or len(thresholds) != len(self.labels):
+                thresholds = thresholds_from_stats(*identity_stats(self.counts, self.matrix, self.centroids))
+            np.minimum(self.thresholds, thresholds, out=self.thresholds)
+        self.max_threshold = float(self.thresholds.max()) if len(self.labels) else THRESHOLD
+        self.index = None
+        self.generation = 0
+        self.signature = None
+        self.dtype = "float32"
+        self.codes = None
+        self.code_scale = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _init_spread_bounds(self, spreads):
+        """Largest and smallest top-k template spreads per label, 0-padded."""
+        k = min(TOP_K_TEMPLATES, int(self.counts.max())) if len(self.labels) else 0
+        valid = np.arange(k)[None, :] < self.top_k_counts[:, None]
+        largest = np.full((len(self.labels), k), -np.inf, dtype=np.float32)
+        smallest = np.full((len(self.labels), k), np.inf, dtype=np.float32)
+        padded_spreads = np.concatenate([spreads, [np.nan]])
+        for label_ids, grid in self.buckets:
+            padded = padded_spreads[grid]
+            width = min(k, grid.shape[1])
+            largest[label_ids, :width] = -np.sort(-np.where(np.isnan(padded), -np.inf, padded), axis=1)[:, :width]
+            smallest[label_ids, :width] = np.sort(np.where(np.isnan(padded), np.inf, padded), axis=1)[:, :width]
+        self.spread_high = np.where(valid, largest, 0.0).astype(np.float32)
+        self.spread_low = np.where(valid, smallest, 0.0).astype(np.float32)
+        self.spread_valid = valid
+
+    def templates(self, label_index):
+        return self.matrix[self.offsets[label_index]:self.offsets[label_index + 1]]
+
+    def quantize(self, dtype):
+        if dtype not in GALLERY_DTYPES:
+            raise ValueError(f"Unsupported gallery dtype: {dtype}")
+        self.dtype = dtype
+        self.codes = None
+        self.code_scale = None
+        if dtype == "float16":
+            self.codes = np.asarray(self.matrix, dtype=np.float16)
+        elif dtype == "int8":
+            scale = np.abs(self.matrix).max(axis=0) / 127.0 if len(self.matrix) else np.ones(0)
+            scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+            self.codes = np.clip(np.rint(self.matrix / scale), -127, 127).astype(np.int8)
+            self.code_scale = scale
+
+    def resident_nbytes(self):
+        """Bytes of template data held privately by this process."""
+        total = 0 if isinstance(self.matrix, np.memmap) else self.matrix.nbytes
+        if self.codes is not None:
+            total += self.codes.nbytes
+        if self.code_scale is not None:
+            total += self.code_scale.nbytes
+        return total
+
+
+def _open_store():
+    """Memory-map the embedding store, or None when there is none.
+
+    Serving processes only read the store; the build writes it. A gallery
+    that exists only as a legacy pickle is loaded privately by the caller
+    until it is converted (``python embedding_store.py convert``).
+    """
+    if not os.path.exists(STORE_PATH):
+        if os.path.exists(EMBEDDINGS_PATH):
+            print(f"[WARNING] No embedding store at {STORE_PATH}; loading {EMBEDDINGS_PATH} in this process")
+        return None
+    return read_store(STORE_PATH)
+
+
+def _files_signature():
+    """Cheap identity of the on-disk gallery: inode, size and mtime per file.
+
+    The legacy pickle only counts while there is no store to read.
+    """
+    paths = [STORE_PATH] if os.path.exists(STORE_PATH) else [STORE_PATH, EMBEDDINGS_PATH]
+    if INDEX_BACKEND == "ivf":
+        paths.append(INDEX_PATH)
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
 
 
 def reload_embeddings():
-    global DATABASE
+    global DATABASE, GALLERY, _LAST_RELOAD_CHECK
+    # Taken before reading so a write that races the load triggers another.
+    signature = _files_signature()
     try:
-        with open(EMBEDDINGS_PATH, "rb") as f:
-            DATABASE = _normalize_database(pickle.load(f))
-    except FileNotFoundError:
-        DATABASE = {}
+        store = _open_store()
+    except (OSError, ValueError) as exc:
+        print(f"[WARNING] Embedding store unreadable ({exc}); loading {EMBEDDINGS_PATH}")
+        store = None
+
+    if store is not None:
+        gallery = Gallery(
+            store.labels,
+            store.counts,
+            store.matrix,
+            store.section("centroids"),
+            store.section("spreads"),
+            store.section("thresholds"),
+        )
+        gallery.generation = store.generation
+    else:
+        try:
+            gallery = Gallery(*load_gallery(EMBEDDINGS_PATH))
+        except FileNotFoundError:
+            gallery = Gallery([], [], np.zeros((0, 0), dtype=np.float32))
+
+    if GALLERY_DTYPE not in GALLERY_DTYPES:
+        print(f"[WARNING] Unknown FACENET_GALLERY_DTYPE={GALLERY_DTYPE!r}; keeping float32")
+    elif GALLERY_DTYPE != "float32" and len(gallery):
+        gallery.quantize(GALLERY_DTYPE)
+    gallery.index = _load_index(gallery)
+
+    gallery.signature = signature
+    DATABASE = {label: gallery.templates(i) for i, label in enumerate(gallery.labels)}
+    GALLERY = gallery
+    _LAST_RELOAD_CHECK = time.monotonic()
     return DATABASE
 
 
-DATABASE = reload_embeddings()
+def refresh_gallery():
+    """Pick up a gallery published by another process.
 
+    Called before matching. At most once per FACENET_RELOAD_CHECK_SECONDS it
+    stats the store; when the file was replaced, one thread reloads while
+    others keep matching against the gallery they already hold. The swap is
+    a single reference assignment, so the match path never takes a lock.
+    """
+    global _LAST_RELOAD_CHECK
+    now = time.monotonic()
+    if now - _LAST_RELOAD_CHECK < RELOAD_CHECK_SECONDS:
+        return GALLERY
+    _LAST_RELOAD_CHECK = now
+    if _files_signature() == GALLERY.signature:
+        return GALLERY
+    if not _RELOAD_LOCK.acquire(blocking=False):
+        return GALLERY
+    try:
+        if _files_signature() != GALLERY.signature:
+            reload_embeddings()
+    except Exception as exc:
+        print(f"[WARNING] Gallery reload failed ({exc}); keeping generation {GALLERY.generation}")
+    finally:
+        _RELOAD_LOCK.release()
+    return GALLERY
 
-def cosine_distance(a, b):
-    return 1.0 - float(np.dot(a, b))
 
+def gallery_generation():
+    return GALLERY.generation
 
-def _aggregate_label_distance(query_embedding, templates):
-    distances = [cosine_distance(query_embedding, emb) for emb in templates]
-    if not distances:
-        return 1.0
-    distances = sorted(distances)
-    top_k = distances[: min(TOP_K_TEMPLATES, len(distances))]
-    return float(np.mean(top_k))
 
+def warmup():
+    """Load the FaceNet models now rather than on the first recognition."""
+    if _INFERENCE_CLIENT is not None:
+        try:
+            _INFERENCE_CLIENT.stats()
+            return
+        except (OSError, InferenceServerError) as exc:
+            print(f"[WARNING] Inference server at {INFERENCE_SOCKET} unreachable ({exc})")
+            if not INFERENCE_FALLBACK:
+                return
+    warmup_encoder()
 
-def recognize_face(face_img, return_details=False):
-    embedding, meta = get_face_embedding(
-        face_img,
-        return_meta=True,
-        assume_cropped=True,
-        relaxed_quality=True,
+
+def _with_inference_server(remote, local, unavailable):
+    """``remote(client)`` on the inference server when configured, else ``local()``.
+
+    ``unavailable()`` is the answer when the server fails and fallback is off.
+    """
+    global _INFERENCE_WARNED
+    if _INFERENCE_CLIENT is not None:
+        try:
+            return remote(_INFERENCE_CLIENT)
+        except (OSError, InferenceServerError) as exc:
+            if not _INFERENCE_WARNED:
+                _INFERENCE_WARNED = True
+                fallback = "embedding locally" if INFERENCE_FALLBACK else "rejecting faces"
+                print(f"[WARNING] Inference server failed ({exc}); {fallback}")
+            if not INFERENCE_FALLBACK:
+                return unavailable()
+    with embedding_slot():
+        return local()
+
+
+def _embed_crops(face_imgs):
+    """Embed tight crops as they are, with no alignment."""
+    return _with_inference_server(
+        lambda client: client.embed(face_imgs, assume_cropped=True, relaxed_quality=True),
+        lambda: get_face_embeddings(face_imgs, assume_cropped=True, relaxed_quality=True),
+        lambda: [(None, {"reason": "inference_server_error"}) for _ in face_imgs],
     )
 
-    if embedding is None or not DATABASE:
-        unknown = ("unknown", 0.0, {"reason": meta.get("reason", "no_embedding")}) if return_details else ("unknown", 0.0)
-        return unknown
 
-    embedding = _l2_normalize(np.asarray(embedding, dtype=np.float32).reshape(-1))
+def _attach_embeddings(prepared, embeddings):
+    rows = iter(embeddings)
+    return [(next(rows), meta) if face is not None else (None, meta) for face, meta in prepared]
+
+
+def embed_detections(frame, detections):
+    """Crop and align on the detector's own landmarks, then embed.
+
+    One ``(embedding, meta)`` per detection, ``embedding`` None when the
+    face was rejected.
+    """
+    prepared = prepare_detections(frame, detections, relaxed_quality=True)
+    faces = [face for face, _ in prepared if face is not None]
+    if not faces:
+        return [(None, meta) for _, meta in prepared]
+    return _with_inference_server(
+        lambda client: _attach_embeddings(prepared, client.embed_aligned(faces)),
+        lambda: embed_prepared(prepared),
+        lambda: [(None, meta if face is None else {"reason": "inference_server_error"}) for face, meta in prepared],
+    )
+
+
+def _load_index(gallery):
+    """Load the offline-built ANN index, or None for exhaustive matching."""
+    if INDEX_BACKEND not in INDEX_KINDS:
+        print(f"[WARNING] Unknown FACENET_INDEX={INDEX_BACKEND!r}; using exact matching")
+        return None
+    if INDEX_BACKEND == "exact" or not len(gallery):
+        return None
+    try:
+        nprobe = int(INDEX_NPROBE) if INDEX_NPROBE else None
+        return IVFIndex.load(INDEX_PATH, gallery.matrix, nprobe=nprobe)
+    except (OSError, ValueError) as exc:
+        print(f"[WARNING] Gallery index unavailable ({exc}); using exact matching")
+        return None
+
+
+_LAST_RELOAD_CHECK = 0.0
+DATABASE = reload_embeddings()
+
+
+def _grid_top_k_mean(sims, buckets, top_k_counts):
+    pad = np.full((len(sims), 1), _PAD_SIMILARITY, dtype=np.float32)
+    padded = np.concatenate([sims, pad], axis=1)
+
+    k = TOP_K_TEMPLATES
+    top_sum = np.zeros((len(sims), len(top_k_counts)), dtype=np.float32)
+    for label_ids, grid in buckets:
+        grouped = padded[:, grid]
+        if grouped.shape[2] > k:
+            grouped = -np.partition(-grouped, k - 1, axis=2)[:, :, :k]
+        top_sum[:, label_ids] = np.where(grouped > _PAD_SIMILARITY, grouped, 0.0).sum(axis=2)
+    return 1.0 - top_sum / top_k_counts
+
+
+def _label_distances(gallery, queries, label_ids=None):
+    """Return the (queries, labels) matrix of mean top-k template distances.
+
+    Each entry is the mean cosine distance to the label's ``TOP_K_TEMPLATES``
+    closest templates: one matmul against the gallery rows, then a segmented
+    top-k mean per count bucket. With ascending ``label_ids`` only those
+    labels are scored, columns in the same order. Their rows are matched in
+    place, one contiguous slice of ``matrix`` per run of nearby labels, so
+    the gallery is never gathered into a copy.
+    """
+    if label_ids is None:
+        sims = queries @ gallery.matrix.T
+        return _grid_top_k_mean(sims, gallery.buckets, gallery.top_k_counts)
 
-    best_match = None
-    best_score = 1.0
-    scores = {}
+    label_ids = np.asarray(label_ids, dtype=np.int64)
+    row_starts = gallery.offsets[label_ids]
+    row_stops = gallery.offsets[label_ids + 1]
+    breaks = np.flatnonzero(row_starts[1:] - row_stops[:-1] > _SPAN_GAP_ROWS) + 1
+    span_starts = row_starts[np.concatenate([[0], breaks])]
+    span_stops = row_stops[np.concatenate([breaks - 1, [len(label_ids) - 1]])]
+    span_bases = np.zeros(len(span_starts) + 1, dtype=np.int64)
+    np.cumsum(span_stops - span_starts, out=span_bases[1:])
 
-    for label, embeddings in DATABASE.items():
-        score = _aggregate_label_distance(embedding, embeddings)
-        scores[label] = score
-        if score < best_score:
-            best_score = score
-            best_match = label
+    sims = np.empty((len(queries), int(span_bases[-1])), dtype=np.float32)
+    for start, stop, base in zip(span_starts, span_stops, span_bases):
+        sims[:, base:base + stop - start] = queries @ gallery.matrix[start:stop].T
+    span_of_label = np.repeat(np.arange(len(span_starts)), np.diff(np.concatenate([[0], breaks, [len(label_ids)]])))
+    starts = span_bases[span_of_label] + row_starts - span_starts[span_of_label]
+    buckets = _label_buckets(gallery.counts[label_ids], starts, sims.shape[1])
+    return _grid_top_k_mean(sims, buckets, gallery.top_k_counts[label_ids])
 
-    if best_score < THRESHOLD:
+
+def _coarse_label_distances(gallery, queries):
+    """Approximate label distances scored on the quantized codes."""
+    if gallery.code_scale is not None:
+        queries = queries * gallery.code_scale
+    sims = np.empty((len(queries), len(gallery.codes)), dtype=np.float32)
+    for start in range(0, len(gallery.codes), COARSE_CHUNK_ROWS):
+        chunk = gallery.codes[start:start + COARSE_CHUNK_ROWS].astype(np.float32)
+        sims[:, start:start + len(chunk)] = queries @ chunk.T
+    return _grid_top_k_mean(sims, gallery.buckets, gallery.top_k_counts)
+
+
+def _label_distance_bounds(gallery, queries):
+    """Lower and upper bounds on every (query, label) aggregated distance.
+
+    For unit vectors ``d(q, t) = |q - t|^2 / 2`` and the triangle inequality
+    through the label centroid gives ``|q - c| - s_t <= |q - t| <= |q - c| + s_t``
+    where ``s_t`` is template ``t``'s spread. The mean of the k closest
+    templates is therefore at least the mean bound over the k widest spreads
+    and at most the mean bound over the k tightest.
+    """
+    to_centroid = np.sqrt(np.maximum(0.0, 2.0 - 2.0 * (queries @ gallery.centroids.T)))[:, :, None]
+    lower = np.maximum(0.0, to_centroid - gallery.spread_high) ** 2 / 2.0
+    upper = (to_centroid + gallery.spread_low) ** 2 / 2.0
+    valid = gallery.spread_valid
+    lower = np.where(valid, lower, 0.0).sum(axis=2) / gallery.top_k_counts - _BOUND_EPSILON
+    upper = np.where(valid, upper, 0.0).sum(axis=2) / gallery.top_k_counts + _BOUND_EPSILON
+    return lower, upper
+
+
+def _prune_labels(gallery, queries, return_details, candidates=None):
+    """Mask of labels that may still change the result for each query.
+
+    Without details only the best label matters, and only if it beats its
+    own threshold, so labels whose lower bound exceeds the smallest upper
+    bound or reaches the largest threshold in the gallery are dropped (if
+    such a label were the best, no label could be accepted). With details the top DETAIL_TOP_N must
+    stay exact, so the cut is the DETAIL_TOP_N-th smallest upper bound.
+    Either way the outcome is identical to scoring every (candidate) label.
+    """
+    lower, upper = _label_distance_bounds(gallery, queries)
+    if candidates is not None:
+        lower = np.where(candidates, lower, np.inf)
+        upper = np.where(candidates, upper, np.inf)
+    rank = min(DETAIL_TOP_N if return_details else 1, len(gallery)) - 1
+    cutoff = np.partition(upper, rank, axis=1)[:, rank:rank + 1]
+
+    # Exactly scoring the most promising labels first usually gives a far
+    # tighter cut than the upper bounds.
+    seeds = np.argpartition(lower, rank, axis=1)[:, :rank + 1]
+    seed_ids = np.unique(seeds)
+    seed_scores = _label_distances(gallery, queries, seed_ids)
+    seeded = np.take_along_axis(seed_scores, np.searchsorted(seed_ids, seeds), axis=1)
+    seeded = np.where(np.isfinite(np.take_along_axis(lower, seeds, axis=1)), seeded, np.inf)
+    cutoff = np.minimum(cutoff, seeded.max(axis=1, keepdims=True) + _BOUND_EPSILON)
+
+    keep = lower <= cutoff
+    if not return_details:
+        keep &= lower < gallery.max_threshold
+
+    return keep
+
+
+def _record_pruning(queries, considered, kept):
+    """Count labels dropped by the centroid bounds, not by the shortlist."""
+    with _STATS_LOCK:
+        MATCH_STATS["queries"] += queries
+        MATCH_STATS["labels_total"] += considered
+        MATCH_STATS["labels_pruned"] += considered - kept
+
+
+def match_stats():
+    with _STATS_LOCK:
+        stats = dict(MATCH_STATS)
+    stats["prune_rate"] = stats["labels_pruned"] / stats["labels_total"] if stats["labels_total"] else 0.0
+    return stats
+
+
+def _candidate_labels(gallery, queries, return_details=False):
+    """Per-query mask of labels worth an exact score, or None for all."""
+    candidates = None
+    if gallery.index is not None:
+        shortlist = gallery.index.search(queries, INDEX_SHORTLIST)
+        candidates = np.zeros((len(queries), len(gallery)), dtype=bool)
+        for qi, rows in enumerate(shortlist):
+            candidates[qi, gallery.row_labels[rows[rows >= 0]]] = True
+    elif gallery.codes is not None and len(gallery) > RERANK_LABELS:
+        coarse = _coarse_label_distances(gallery, queries)
+        top = np.argpartition(coarse, RERANK_LABELS - 1, axis=1)[:, :RERANK_LABELS]
+        candidates = np.zeros((len(queries), len(gallery)), dtype=bool)
+        np.put_along_axis(candidates, top, True, axis=1)
+
+    if CENTROID_PRUNING:
+        keep = _prune_labels(gallery, queries, return_details, candidates)
+        if candidates is not None:
+            _record_pruning(len(queries), int(np.count_nonzero(candidates)), int(np.count_nonzero(keep)))
+            return candidates & keep
+        if np.count_nonzero(keep.any(axis=0)) <= PRUNE_MAX_KEEP * len(gallery):
+            _record_pruning(len(queries), keep.size, int(np.count_nonzero(keep)))
+            return keep
+        _record_pruning(len(queries), keep.size, keep.size)
+    return candidates
+
+
+def _match_distances(gallery, queries, return_details=False):
+    """Label distances for each query; labels never scored stay at inf.
+
+    The index shortlist or the coarse quantized scores pick candidate labels,
+    centroid bounds drop labels that cannot affect the result, and whatever
+    survives is reranked exactly over all of its full-precision templates.
+    """
+    candidates = _candidate_labels(gallery, queries, return_details)
+    if candidates is None:
+        return _label_distances(gallery, queries)
+
+    distances = np.full((len(queries), len(gallery)), np.inf, dtype=np.float32)
+    label_ids = np.flatnonzero(candidates.any(axis=0))
+    if len(label_ids):
+        scored = _label_distances(gallery, queries, label_ids)
+        distances[:, label_ids] = np.where(candidates[:, label_ids], scored, np.inf)
+    return distances
+
+
+def _top_candidates(gallery, distances, limit):
+    order = np.argsort(distances, kind="stable")[:limit]
+    return {gallery.labels[i]: float(distances[i]) for i in order if np.isfinite(distances[i])}
+
+
+def _decide(gallery, distances):
+    """Best label per query and whether it clears that label's threshold."""
+    best = np.argmin(distances, axis=1)
+    scores = distances[np.arange(len(best)), best]
+    thresholds = gallery.thresholds[best]
+    return best, scores, thresholds, scores < thresholds
+
+
+def _match_result(gallery, distances, meta, return_details, decision):
+    best_index, best_score, threshold, accepted = decision
+    best_score = float(best_score)
+    if not np.isfinite(best_score):
+        # No label was scored, so there is no candidate to report.
+        if return_details:
+            return "unknown", 0.0, {
+                "reason": "no_candidate",
+                "best_candidate": None,
+                "best_distance": None,
+                "best_candidate_confidence": 0.0,
+                "threshold": None,
+                "quality": meta,
+            }
+        return "unknown", 0.0
+
+    best_match = gallery.labels[best_index]
+    threshold = float(threshold)
+
+    if accepted:
         confidence = max(0.0, min(100.0, (1.0 - best_score) * 100.0))
         if return_details:
             return best_match, confidence, {
                 "distance": best_score,
-                "threshold": THRESHOLD,
+                "threshold": threshold,
                 "quality": meta,
-                "scores": scores,
+                "scores": _top_candidates(gallery, distances, DETAIL_TOP_N),
             }
         return best_match, confidence
 
@@ -100,7 +582,59 @@ def recognize_face(face_img, return_details=False):
             "best_candidate": best_match,
             "best_distance": best_score,
             "best_candidate_confidence": best_conf,
-            "threshold": THRESHOLD,
+            "threshold": threshold,
             "quality": meta,
         }
     return "unknown", 0.0
+
+
+def recognize_faces(face_imgs, return_details=False):
+    """Recognize a batch of face crops with one forward pass and one matmul.
+
+    Returns one result per crop, shaped exactly like ``recognize_face``.
+    """
+    return recognize_embeddings(_embed_crops(face_imgs), return_details)
+
+
+def recognize_detections(frame, detections, return_details=False):
+    """Recognize every face a detector found in ``frame``.
+
+    ``detections`` come from ``FaceDetector.detect``; faces are cropped with
+    the enrolment margin and aligned on the detector's landmarks, so they
+    match the gallery templates better than tight unaligned crops. Returns
+    one result per detection, shaped like ``recognize_face``.
+    """
+    return recognize_embeddings(embed_detections(frame, detections), return_details)
+
+
+def recognize_embeddings(embedded, return_details=False):
+    """Match ``(embedding, meta)`` pairs against the gallery.
+
+    For callers that already hold embeddings, such as a track's fused
+    embedding. Results are shaped like ``recognize_face``.
+    """
+    gallery = refresh_gallery()
+    results = []
+    accepted = []
+    for embedding, meta in embedded:
+        if embedding is None or not len(gallery):
+            unknown = ("unknown", 0.0, {"reason": meta.get("reason", "no_embedding")}) if return_details else ("unknown", 0.0)
+            results.append(unknown)
+            continue
+        accepted.append(len(results))
+        results.append(None)
+
+    if not accepted:
+        return results
+
+    queries = np.vstack([np.asarray(embedded[index][0], dtype=np.float32).reshape(1, -1) for index in accepted])
+    queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    distances = _match_distances(gallery, queries, return_details)
+    decisions = zip(*_decide(gallery, distances))
+    for row, (index, decision) in enumerate(zip(accepted, decisions)):
+        results[index] = _match_result(gallery, distances[row], embedded[index][1], return_details, decision)
+    return results
+
+
+def recognize_face(face_img, return_details=False):
+    return recognize_faces([face_img], return_details=return_details)[0]
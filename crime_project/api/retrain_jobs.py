@@ -0,0 +1,244 @@
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from crime_database.models import RetrainJob
+from .facenet import reload_embeddings
+
+FACE_RECOGNITION_DIR = Path(settings.BASE_DIR) / "face_recognition"
+EMBEDDING_SCRIPT = FACE_RECOGNITION_DIR / "build_embeddings.py"
+POLL_SECONDS = float(os.environ.get("RETRAIN_POLL_SECONDS", "3"))
+HEARTBEAT_SECONDS = float(os.environ.get("RETRAIN_HEARTBEAT_SECONDS", "10"))
+# A running job whose heartbeat is older than this belongs to a process
+# that died.
+STALE_SECONDS = float(os.environ.get("RETRAIN_STALE_SECONDS", "60"))
+OUTPUT_TAIL_LINES = 20
+
+_PROGRESS_RE = re.compile(r"^\[PROGRESS\] (\d+)/(\d+)")
+_ENROLLED_RE = re.compile(r"^\[ENROLLED\] (.+) (\d+)$")
+_WORKER = None
+_WORKER_LOCK = threading.Lock()
+
+
+def serialize_job(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "face_label": job.face_label,
+        "previous_label": job.previous_label,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "coalesced_into": job.coalesced_into_id,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def enqueue_retrain(kind=RetrainJob.KIND_FULL, face_label="", previous_label=""):
+    """Queue a gallery update and make sure this process has a worker for it."""
+    job = RetrainJob.objects.create(
+        kind=kind,
+        face_label=face_label or "",
+        previous_label=previous_label if previous_label and previous_label != face_label else "",
+    )
+    _ensure_worker()
+    return job
+
+
+def _ensure_worker():
+    global _WORKER
+    with _WORKER_LOCK:
+        if _WORKER is None:
+            _WORKER = threading.Thread(target=_worker_loop, name="retrain-worker", daemon=True)
+            _WORKER.start()
+
+
+def _fail_stale_jobs():
+    cutoff = timezone.now() - timedelta(seconds=STALE_SECONDS)
+    stale = Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    RetrainJob.objects.filter(stale, status=RetrainJob.STATUS_RUNNING).update(
+        status=RetrainJob.STATUS_FAILED,
+        message="Worker stopped before the job finished",
+        finished_at=timezone.now(),
+    )
+
+
+def _claim_batch():
+    """Take every queued job at once, unless a run is already in progress.
+
+    Returns the claimed jobs oldest first, or None when there is nothing to
+    do right now.
+    """
+    _fail_stale_jobs()
+    with transaction.atomic():
+        if RetrainJob.objects.filter(status=RetrainJob.STATUS_RUNNING).exists():
+            return None
+        jobs = list(RetrainJob.objects.filter(status=RetrainJob.STATUS_QUEUED).order_by("id"))
+        if not jobs:
+            return None
+        started = timezone.now()
+        claimed = RetrainJob.objects.filter(
+            id__in=[job.id for job in jobs], status=RetrainJob.STATUS_QUEUED
+        ).update(status=RetrainJob.STATUS_RUNNING, started_at=started, heartbeat_at=started)
+        if claimed != len(jobs):
+            transaction.set_rollback(True)
+            return None
+        leader = jobs[0]
+        RetrainJob.objects.filter(id__in=[job.id for job in jobs[1:]]).update(coalesced_into=leader)
+    return jobs
+
+
+def _worker_loop():
+    global _WORKER
+    try:
+        while True:
+            jobs = _claim_batch()
+            if jobs is not None:
+                _run_batch(jobs)
+                continue
+            with _WORKER_LOCK:
+                if not RetrainJob.objects.filter(status=RetrainJob.STATUS_QUEUED).exists():
+                    _WORKER = None
+                    return
+            # Another process is running a batch; ours go in the next one.
+            time.sleep(POLL_SECONDS)
+    except Exception as exc:
+        print(f"[WARNING] Retrain worker stopped ({exc})")
+        with _WORKER_LOCK:
+            _WORKER = None
+    finally:
+        connection.close()
+
+
+def _finish(job_ids, succeeded, message):
+    RetrainJob.objects.filter(id__in=job_ids).update(
+        status=RetrainJob.STATUS_SUCCEEDED if succeeded else RetrainJob.STATUS_FAILED,
+        progress=100 if succeeded else 0,
+        message=message,
+        finished_at=timezone.now(),
+    )
+
+
+def _run_batch(jobs):
+    """One gallery update for a whole batch of queued jobs.
+
+    Any full rebuild in the batch covers everything else. Otherwise renames
+    are applied in request order and each affected label is re-enrolled
+    once, however many times it was queued.
+    """
+    job_ids = [job.id for job in jobs]
+    try:
+        with _heartbeat(job_ids):
+            if any(job.kind == RetrainJob.KIND_FULL for job in jobs):
+                succeeded, message = _rebuild_embeddings(job_ids)
+            else:
+                succeeded, message = _enroll_labels(jobs)
+        if len(jobs) > 1:
+            message = f"{message} ({len(jobs)} requests merged)"
+    except Exception as exc:
+        succeeded, message = False, str(exc) or "Gallery update failed"
+    _finish(job_ids, succeeded, message)
+
+
+@contextmanager
+def _heartbeat(job_ids):
+    """Refresh the jobs' heartbeat every HEARTBEAT_SECONDS while they run."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_SECONDS):
+                RetrainJob.objects.filter(id__in=job_ids).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name="retrain-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _run_embedding_script(job_ids, arguments=()):
+    """Run build_embeddings.py in its own process, reporting its progress.
+
+    Model loading and embedding stay out of the web worker. Returns the
+    exit code and the output lines.
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-u", EMBEDDING_SCRIPT.name, *arguments],
+        cwd=str(FACE_RECOGNITION_DIR),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    lines = []
+    for line in process.stdout:
+        line = line.rstrip()
+        lines.append(line)
+        progress = _PROGRESS_RE.match(line)
+        if progress:
+            done, total = int(progress.group(1)), max(1, int(progress.group(2)))
+            # Keep the last percent for writing the gallery.
+            RetrainJob.objects.filter(id__in=job_ids).update(progress=min(99, done * 100 // total))
+    return process.wait(), lines
+
+
+def _failure_message(lines, default):
+    return "\n".join(lines[-OUTPUT_TAIL_LINES:]) or default
+
+
+def _rebuild_embeddings(job_ids):
+    if not EMBEDDING_SCRIPT.exists():
+        return False, "Embedding script not found"
+
+    returncode, lines = _run_embedding_script(job_ids)
+    if returncode != 0:
+        return False, _failure_message(lines, "Embedding rebuild failed")
+
+    reload_embeddings()
+    return True, "Face dataset re-trained successfully"
+
+
+def _enroll_labels(jobs):
+    if not EMBEDDING_SCRIPT.exists():
+        return False, "Embedding script not found"
+
+    arguments = []
+    labels = []
+    for job in jobs:
+        if job.previous_label:
+            arguments += ["--rename", job.previous_label, job.face_label]
+        if job.face_label not in labels:
+            labels.append(job.face_label)
+    arguments += ["--enroll", *labels]
+
+    returncode, lines = _run_embedding_script([job.id for job in jobs], arguments)
+    if returncode != 0:
+        return False, _failure_message(lines, "Enrollment failed")
+
+    enrolled = {label: 0 for label in labels}
+    for line in lines:
+        match = _ENROLLED_RE.match(line)
+        if match:
+            enrolled[match.group(1)] = int(match.group(2))
+    reload_embeddings()
+    added = [f"{label} ({count} templates)" for label, count in enrolled.items() if count]
+    missing = [label for label, count in enrolled.items() if not count]
+    message = f"Enrolled {', '.join(added)}" if added else "Gallery updated"
+    if missing:
+        message = f"{message}; no usable face for {', '.join(missing)}"
+    return True, message
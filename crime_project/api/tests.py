@@ -1,3 +1,116 @@
-from django.test import TestCase
+from unittest import mock
+import cv2
+import numpy as np
+from django.test import SimpleTestCase
+from face_recognition.compare_embedding_backends import DEFAULT_MIN_COSINE
+from face_recognition.facenet_encoder import _quality_metrics, face_batch, load_embedder, quality_gate
+from . import facenet
 
-# Create your tests here.
+
+def _sharp_face(size):
+    """An evenly lit crop ``size`` pixels wide with face-like detail, like a distant face.
+
+    Sharp enough for the relaxed full check at its own size, but not once
+    it is enlarged to GATE_SIZE.
+    """
+    rng = np.random.default_rng(0)
+    texture = cv2.GaussianBlur(rng.uniform(95, 165, (int(size * 1.2), size)).astype(np.uint8), (0, 0), 1.0)
+    return cv2.cvtColor(texture, cv2.COLOR_GRAY2BGR)
+
+
+class QualityGateTests(SimpleTestCase):
+    def test_small_sharp_crops_pass_the_gate(self):
+        for size in (40, 56, 80):
+            crop = _sharp_face(size)
+            with self.subTest(size=size):
+                self.assertTrue(_quality_metrics(crop, relaxed=True)[0])
+                reasons, _, _ = quality_gate([crop], relaxed=True)
+                self.assertIsNone(reasons[0])
+
+    def test_blurred_crop_is_rejected(self):
+        crop = cv2.GaussianBlur(_sharp_face(160), (0, 0), 6.0)
+        reasons, _, _ = quality_gate([crop], relaxed=True)
+        self.assertEqual(reasons[0], "blurry")
+
+
+def _clustered_gallery(labels=300, templates=4, dim=128, spread=0.25, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((labels, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    matrix = np.repeat(centers, templates, axis=0)
+    matrix += spread / np.sqrt(dim) * rng.standard_normal(matrix.shape).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return facenet.Gallery([f"person_{i}" for i in range(labels)], [templates] * labels, matrix), rng
+
+
+class CentroidPruningTests(SimpleTestCase):
+    def assertSameResult(self, pruned, exhaustive):
+        if isinstance(exhaustive, dict):
+            self.assertEqual(pruned.keys(), exhaustive.keys())
+            for key in exhaustive:
+                self.assertSameResult(pruned[key], exhaustive[key])
+        elif isinstance(exhaustive, (tuple, list)):
+            self.assertEqual(len(pruned), len(exhaustive))
+            for got, want in zip(pruned, exhaustive):
+                self.assertSameResult(got, want)
+        elif isinstance(exhaustive, float):
+            self.assertAlmostEqual(pruned, exhaustive, places=4)
+        else:
+            self.assertEqual(pruned, exhaustive)
+
+    def test_pruned_matches_exhaustive(self):
+        gallery, rng = _clustered_gallery()
+        enrolled = gallery.matrix[rng.choice(len(gallery.matrix), 12, replace=False)]
+        strangers = rng.standard_normal((12, gallery.matrix.shape[1])).astype(np.float32)
+        queries = np.vstack([enrolled + 0.01 * rng.standard_normal(enrolled.shape), strangers])
+        embedded = [(query, {}) for query in queries]
+
+        for return_details in (False, True):
+            with self.subTest(return_details=return_details), mock.patch.object(
+                facenet, "refresh_gallery", return_value=gallery
+            ), mock.patch.object(facenet, "PRUNE_MAX_KEEP", 1.0):
+                with mock.patch.object(facenet, "CENTROID_PRUNING", False):
+                    exhaustive = facenet.recognize_embeddings(embedded, return_details)
+                pruned_before = facenet.match_stats()["labels_pruned"]
+                with mock.patch.object(facenet, "CENTROID_PRUNING", True):
+                    pruned = facenet.recognize_embeddings(embedded, return_details)
+                self.assertGreater(facenet.match_stats()["labels_pruned"], pruned_before)
+                self.assertSameResult(pruned, exhaustive)
+
+
+class MatchResultTests(SimpleTestCase):
+    def test_unscored_query_has_no_candidate(self):
+        gallery, _ = _clustered_gallery(labels=3)
+        distances = np.full((1, len(gallery)), np.inf, dtype=np.float32)
+        decision = next(zip(*facenet._decide(gallery, distances)))
+        label, confidence, details = facenet._match_result(gallery, distances[0], {}, True, decision)
+        self.assertEqual((label, confidence), ("unknown", 0.0))
+        self.assertEqual(details["reason"], "no_candidate")
+        self.assertIsNone(details["best_candidate"])
+        self.assertEqual(facenet._match_result(gallery, distances[0], {}, False, decision), ("unknown", 0.0))
+
+
+def _unit_embeddings(embedder, batch):
+    embeddings = np.asarray(embedder.embeddings(batch), dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+class EmbeddingBackendTests(SimpleTestCase):
+    def test_exported_backends_match_keras(self):
+        try:
+            reference = load_embedder("keras", budgeted=False)
+        except ImportError as exc:
+            self.skipTest(f"keras_facenet is not installed: {exc}")
+        batch = face_batch([_sharp_face(160)])
+        expected = _unit_embeddings(reference, batch)
+
+        # onnx-int8 is a different (quantized) model; quantize_facenet.py
+        # reports its agreement instead.
+        for backend in ("onnx", "opencv"):
+            with self.subTest(backend=backend):
+                try:
+                    embedder = load_embedder(backend, budgeted=False)
+                except (ImportError, FileNotFoundError) as exc:
+                    self.skipTest(f"{backend} backend unavailable: {exc}")
+                cosine = float(np.sum(expected * _unit_embeddings(embedder, batch)))
+                self.assertGreaterEqual(cosine, DEFAULT_MIN_COSINE)
@@ -35,6 +35,7 @@ urlpatterns = [
     path("admin/evidences/", auth_views.admin_evidences),
     path("admin/evidences/<int:evidence_id>/", auth_views.admin_evidence_detail),
     path("admin/retrain/", auth_views.admin_retrain_embeddings),
+    path("admin/retrain/<int:job_id>/", auth_views.admin_retrain_job),
 
     # =======================
     # LIVE WEBCAM STREAM
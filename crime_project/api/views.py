@@ -11,8 +11,17 @@ import json
 import base64
 import cv2
 import os
+from .detectors import detector_status, get_face_detector, haar_cascade
 from .live_scan_engine import process_live_scan_payload, get_live_scan_state
-from .facenet import recognize_face
+from .facenet import gallery_generation, recognize_detections, match_stats
+from face_recognition.facenet_encoder import (
+    detection_corners,
+    detection_from_corners,
+    quality_stats,
+    read_for_detection,
+)
+from face_recognition.face_detector import detect_haar
+from face_recognition.runtime_config import runtime_status
 
 # =====================================================
 # BASIC TEST & DASHBOARD STATUS
@@ -101,6 +110,11 @@ def system_health(request):
         "health_percent": round(score),
         "cpu_percent": cpu_percent,
         "db_ok": db_ok,
+        "matcher": match_stats(),
+        "quality_gate": quality_stats(),
+        "runtime": runtime_status(),
+        "detectors": detector_status(),
+        "gallery_generation": gallery_generation(),
     })
 
 
@@ -241,11 +255,9 @@ def stop_webcam_api(request):
     return JsonResponse({"success": True})
 
 
-def _detect_faces_haar(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-    faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40))
-    return [(int(x), int(y), int(x + w), int(y + h)) for (x, y, w, h) in faces]
+def _detect_faces_haar(frame, scale=1.0):
+    with haar_cascade() as cascade:
+        return detect_haar(cascade, frame, scale)
 
 
 def _encode_frame_as_data_url(frame):
@@ -280,20 +292,25 @@ def _draw_detection_boxes(frame, detection_boxes):
     return annotated
 
 
+def _detect_frame_faces(frame, detector, scale=1.0):
+    faces = detector.detect(frame, scale=scale) if detector is not None else []
+    if not faces:
+        faces = [detection_from_corners(*box) for box in _detect_faces_haar(frame, scale=scale)]
+    return faces
+
+
 def _collect_matches_from_frame(frame, detector):
-    boxes = detector.detect_faces(frame) if detector is not None else []
-    if not boxes:
-        boxes = _detect_faces_haar(frame)
+    return _match_frame_faces(frame, _detect_frame_faces(frame, detector))
 
+
+def _match_frame_faces(frame, faces):
     candidate_threshold = float(os.environ.get("FRAME_MATCH_CANDIDATE_CONFIDENCE", "70"))
     detections = {}
     detection_boxes = []
-    for (x1, y1, x2, y2) in boxes:
-        face = frame[y1:y2, x1:x2]
-        if face is None or face.size == 0:
-            continue
+    face_boxes = [detection_corners(face) for face in faces]
 
-        face_label, confidence = recognize_face(face)
+    recognized = recognize_detections(frame, faces)
+    for (x1, y1, x2, y2), (face_label, confidence) in zip(face_boxes, recognized):
         confidence = float(confidence)
         is_match = face_label != "unknown" and confidence >= candidate_threshold
 
@@ -317,11 +334,19 @@ def _collect_matches_from_frame(frame, detector):
 
 
 def _collect_matches_from_image(file_path, detector):
-    frame = cv2.imread(file_path)
-    if frame is None:
+    # Detect on a reduced decode; the full-resolution image is only decoded
+    # when there are faces to crop from it.
+    small, scale = read_for_detection(file_path)
+    if small is None:
         return {}, [], None
+    faces = _detect_frame_faces(small, detector, scale=scale)
+    if not faces:
+        return {}, [], _encode_frame_as_data_url(small)
 
-    detections, detection_boxes = _collect_matches_from_frame(frame, detector)
+    frame = small if scale == 1.0 else cv2.imread(file_path)
+    if frame is None:
+        return {}, [], None
+    detections, detection_boxes = _match_frame_faces(frame, faces)
     preview_image = _encode_frame_as_data_url(_draw_detection_boxes(frame, detection_boxes))
     return detections, detection_boxes, preview_image
 
@@ -406,9 +431,7 @@ def upload_video_api(request):
         saved_name = fs.save(media.name, media)
         saved_path = fs.path(saved_name)
 
-        from .webcam_service import FaceDetector
-
-        detector = FaceDetector()
+        detector = get_face_detector()
         extension = saved_name.rsplit(".", 1)[-1].lower() if "." in saved_name else ""
         image_exts = {"jpg", "jpeg", "png", "bmp", "webp"}
         video_exts = {"mp4", "avi", "mov", "mkv", "webm", "m4v"}
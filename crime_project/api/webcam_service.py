@@ -1,30 +1,18 @@
 import cv2
 import threading
 import os
-from pathlib import Path
-from collections import deque
-from .facenet import recognize_face
+from .face_tracking import REDETECT_MOTION, FaceTracker, TrackIdentities
+from .facenet import embed_detections, recognize_embeddings
 from .live_scan_engine import process_live_scan_payload
+from .detectors import get_face_detector
+from face_recognition.facenet_encoder import detection_corners
 import base64
 
-try:
-    from mtcnn.mtcnn import MTCNN
-except Exception:
-    MTCNN = None
-
-try:
-    from ultralytics import YOLO
-except Exception:
-    YOLO = None
-
 camera = None
 camera_active = False
 lock = threading.Lock()
-detector = None
 ACTIVE_INVESTIGATOR_ID = None
 
-FACE_DETECTION_CONFIDENCE = 0.35
-MIN_BOX_SIZE = 40
 FRAME_MATCH_CANDIDATE_CONFIDENCE = float(os.environ.get("FRAME_MATCH_CANDIDATE_CONFIDENCE", "70"))
 TEMPORAL_VOTING_WINDOW = max(3, int(os.environ.get("TEMPORAL_VOTING_WINDOW", "7")))
 TEMPORAL_VOTING_MIN_HITS = max(2, int(os.environ.get("TEMPORAL_VOTING_MIN_HITS", "4")))
@@ -36,96 +24,12 @@ def set_active_investigator(investigator_id):
     ACTIVE_INVESTIGATOR_ID = investigator_id
 
 
-class FaceDetector:
-    def __init__(self):
-        self.mode = "NONE"
-        self.model = None
-        self.mtcnn = MTCNN() if MTCNN else None
-        self._init_yolo()
-
-    def _candidate_model_paths(self):
-        root = Path(__file__).resolve().parent.parent
-        from_env = os.environ.get("YOLO_FACE_MODEL", "").strip()
-        defaults = [
-            root / "face_recognition" / "models" / "yolov8n-face.pt",
-            root / "face_recognition" / "models" / "yolov8n-face.onnx",
-            root / "face_recognition" / "models" / "yolov11n-face.pt",
-            root / "face_recognition" / "models" / "yolov11n-face.onnx",
-        ]
-        candidates = [Path(from_env)] if from_env else []
-        candidates.extend(defaults)
-        return [p for p in candidates if p.exists()]
-
-    def _init_yolo(self):
-        if YOLO is None:
-            return
-
-        for model_path in self._candidate_model_paths():
-            try:
-                self.model = YOLO(str(model_path))
-                self.mode = "YOLO"
-                print(f"[INFO] YOLO face detector loaded: {model_path}")
-                return
-            except Exception:
-                continue
-
-    def detect_faces(self, frame):
-        if self.mode == "YOLO" and self.model is not None:
-            return self._detect_with_yolo(frame)
-        if self.mtcnn is not None:
-            return self._detect_with_mtcnn(frame)
-        return []
-
-    def _detect_with_yolo(self, frame):
-        boxes = []
-        try:
-            results = self.model(frame, verbose=False)
-        except Exception:
-            return boxes
-
-        if not results:
-            return boxes
-
-        yolo_result = results[0]
-        if yolo_result.boxes is None:
-            return boxes
-
-        for box in yolo_result.boxes:
-            conf = float(box.conf[0]) if box.conf is not None else 0.0
-            if conf < FACE_DETECTION_CONFIDENCE:
-                continue
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            x1, y1 = max(0, int(x1)), max(0, int(y1))
-            x2, y2 = max(0, int(x2)), max(0, int(y2))
-            if (x2 - x1) < MIN_BOX_SIZE or (y2 - y1) < MIN_BOX_SIZE:
-                continue
-            boxes.append((x1, y1, x2, y2))
-        return boxes
-
-    def _detect_with_mtcnn(self, frame):
-        boxes = []
-        try:
-            results = self.mtcnn.detect_faces(frame)
-        except Exception:
-            return boxes
-
-        for face in results:
-            x, y, w, h = face["box"]
-            x, y = max(0, int(x)), max(0, int(y))
-            w, h = int(w), int(h)
-            if w < MIN_BOX_SIZE or h < MIN_BOX_SIZE:
-                continue
-            boxes.append((x, y, x + w, y + h))
-        return boxes
-
-
 def start_camera():
-    global camera, camera_active, detector
+    global camera, camera_active
     with lock:
         if camera_active:
             return
         camera = cv2.VideoCapture(0)
-        detector = detector or FaceDetector()
         camera_active = True
         print("✅ Camera started")
 
@@ -142,10 +46,17 @@ def stop_camera():
 
 
 def generate_frames():
-    global camera, camera_active, detector
+    global camera, camera_active
 
     start_camera()
-    recent_candidates = deque(maxlen=TEMPORAL_VOTING_WINDOW)
+    tracker = FaceTracker(get_face_detector().detect)
+    identities = TrackIdentities(
+        embed_detections,
+        lambda embedded: recognize_embeddings(embedded, return_details=True),
+        window=TEMPORAL_VOTING_WINDOW,
+        min_hits=TEMPORAL_VOTING_MIN_HITS,
+        min_confidence=FRAME_MATCH_CANDIDATE_CONFIDENCE,
+    )
     prev_gray = None
     read_failures = 0
     max_read_failures = 8
@@ -167,16 +78,18 @@ def generate_frames():
             prev_gray = gray
             liveness_ok = motion_score >= LIVE_MOTION_THRESHOLD
 
-            active_detector = detector or FaceDetector()
-            boxes = active_detector.detect_faces(frame)
-            frame_candidates = []
+            # Full detection only on keyframes; cheap tracking in between.
+            detections = tracker.update(frame, gray, force_detect=motion_score >= REDETECT_MOTION)
+
+            # Settled tracks reuse their cached identity instead of being
+            # embedded again on every frame.
+            try:
+                recognized = identities.update(frame, detections)
+            except Exception:
+                recognized = []
 
-            for (x1, y1, x2, y2) in boxes:
-                face = frame[y1:y2, x1:x2]
-                try:
-                    face_label, confidence, details = recognize_face(face, return_details=True)
-                except Exception:
-                    continue
+            for detection, (face_label, confidence, details) in zip(detections, recognized):
+                x1, y1, x2, y2 = detection_corners(detection)
                 confidence = float(confidence)
                 is_candidate = face_label != "unknown" and confidence >= FRAME_MATCH_CANDIDATE_CONFIDENCE
 
@@ -186,7 +99,7 @@ def generate_frames():
                 shown_confidence = confidence if face_label != "unknown" else fallback_confidence
 
                 color = (0, 255, 0) if is_candidate else (0, 170, 255)
-                text = f"{shown_name} | {shown_confidence:.1f}%"
+                text = f"#{detection['track_id']} {shown_name} | {shown_confidence:.1f}%"
 
                 cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
                 cv2.putText(
@@ -200,11 +113,7 @@ def generate_frames():
                     cv2.LINE_AA,
                 )
 
-                if is_candidate:
-                    frame_candidates.append({"face_label": face_label, "confidence": confidence})
-
-            recent_candidates.append(frame_candidates)
-            stable_matches = _aggregate_temporal_matches(recent_candidates)
+            stable_matches = _aggregate_temporal_matches(identities.votes())
             if not liveness_ok:
                 stable_matches = []
 
@@ -250,35 +159,34 @@ def generate_frames():
         stop_camera()
 
 
-def _aggregate_temporal_matches(history):
-    counts = {}
-    max_conf = {}
-    score_sum = {}
+def _aggregate_temporal_matches(track_votes):
+    """Labels that one track voted for in at least TEMPORAL_VOTING_MIN_HITS verifications.
 
-    for frame_candidates in history:
-        seen_in_frame = set()
-        for item in frame_candidates:
-            label = item.get("face_label")
-            confidence = float(item.get("confidence", 0.0))
-            if not label or label in seen_in_frame:
-                continue
+    Votes never add up across tracks, so two faces each half-matching the
+    same person do not confirm that person together.
+    """
+    best = {}
 
-            seen_in_frame.add(label)
+    for votes in track_votes:
+        counts = {}
+        max_conf = {}
+        score_sum = {}
+        for item in votes:
+            if not item or not item.get("face_label"):
+                continue
+            label = item["face_label"]
+            confidence = float(item.get("confidence", 0.0))
             counts[label] = counts.get(label, 0) + 1
             max_conf[label] = max(max_conf.get(label, 0.0), confidence)
             score_sum[label] = score_sum.get(label, 0.0) + confidence
 
-    stable = []
-    for label, hit_count in counts.items():
-        if hit_count < TEMPORAL_VOTING_MIN_HITS:
-            continue
-        averaged = score_sum[label] / max(1, hit_count)
-        stable.append(
-            {
-                "face_label": label,
-                "confidence": max(max_conf[label], averaged),
-            }
-        )
+        for label, hit_count in counts.items():
+            if hit_count < TEMPORAL_VOTING_MIN_HITS:
+                continue
+            averaged = score_sum[label] / max(1, hit_count)
+            best[label] = max(best.get(label, 0.0), max_conf[label], averaged)
+
+    stable = [{"face_label": label, "confidence": confidence} for label, confidence in best.items()]
 
     stable.sort(key=lambda item: float(item.get("confidence", 0.0)), reverse=True)
     return stable
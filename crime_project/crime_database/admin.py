@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Criminal, CrimeRecord, Evidence
+from .models import Criminal, CrimeRecord, Evidence, RetrainJob
 
 admin.site.site_header = "Crime Intelligence Unit – Admin Panel"
 admin.site.site_title = "Crime Intelligence Admin"
@@ -37,3 +37,10 @@ class CrimeRecordAdmin(admin.ModelAdmin):
 class EvidenceAdmin(admin.ModelAdmin):
     list_display = ('id', 'crime_record', 'uploaded_at')
     list_filter = ('uploaded_at',)
+
+
+@admin.register(RetrainJob)
+class RetrainJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'face_label', 'status', 'progress', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('coalesced_into', 'started_at', 'finished_at')
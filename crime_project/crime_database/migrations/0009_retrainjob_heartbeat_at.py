@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crime_database', '0008_retrainjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='retrainjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -84,3 +84,41 @@ class AlertLog(models.Model):
 
     def __str__(self):
         return f"{self.risk_level} alert - {self.triggered_at}"
+
+
+class RetrainJob(models.Model):
+    """Queued change to the face gallery, run by the background retrain worker."""
+
+    KIND_FULL = "full"
+    KIND_ENROLL = "enroll"
+    KIND_CHOICES = [(KIND_FULL, "Full rebuild"), (KIND_ENROLL, "Enroll identity")]
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=KIND_FULL)
+    face_label = models.CharField(max_length=50, blank=True, default="")
+    previous_label = models.CharField(max_length=50, blank=True, default="")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    message = models.TextField(blank=True, default="")
+    # Set on jobs that were merged into another job's run.
+    coalesced_into = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, null=True, blank=True, related_name="merged_jobs"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the worker while the job runs; a stale one means it died.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Retrain #{self.id} ({self.kind}) - {self.status}"
@@ -9,6 +9,11 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
+from face_recognition.runtime_config import configure_thread_env
+
+# Thread variables have to be set before anything imports numpy.
+configure_thread_env()
+
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crime_project.settings')
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+import cv2
+import numpy as np
+
+try:
+    from runtime_config import ROLES
+except ImportError:
+    from face_recognition.runtime_config import ROLES
+
+DATASET_PATH = Path(__file__).resolve().parent.parent / "dataset"
+CONFIGS = ("default", "budgeted")
+
+
+def load_crops(dataset_path, limit):
+    """Face-sized crops from the centre of dataset images, like stream crops."""
+    crops = []
+    for person in sorted(os.listdir(dataset_path)):
+        person_dir = dataset_path / person
+        if not person_dir.is_dir():
+            continue
+        for img_name in sorted(os.listdir(person_dir)):
+            img = cv2.imread(str(person_dir / img_name), cv2.IMREAD_REDUCED_COLOR_4)
+            if img is None:
+                continue
+            h, w = img.shape[:2]
+            crop = img[h // 4 : h // 4 + h // 2, w // 4 : w // 4 + w // 2]
+            crops.append(cv2.resize(crop, (200, 240), interpolation=cv2.INTER_AREA))
+            if len(crops) >= limit:
+                return crops
+    return crops
+
+
+def run_config(config, role, clients_list, seconds, crops):
+    """Child-process side; thread budgets are process-wide, so one config per process."""
+    if config == "budgeted":
+        try:
+            from runtime_config import configure_runtime, embedding_slot
+        except ImportError:
+            from face_recognition.runtime_config import configure_runtime, embedding_slot
+        budget = configure_runtime(role)
+        slot = embedding_slot
+    else:
+        budget = None
+        slot = nullcontext
+    try:
+        import facenet_encoder as encoder
+    except ImportError:
+        from face_recognition import facenet_encoder as encoder
+    get_face_embeddings = encoder.get_face_embeddings
+    if config == "default":
+        # ONNX Runtime sessions would otherwise size themselves from the
+        # default role's budget, which is not a baseline.
+        encoder._embedder = encoder.load_embedder(budgeted=False)
+    encoder.get_embedder()
+    get_face_embeddings(crops[:1], assume_cropped=True, relaxed_quality=True)
+
+    rows = []
+    for clients in clients_list:
+        latencies = [[] for _ in range(clients)]
+        deadline = time.perf_counter() + seconds
+
+        def client(index):
+            position = index
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                with slot():
+                    get_face_embeddings([crops[position % len(crops)]], assume_cropped=True, relaxed_quality=True)
+                latencies[index].append(time.perf_counter() - started)
+                position += clients
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        merged = np.array([value for values in latencies for value in values]) * 1000.0
+        rows.append(
+            {
+                "clients": clients,
+                "faces_per_second": len(merged) / elapsed,
+                "p50_ms": float(np.percentile(merged, 50)) if len(merged) else 0.0,
+                "p99_ms": float(np.percentile(merged, 99)) if len(merged) else 0.0,
+            }
+        )
+    print(json.dumps({"config": config, "budget": budget, "rows": rows}))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Embedding throughput and latency under concurrent callers, with and without thread budgets."
+    )
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=float, default=10.0, help="Run time per client count")
+    parser.add_argument("--role", choices=ROLES, default="stream", help="Budget applied in the budgeted run")
+    parser.add_argument("--configs", nargs="+", choices=CONFIGS, default=list(CONFIGS))
+    parser.add_argument("--dataset", type=Path, default=DATASET_PATH)
+    parser.add_argument("--crops", type=int, default=64)
+    parser.add_argument("--run-config", choices=CONFIGS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    crops = load_crops(args.dataset, args.crops)
+    if not crops:
+        print("[WARNING] No images in the dataset")
+        sys.exit(1)
+
+    if args.run_config:
+        run_config(args.run_config, args.role, args.clients, args.seconds, crops)
+        return
+
+    results = []
+    for config in args.configs:
+        child = subprocess.run(
+            [
+                sys.executable, __file__,
+                "--run-config", config,
+                "--role", args.role,
+                "--seconds", str(args.seconds),
+                "--dataset", str(args.dataset),
+                "--crops", str(args.crops),
+                "--clients", *map(str, args.clients),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if child.returncode != 0:
+            print(f"[WARNING] {config}: {(child.stderr.strip().splitlines() or ['failed'])[-1]}")
+            continue
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    print(f"{'config':<10} {'clients':>7} {'faces/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for result in results:
+        for row in result["rows"]:
+            print(
+                f"{result['config']:<10} {row['clients']:>7} {row['faces_per_second']:>9.1f} "
+                f"{row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f}"
+            )
+        if result["budget"]:
+            budget = ", ".join(f"{key}={value}" for key, value in result["budget"].items())
+            print(f"{'':<10} budget: {budget}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+
+try:
+    from face_detector import FaceDetector, detect_haar, load_haar_cascade
+    from facenet_encoder import detection_corners
+except ImportError:
+    from face_recognition.face_detector import FaceDetector, detect_haar, load_haar_cascade
+    from face_recognition.facenet_encoder import detection_corners
+
+ROOT = Path(__file__).resolve().parent
+DATASET_PATH = ROOT.parent / "dataset"
+DETECTORS = ("haar", "mtcnn", "yolo")
+MATCH_IOU = 0.5
+
+
+def load_images(dataset_path, limit):
+    images = []
+    for person in sorted(os.listdir(dataset_path)):
+        person_dir = dataset_path / person
+        if not person_dir.is_dir():
+            continue
+        for img_name in sorted(os.listdir(person_dir)):
+            img = cv2.imread(str(person_dir / img_name))
+            if img is None:
+                continue
+            images.append(img)
+            if len(images) >= limit:
+                return images
+    return images
+
+
+def _haar():
+    cascade = load_haar_cascade()
+
+    def detect(frame, max_side):
+        return detect_haar(cascade, frame, max_side=max_side)
+
+    return detect
+
+
+def _face_detector(mode):
+    """The production FaceDetector, pinned to one backend."""
+    detector = FaceDetector()
+    if mode == "YOLO" and detector.mode != "YOLO":
+        raise FileNotFoundError("no YOLO face model (set YOLO_FACE_MODEL)")
+    if mode == "MTCNN":
+        if detector.mtcnn is None:
+            raise RuntimeError("MTCNN is not available")
+        # Measure MTCNN even when a YOLO model is installed.
+        detector.mode = "MTCNN"
+
+    def detect(frame, max_side):
+        return [detection_corners(detection) for detection in detector.detect(frame, max_side=max_side)]
+
+    return detect
+
+
+def _mtcnn():
+    return _face_detector("MTCNN")
+
+
+def _yolo():
+    return _face_detector("YOLO")
+
+
+def run_size(detect, images, max_side):
+    """Boxes in original coordinates for every image, and the mean ms/frame."""
+    results = []
+    started = time.perf_counter()
+    for image in images:
+        results.append(detect(image, max_side))
+    return results, 1000.0 * (time.perf_counter() - started) / len(images)
+
+
+def box_iou(a, b):
+    inter_w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    inter_h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = inter_w * inter_h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def recall(reference, results):
+    """Share of full-size detections that the reduced run also found."""
+    total = sum(len(boxes) for boxes in reference)
+    found = sum(
+        any(box_iou(ref, box) >= MATCH_IOU for box in boxes)
+        for refs, boxes in zip(reference, results)
+        for ref in refs
+    )
+    return found / total if total else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Detector speed and recall at reduced detection sizes (FACE_DETECT_MAX_SIDE)."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[320, 480, 640, 960, 1280], help="Long-side limits; full size is always run")
+    parser.add_argument("--detectors", nargs="+", choices=DETECTORS, default=list(DETECTORS))
+    parser.add_argument("--dataset", type=Path, default=DATASET_PATH)
+    parser.add_argument("--limit", type=int, default=200, help="Most images to use")
+    args = parser.parse_args()
+
+    images = load_images(args.dataset, args.limit)
+    if not images:
+        print("[WARNING] No images in the dataset")
+        sys.exit(1)
+    longest = np.array([max(image.shape[:2]) for image in images])
+    print(f"[INFO] {len(images)} images, long side median {int(np.median(longest))} px, max {int(longest.max())} px")
+
+    factories = {"haar": _haar, "mtcnn": _mtcnn, "yolo": _yolo}
+    # Every dataset image shows one enrolled face, so "images" is recall
+    # against the labels; "vs full" compares with full-size detection.
+    print(f"{'detector':<8} {'size':>6} {'ms/frame':>9} {'images':>8} {'vs full':>8}")
+    for name in args.detectors:
+        try:
+            detect = factories[name]()
+        except Exception as exc:
+            print(f"[WARNING] {name}: {exc}")
+            continue
+        detect(images[0], 0)
+
+        reference, reference_ms = run_size(detect, images, 0)
+        for max_side in sorted(set(args.sizes), reverse=True) + [0]:
+            results, ms = (reference, reference_ms) if max_side == 0 else run_size(detect, images, max_side)
+            with_face = sum(bool(boxes) for boxes in results) / len(images)
+            label = "full" if max_side == 0 else str(max_side)
+            print(f"{name:<8} {label:>6} {ms:>9.1f} {100 * with_face:>7.1f}% {100 * recall(reference, results):>7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,513 @@
+import argparse
+import json
+import multiprocessing
 import os
 import cv2
-import pickle
-from facenet_encoder import get_face_embedding
 import numpy as np
+from collections import Counter
 from pathlib import Path
 
+try:
+    from runtime_config import configure_runtime
+    from embedding_cache import CACHE_PATH, COMMIT_EVERY, EmbeddingCache, content_hash
+    from embedding_store import (
+        INDEX_PATH,
+        PICKLE_PATH as EMBEDDINGS_PATH,
+        STORE_PATH,
+        load_gallery,
+        patch_identity_stats,
+        read_store,
+        write_database,
+        write_pickle,
+        write_store,
+    )
+except ImportError:
+    from face_recognition.runtime_config import configure_runtime
+    from face_recognition.embedding_cache import CACHE_PATH, COMMIT_EVERY, EmbeddingCache, content_hash
+    from face_recognition.embedding_store import (
+        INDEX_PATH,
+        PICKLE_PATH as EMBEDDINGS_PATH,
+        STORE_PATH,
+        load_gallery,
+        patch_identity_stats,
+        read_store,
+        write_database,
+        write_pickle,
+        write_store,
+    )
+
 ROOT_DIR = Path(__file__).resolve().parent.parent
 DATASET_PATH = ROOT_DIR / "dataset"
-EMBEDDINGS_PATH = Path(__file__).resolve().parent / "facenet_embeddings.pkl"
-MAX_TEMPLATES_PER_PERSON = 5
+USE_EMBEDDING_CACHE = os.environ.get("FACENET_EMBEDDING_CACHE", "1").strip().lower() not in {"0", "false", "no"}
+TEMPLATE_CAPS_PATH = Path(
+    os.environ.get("FACENET_TEMPLATE_CAPS", Path(__file__).resolve().parent / "template_caps.json")
+)
+MAX_TEMPLATES_PER_PERSON = max(1, int(os.environ.get("FACENET_MAX_TEMPLATES", "5")))
 DIVERSITY_DISTANCE = 0.08
 MIN_TEMPLATE_QUALITY = 0.45
+# Failures that depend on the run, not the image; never cached.
+TRANSIENT_REASONS = {"detector_error", "embedding_error"}
+BUILD_WORKERS = int(os.environ.get("FACENET_BUILD_WORKERS", "1"))
+
+_encoder_module = None
+_worker_cache = None
+
+
+def _encoder():
+    """Import the encoder (and load MTCNN/FaceNet) on first use.
+
+    Keeps the parent of a parallel build free of the models; only the
+    workers that actually embed pay for loading them.
+    """
+    global _encoder_module
+    if _encoder_module is None:
+        try:
+            import facenet_encoder as module
+        except ImportError:
+            from face_recognition import facenet_encoder as module
+        _encoder_module = module
+    return _encoder_module
 
 
-def cosine_distance(a, b):
-    return 1.0 - float(np.dot(a, b))
+_template_caps = None
+
+
+def template_cap(person):
+    """Template budget for one identity.
+
+    ``template_caps.json`` maps labels to their own cap, e.g. a subject with
+    hundreds of surveillance stills; everyone else gets
+    ``MAX_TEMPLATES_PER_PERSON``.
+    """
+    global _template_caps
+    if _template_caps is None:
+        _template_caps = {}
+        if TEMPLATE_CAPS_PATH.exists():
+            try:
+                with open(TEMPLATE_CAPS_PATH, "r", encoding="utf-8") as f:
+                    _template_caps = {str(k): max(1, int(v)) for k, v in json.load(f).items()}
+            except (OSError, ValueError, AttributeError) as exc:
+                print(f"[WARNING] Ignoring {TEMPLATE_CAPS_PATH} ({exc})")
+    return _template_caps.get(person, MAX_TEMPLATES_PER_PERSON)
 
 
 def pick_diverse_templates(items, max_count):
-    selected = []
-    selected_indices = set()
-    for item in items:
-        emb = item["embedding"]
-        if not selected:
-            selected.append(item)
-            selected_indices.add(id(item))
-            if len(selected) >= max_count:
-                break
-            continue
+    """Quality-weighted greedy k-center over one person's embeddings.
 
-        min_dist = min(cosine_distance(emb, existing["embedding"]) for existing in selected)
-        if min_dist >= DIVERSITY_DISTANCE:
-            selected.append(item)
-            selected_indices.add(id(item))
-            if len(selected) >= max_count:
-                break
+    ``items`` come best quality first. The first pick is the best image;
+    each next pick maximizes ``quality * distance to the nearest pick``
+    among images at least ``DIVERSITY_DISTANCE`` away from every pick.
+    When only near-duplicates remain, the rest of the budget is filled in
+    quality order. The pairwise distance matrix is computed once.
+    """
+    count = min(len(items), max_count)
+    if count <= 0:
+        return []
 
-    if len(selected) < max_count:
-        for item in items:
-            if id(item) in selected_indices:
-                continue
-            selected.append(item)
-            selected_indices.add(id(item))
-            if len(selected) >= max_count:
-                break
+    embeddings = np.vstack([np.asarray(item["embedding"], dtype=np.float32) for item in items])
+    quality = np.array([item["quality_score"] for item in items], dtype=np.float32)
+    distances = 1.0 - embeddings @ embeddings.T
 
-    return selected[:max_count]
+    chosen = [0]
+    available = np.ones(len(items), dtype=bool)
+    available[0] = False
+    nearest = distances[0].copy()
+    while len(chosen) < count:
+        score = np.where(available & (nearest >= DIVERSITY_DISTANCE), quality * nearest, -np.inf)
+        best = int(np.argmax(score))
+        if not np.isfinite(score[best]):
+            break
+        chosen.append(best)
+        available[best] = False
+        np.minimum(nearest, distances[best], out=nearest)
 
-embeddings = {}
+    if len(chosen) < count:
+        chosen.extend(np.flatnonzero(available)[:count - len(chosen)].tolist())
+    return [items[i] for i in chosen]
 
-for person in os.listdir(DATASET_PATH):
-    person_dir = DATASET_PATH / person
-    if not person_dir.is_dir():
-        continue
 
-    person_embeddings = []
+def open_cache(commit_every=COMMIT_EVERY):
+    if not USE_EMBEDDING_CACHE:
+        return None
+    return EmbeddingCache(CACHE_PATH, _encoder().model_fingerprint(), commit_every)
+
+
+def _cached_embedding(img_path, cache, seen=None):
+    """``get_face_embedding`` for a dataset file, through the cache.
+
+    Returns ``(embedding, meta)``, or None when the file cannot be read.
+    """
+    try:
+        digest = content_hash(img_path.read_bytes())
+    except OSError:
+        return None
+    if seen is not None:
+        seen.add(digest)
+    cached = cache.get(digest)
+    if cached is not None:
+        return cached
+
+    img = cv2.imread(str(img_path))
+    if img is None:
+        return None
+    embedding, meta = _encoder().get_face_embedding(img, return_meta=True)
+    if meta.get("reason") not in TRANSIENT_REASONS:
+        cache.put(digest, embedding, meta)
+    return embedding, meta
 
-    for img_name in os.listdir(person_dir):
-        img_path = person_dir / img_name
-        img = cv2.imread(str(img_path))
 
+def embed_image(img_path, cache=None, seen=None):
+    """Embed one dataset image; returns ``(item, skip_reason)``."""
+    if cache is not None:
+        result = _cached_embedding(img_path, cache, seen)
+        if result is None:
+            return None, "unreadable"
+        embedding, meta = result
+    else:
+        img = cv2.imread(str(img_path))
         if img is None:
+            return None, "unreadable"
+        embedding, meta = _encoder().get_face_embedding(img, return_meta=True)
+
+    if embedding is None:
+        return None, meta.get("reason", "unknown")
+
+    quality_score = float(meta.get("quality_score", 0.0))
+    if quality_score < MIN_TEMPLATE_QUALITY:
+        return None, f"low_quality:{quality_score:.2f}"
+
+    return {
+        "embedding": embedding,
+        "quality_score": quality_score,
+        "image": img_path.name,
+    }, None
+
+
+def select_templates(person, person_embeddings):
+    if not person_embeddings:
+        print(f"[WARNING] No valid faces found for {person}")
+        return []
+
+    person_embeddings = sorted(person_embeddings, key=lambda item: item["quality_score"], reverse=True)
+    max_count = template_cap(person)
+    chosen = pick_diverse_templates(person_embeddings, max_count)
+    print(f"[INFO] {person}: selected {len(chosen)}/{len(person_embeddings)} templates (max={max_count})")
+    return [item["embedding"] for item in chosen]
+
+
+def embed_person(person, cache=None, seen=None):
+    """Embed every image of one person; returns ``(items, skipped)``.
+
+    ``skipped`` lists ``(image name, reason)`` for each rejected image.
+    """
+    person_dir = DATASET_PATH / person
+    items = []
+    skipped = []
+    for img_path in sorted(person_dir.iterdir()):
+        if not img_path.is_file():
             continue
+        item, reason = embed_image(img_path, cache, seen)
+        if item is None:
+            if reason != "unreadable":
+                skipped.append((img_path.name, reason))
+            continue
+        items.append(item)
+    return items, skipped
+
+
+def _embed_person_job(person, cache):
+    seen = set()
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    items, skipped = embed_person(person, cache, seen)
+    if cache is None:
+        return person, items, skipped, seen, 0, 0, None
+    cache.flush()
+    return person, items, skipped, seen, cache.hits - hits, cache.misses - misses, cache.model
+
+
+def _init_worker(threads):
+    """Pool initializer: load the models and open the cache once per worker."""
+    global _worker_cache
+    # Split the cores between workers instead of every TensorFlow runtime
+    # claiming all of them.
+    configure_runtime("build", cores=threads)
+    _encoder()
+    # Commit every row: a batched transaction would hold the cache's write
+    # lock through the worker's model calls and serialize the whole pool.
+    _worker_cache = open_cache(commit_every=1)
+
+
+def _worker_job(person):
+    return _embed_person_job(person, _worker_cache)
+
+
+def _embed_serial(people):
+    cache = open_cache()
+    try:
+        for person in people:
+            yield _embed_person_job(person, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def _embed_parallel(people, workers):
+    # Largest folders first so one big identity does not finish last alone.
+    order = sorted(people, key=lambda person: -len(os.listdir(DATASET_PATH / person)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # spawn, not fork: TensorFlow state does not survive a fork.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        yield from pool.imap_unordered(_worker_job, order)
+
 
-        embedding, meta = get_face_embedding(img, return_meta=True)
-        if embedding is None:
-            reason = meta.get("reason", "unknown")
+def build_all(workers=BUILD_WORKERS):
+    """Embed the whole dataset and write the gallery.
+
+    With ``workers > 1`` person folders are spread over a process pool; the
+    gallery is always assembled in sorted label order, so the result does
+    not depend on the worker count or on completion order.
+    """
+    people = sorted(p for p in os.listdir(DATASET_PATH) if (DATASET_PATH / p).is_dir())
+    if workers > 1 and len(people) > 1:
+        workers = min(workers, len(people))
+        print(f"[INFO] Embedding {len(people)} identities with {workers} workers")
+        jobs = _embed_parallel(people, workers)
+    else:
+        jobs = _embed_serial(people)
+
+    results = {}
+    seen = set()
+    skip_reasons = Counter()
+    hits = misses = 0
+    model = None
+    for done, (person, items, skipped, job_seen, job_hits, job_misses, job_model) in enumerate(jobs, 1):
+        results[person] = items
+        seen.update(job_seen)
+        hits += job_hits
+        misses += job_misses
+        model = job_model or model
+        for img_name, reason in skipped:
+            print(f"[SKIPPED] {person}/{img_name} ({reason})")
+            skip_reasons[reason.split(":")[0]] += 1
+        print(f"[PROGRESS] {done}/{len(people)} {person}: {len(items)} usable, {len(skipped)} skipped")
+
+    embeddings = {}
+    for person in people:
+        chosen = select_templates(person, results[person])
+        if chosen:
+            embeddings[person] = chosen
+
+    if skip_reasons:
+        summary = ", ".join(f"{reason}={count}" for reason, count in skip_reasons.most_common())
+        print(f"[INFO] Skipped images: {summary}")
+    if model is not None:
+        cache = EmbeddingCache(CACHE_PATH, model)
+        cache.hits, cache.misses = hits, misses
+        pruned = cache.prune(seen)
+        print(f"[INFO] Embedding cache: {cache.summary()}, {pruned} stale entries dropped")
+        cache.close()
+
+    write_database(STORE_PATH, embeddings)
+    write_pickle(EMBEDDINGS_PATH, embeddings)
+    print("[SUCCESS] FaceNet embeddings created.")
+
+    if _index_enabled() and embeddings:
+        _build_index()
+    return embeddings
+
+
+# =====================================================
+# INCREMENTAL ENROLLMENT
+# =====================================================
+
+def _index_enabled():
+    return os.environ.get("FACENET_INDEX", "exact").strip().lower() == "ivf"
+
+
+def _build_index():
+    try:
+        from build_index import build_index
+    except ImportError:
+        from face_recognition.build_index import build_index
+
+    build_index(STORE_PATH, INDEX_PATH)
+    print(f"[SUCCESS] Gallery index written to {INDEX_PATH}")
+
+
+def _person_templates(person):
+    """Embed only images of ``person`` the cache has not seen and reselect templates."""
+    items = []
+    if (DATASET_PATH / person).is_dir():
+        cache = open_cache()
+        try:
+            items, skipped = embed_person(person, cache)
+        finally:
+            if cache is not None:
+                print(f"[INFO] {person}: embedding cache {cache.summary()}")
+                cache.close()
+        for img_name, reason in skipped:
             print(f"[SKIPPED] {person}/{img_name} ({reason})")
+    return select_templates(person, items)
+
+
+def _patch_store(replacements, renames=None):
+    """Rewrite the store with some labels replaced, added or removed.
+
+    ``replacements`` maps label -> templates (an empty list removes the
+    label); ``renames`` maps old label -> new label. Renaming onto a label
+    that is already enrolled merges the two template sets. The store is
+    replaced atomically, so readers see either the old or the new gallery;
+    the legacy pickle is rewritten after it to match.
+    """
+    renames = renames or {}
+    genuine = impostor = None
+    if STORE_PATH.exists():
+        store = read_store(STORE_PATH, mmap=False)
+        labels, counts, matrix = store.labels, store.counts, store.matrix
+        genuine, impostor = store.section("genuine_spread"), store.section("nearest_impostor")
+    elif EMBEDDINGS_PATH.exists():
+        labels, counts, matrix = load_gallery(EMBEDDINGS_PATH)
+    else:
+        labels, counts, matrix = [], [], np.zeros((0, 0), dtype=np.float32)
+
+    blocks = []
+    next_labels = []
+    # Index of each label's row in the old stats, None once its templates change.
+    sources = []
+    # Old matrix rows behind each block, None for freshly embedded templates.
+    old_rows = []
+    positions = {}
+    start = 0
+    for i, (label, count) in enumerate(zip(labels, counts)):
+        rows = matrix[start:start + count]
+        row_ids = np.arange(start, start + count)
+        start += count
+        label = renames.get(label, label)
+        if label in replacements:
+            continue
+        if label in positions:
+            merged = positions[label]
+            blocks[merged] = np.vstack([blocks[merged], rows])
+            old_rows[merged] = np.concatenate([old_rows[merged], row_ids])
+            sources[merged] = None
             continue
+        positions[label] = len(next_labels)
+        next_labels.append(label)
+        blocks.append(rows)
+        old_rows.append(row_ids)
+        sources.append(i)
 
-        quality_score = float(meta.get("quality_score", 0.0))
-        if quality_score < MIN_TEMPLATE_QUALITY:
-            print(f"[SKIPPED] {person}/{img_name} (low_quality:{quality_score:.2f})")
+    for label, templates in replacements.items():
+        if not len(templates):
             continue
+        rows = np.vstack([np.asarray(t, dtype=np.float32).reshape(1, -1) for t in templates])
+        rows /= np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+        next_labels.append(label)
+        blocks.append(rows)
+        old_rows.append(None)
+        sources.append(None)
 
-        person_embeddings.append(
-            {
-                "embedding": embedding,
-                "quality_score": quality_score,
-                "image": img_name,
-            }
-        )
+    next_counts = [len(block) for block in blocks]
+    next_matrix = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
 
-    if person_embeddings:
-        person_embeddings.sort(key=lambda item: item["quality_score"], reverse=True)
-        chosen = pick_diverse_templates(person_embeddings, MAX_TEMPLATES_PER_PERSON)
-        embeddings[person] = [item["embedding"] for item in chosen]
-        print(
-            f"[INFO] {person}: selected {len(chosen)}/{len(person_embeddings)} templates "
-            f"(max={MAX_TEMPLATES_PER_PERSON})"
+    # Only the patched labels need a full impostor search.
+    stats = None
+    if genuine is not None and impostor is not None and len(genuine) == len(labels):
+        changed = np.array([source is None for source in sources], dtype=bool)
+        kept = [0 if source is None else source for source in sources]
+        stats = patch_identity_stats(
+            next_counts,
+            next_matrix,
+            np.where(changed, np.nan, np.asarray(genuine)[kept]),
+            np.where(changed, np.inf, np.asarray(impostor)[kept]),
+            changed,
         )
-    else:
-        print(f"[WARNING] No valid faces found for {person}")
+    write_store(STORE_PATH, next_labels, next_counts, next_matrix, stats=stats)
+    write_pickle(EMBEDDINGS_PATH, {label: list(block) for label, block in zip(next_labels, blocks)})
+
+    if _index_enabled() and next_labels:
+        _patch_index(matrix, next_matrix, blocks, old_rows)
+
+
+def _patch_index(old_matrix, next_matrix, blocks, old_rows):
+    """Carry the IVF index over to a patched gallery without retraining.
+
+    Kept templates stay in their cells; only new templates are assigned to
+    the nearest existing centroid. The cells are retrained by build_all.
+    Without a usable index for the old gallery it is built from scratch.
+    """
+    try:
+        from gallery_index import IVFIndex
+    except ImportError:
+        from face_recognition.gallery_index import IVFIndex
+
+    try:
+        index = IVFIndex.load(INDEX_PATH, old_matrix)
+    except (OSError, ValueError) as exc:
+        print(f"[INFO] No index to patch ({exc}); building one")
+        _build_index()
+        return
+
+    old_cells = index.assignments()
+    cells = np.concatenate(
+        [old_cells[rows] if rows is not None else index.assign(block) for block, rows in zip(blocks, old_rows)]
+    )
+    IVFIndex.from_assignment(next_matrix, index.centroids, cells, index.nprobe).save(INDEX_PATH)
+    print(f"[SUCCESS] Gallery index updated in {INDEX_PATH}")
+
+
+def enroll_label(person):
+    """Re-embed one person's new images and patch them into the gallery."""
+    templates = _person_templates(person)
+    _patch_store({person: templates})
+    return len(templates)
+
+
+def rename_label(old_person, new_person):
+    """Move templates to a new label without re-embedding anything."""
+    _patch_store({}, renames={old_person: new_person})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the FaceNet gallery from dataset/")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=BUILD_WORKERS,
+        help="Embedding processes; 0 uses every core (default: FACENET_BUILD_WORKERS or 1)",
+    )
+    parser.add_argument(
+        "--enroll",
+        nargs="+",
+        default=[],
+        metavar="LABEL",
+        help="Only re-embed these identities and patch them into the existing gallery",
+    )
+    parser.add_argument(
+        "--rename",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("OLD", "NEW"),
+        help="Move an identity's templates to a new label before enrolling (repeatable)",
+    )
+    args = parser.parse_args()
+
+    if args.enroll or args.rename:
+        # Runs next to live serving, so it takes an upload's share of cores.
+        configure_runtime("upload")
+        for old_label, new_label in args.rename:
+            rename_label(old_label, new_label)
+        for done, label in enumerate(args.enroll, 1):
+            print(f"[ENROLLED] {label} {enroll_label(label)}")
+            print(f"[PROGRESS] {done}/{len(args.enroll)} {label}")
+        return
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    configure_runtime("build")
+    build_all(workers=workers)
 
-with open(EMBEDDINGS_PATH, "wb") as f:
-    pickle.dump(embeddings, f)
 
-print("[SUCCESS] FaceNet embeddings created.")
+if __name__ == "__main__":
+    main()
@@ -1,93 +1,224 @@
 import argparse
-import pickle
+import os
 from pathlib import Path
 import numpy as np
+from embedding_store import (
+    default_embeddings_path,
+    identity_stats,
+    is_store,
+    load_gallery,
+    read_store,
+    thresholds_from_stats,
+    write_store,
+)
 
 
-def l2_normalize(vec):
-    norm = np.linalg.norm(vec)
-    if norm <= 1e-12:
-        return vec
-    return vec / norm
+CANDIDATE_THRESHOLDS = np.linspace(0.2, 0.9, 281)
+BLOCK_ROWS = 2048
+# Cap on similarity entries held at once (64 MB of float32).
+BLOCK_ELEMENTS = 16 * 1024 * 1024
+LABEL_BLOCK = 4096
+DEFAULT_IMPOSTOR_BUDGET = 5_000_000
 
 
-def cosine_distance(a, b):
-    return 1.0 - float(np.dot(a, b))
+def genuine_distances(counts, matrix, with_labels=False):
+    """Every same-label template pair, as one batched matmul per label block.
 
-
-def pairwise_distances(vectors):
-    distances = []
-    for i in range(len(vectors)):
-        for j in range(i + 1, len(vectors)):
-            distances.append(cosine_distance(vectors[i], vectors[j]))
+    With ``with_labels`` also returns the label index of each distance.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    out = []
+    owners = []
+    for size in np.unique(counts):
+        if size < 2:
+            continue
+        labels = np.flatnonzero(counts == size)
+        upper = np.triu_indices(size, k=1)
+        for start in range(0, len(labels), LABEL_BLOCK):
+            rows = offsets[labels[start:start + LABEL_BLOCK], None] + np.arange(size)
+            block = np.asarray(matrix[rows.reshape(-1)], dtype=np.float32).reshape(len(rows), size, -1)
+            sims = block @ block.transpose(0, 2, 1)
+            out.append(1.0 - sims[:, upper[0], upper[1]].reshape(-1))
+            owners.append(np.repeat(labels[start:start + LABEL_BLOCK], len(upper[0])))
+    distances = np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+    if with_labels:
+        return distances, np.concatenate(owners) if owners else np.zeros(0, dtype=np.int64)
     return distances
 
 
-def make_impostor_distances(by_label, max_samples_per_pair=20):
-    labels = sorted(by_label.keys())
-    rng = np.random.default_rng(42)
-    distances = []
-    for i in range(len(labels)):
-        for j in range(i + 1, len(labels)):
-            a = by_label[labels[i]]
-            b = by_label[labels[j]]
-            total = len(a) * len(b)
-            if total == 0:
-                continue
-
-            if total <= max_samples_per_pair:
-                for va in a:
-                    for vb in b:
-                        distances.append(cosine_distance(va, vb))
-                continue
-
-            for _ in range(max_samples_per_pair):
-                va = a[int(rng.integers(0, len(a)))]
-                vb = b[int(rng.integers(0, len(b)))]
-                distances.append(cosine_distance(va, vb))
-    return distances
+def impostor_distances(row_labels, matrix, budget=DEFAULT_IMPOSTOR_BUDGET, seed=42):
+    """Cross-label template distances, at most ``budget`` of them.
+
+    When every cross-label pair fits in the budget (or no budget is given)
+    all of them are computed in row blocks; otherwise ``budget`` pairs are
+    drawn uniformly. Memory stays proportional to the result either way.
+    """
+    row_labels = np.asarray(row_labels)
+    total_rows = len(row_labels)
+    same_label = np.bincount(np.unique(row_labels, return_inverse=True)[1]).astype(np.int64)
+    cross_pairs = (total_rows * (total_rows - 1) - int(np.sum(same_label * (same_label - 1)))) // 2
+
+    if budget is None or cross_pairs <= budget:
+        step = max(1, BLOCK_ELEMENTS // max(total_rows, 1))
+        out = []
+        for start in range(0, total_rows, step):
+            stop = min(start + step, total_rows)
+            sims = np.asarray(matrix[start:stop], dtype=np.float32) @ np.asarray(matrix[start:], dtype=np.float32).T
+            upper = np.arange(stop - start)[:, None] < np.arange(total_rows - start)[None, :]
+            keep = upper & (row_labels[start:stop, None] != row_labels[None, start:])
+            out.append(1.0 - sims[keep])
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+    # Random row blocks against random row blocks: each product scores
+    # BLOCK_ROWS**2 uniformly drawn pairs at matmul speed.
+    rng = np.random.default_rng(seed)
+    out = []
+    remaining = int(budget)
+    while remaining > 0:
+        a = rng.integers(0, total_rows, BLOCK_ROWS)
+        b = rng.integers(0, total_rows, BLOCK_ROWS)
+        sims = np.asarray(matrix[a], dtype=np.float32) @ np.asarray(matrix[b], dtype=np.float32).T
+        distances = 1.0 - sims[row_labels[a][:, None] != row_labels[b][None, :]]
+        out.append(distances[:remaining])
+        remaining -= len(out[-1])
+    return np.concatenate(out)
+
+
+def roc_sweep(genuine, impostor):
+    """FRR and FAR at every distinct distance, from one sort.
+
+    Returns ``(thresholds, frr, far)`` where a pair matches when its
+    distance is below the threshold: ``frr[i]`` is the share of genuine
+    pairs at or above ``thresholds[i]``, ``far[i]`` the share of impostor
+    pairs below it.
+    """
+    genuine = np.asarray(genuine, dtype=np.float32)
+    impostor = np.asarray(impostor, dtype=np.float32)
+    scores = np.concatenate([genuine, impostor])
+    is_genuine = np.concatenate([np.ones(len(genuine), dtype=bool), np.zeros(len(impostor), dtype=bool)])
+    order = np.argsort(scores)
+    scores = scores[order]
+    genuine_below = np.concatenate([[0], np.cumsum(is_genuine[order])])
+    impostor_below = np.concatenate([[0], np.cumsum(~is_genuine[order])])
+
+    # A threshold at a distinct score accepts every pair sorted before its
+    # first occurrence; one more point past the maximum accepts all pairs.
+    first = np.flatnonzero(np.concatenate([[True], scores[1:] != scores[:-1]])) if len(scores) else np.zeros(0, dtype=np.int64)
+    thresholds = np.append(scores[first], np.nextafter(scores[-1], np.inf) if len(scores) else 0.0)
+    first = np.append(first, len(scores))
+    frr = 1.0 - genuine_below[first] / max(len(genuine), 1)
+    far = impostor_below[first] / max(len(impostor), 1)
+    return thresholds, frr, far
+
+
+def rates_at(sweep, thresholds):
+    """FRR/FAR of a ``roc_sweep`` evaluated at arbitrary thresholds."""
+    points, frr, far = sweep
+    index = np.searchsorted(points, thresholds, side="left")
+    # Past the last point every pair is accepted.
+    frr = np.append(frr, 0.0)[index]
+    far = np.append(far, far[-1] if len(far) else 0.0)[index]
+    return frr, far
+
+
+def best_threshold(genuine, impostor, candidates=CANDIDATE_THRESHOLDS):
+    """Equal-error threshold over ``candidates``, ties broken by mean error."""
+    frr, far = rates_at(roc_sweep(genuine, impostor), candidates)
+    best = int(np.lexsort(((frr + far) / 2.0, np.abs(frr - far)))[0])
+    return {
+        "threshold": float(candidates[best]),
+        "frr": float(frr[best]),
+        "far": float(far[best]),
+    }
+
+
+def per_identity_rates(counts, matrix, thresholds, budget=DEFAULT_IMPOSTOR_BUDGET, seed=42):
+    """Estimated FRR and FAR of every label at its own threshold.
+
+    FRR is the share of the label's genuine template pairs at or above its
+    threshold (NaN for single-template labels); FAR the share of pairs of
+    one of its templates and another label's template below it. With a
+    budget, impostor templates are a random sample of ``budget / templates``
+    columns. Only per-label counts are kept in memory. Returns
+    ``(frr, far, genuine_pairs, impostor_pairs)``.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    thresholds = np.asarray(thresholds, dtype=np.float32)
+    row_labels = np.repeat(np.arange(len(counts)), counts)
+    total_rows = len(row_labels)
+
+    genuine, owners = genuine_distances(counts, matrix, with_labels=True)
+    genuine_total = np.bincount(owners, minlength=len(counts))
+    rejected = np.bincount(owners, weights=genuine >= thresholds[owners], minlength=len(counts))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frr = np.where(genuine_total > 0, rejected / genuine_total, np.nan)
 
+    columns = np.arange(total_rows)
+    if budget is not None and total_rows * total_rows > budget:
+        size = max(1, int(budget) // max(total_rows, 1))
+        columns = np.sort(np.random.default_rng(seed).choice(total_rows, min(size, total_rows), replace=False))
+    column_matrix = np.asarray(matrix[columns], dtype=np.float32)
 
-def best_threshold(genuine, impostor):
-    candidates = np.linspace(0.2, 0.9, 281)
-    best = None
-    for t in candidates:
-        frr = float(np.mean(np.array(genuine) >= t))  # false reject rate
-        far = float(np.mean(np.array(impostor) < t))  # false accept rate
-        eer_gap = abs(frr - far)
-        score = (eer_gap, (frr + far) / 2.0)
-        if best is None or score < best["score"]:
-            best = {
-                "threshold": float(t),
-                "frr": frr,
-                "far": far,
-                "score": score,
-            }
-    return best
-
-
-def load_embeddings(path):
-    with open(path, "rb") as f:
-        raw = pickle.load(f)
-    by_label = {}
-    for label, embs in raw.items():
-        normalized = []
-        for emb in embs:
-            arr = np.asarray(emb, dtype=np.float32).reshape(-1)
-            if arr.size == 0:
-                continue
-            normalized.append(l2_normalize(arr))
-        if len(normalized) >= 2:
-            by_label[label] = normalized
-    return by_label
+    accepted = np.zeros(len(counts), dtype=np.float64)
+    impostors = np.zeros(len(counts), dtype=np.float64)
+    step = max(1, BLOCK_ELEMENTS // max(len(columns), 1))
+    for start in range(0, total_rows, step):
+        stop = min(start + step, total_rows)
+        block_labels = row_labels[start:stop]
+        distances = 1.0 - np.asarray(matrix[start:stop], dtype=np.float32) @ column_matrix.T
+        other = block_labels[:, None] != row_labels[columns][None, :]
+        hits = (distances < thresholds[block_labels][:, None]) & other
+        np.add.at(accepted, block_labels, hits.sum(axis=1))
+        np.add.at(impostors, block_labels, other.sum(axis=1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        far = np.where(impostors > 0, accepted / impostors, np.nan)
+    return frr, far, genuine_total, impostors.astype(np.int64)
+
+
+def load_embeddings(path, min_templates=2):
+    """Packed templates of labels with at least ``min_templates`` of them."""
+    labels, counts, matrix = load_gallery(path)
+    counts = np.asarray(counts, dtype=np.int64)
+    keep = counts >= min_templates
+    rows = np.repeat(keep, counts)
+    return (
+        [label for label, kept in zip(labels, keep) if kept],
+        counts[keep],
+        np.asarray(matrix, dtype=np.float32)[rows],
+    )
 
 
 def main():
     parser = argparse.ArgumentParser(description="Calibrate FaceNet threshold from enrolled templates")
     parser.add_argument(
         "--embeddings",
-        default=str(Path(__file__).resolve().parent / "facenet_embeddings.pkl"),
-        help="Path to embeddings pickle",
+        default=str(default_embeddings_path()),
+        help="Path to the embedding store or legacy pickle",
+    )
+    parser.add_argument(
+        "--write-store",
+        default=None,
+        help="Also save the loaded templates to this embedding store path",
+    )
+    parser.add_argument(
+        "--impostor-budget",
+        type=int,
+        default=DEFAULT_IMPOSTOR_BUDGET,
+        help="Most impostor pairs to score; 0 scores every cross-identity pair",
+    )
+    parser.add_argument(
+        "--per-identity",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Also print FRR/FAR at each identity's own threshold for the N highest-FAR identities",
+    )
+    parser.add_argument(
+        "--match-threshold",
+        type=float,
+        default=float(os.environ.get("FACENET_MATCH_THRESHOLD", "0.62")),
+        help="Global threshold the server caps per-identity thresholds with",
     )
     args = parser.parse_args()
 
@@ -95,25 +226,54 @@ def main():
     if not path.exists():
         raise FileNotFoundError(f"Embeddings not found: {path}")
 
-    by_label = load_embeddings(path)
-    if len(by_label) < 2:
-        raise RuntimeError("Need at least 2 identities with >=2 templates each for calibration")
+    if args.write_store:
+        write_store(args.write_store, *load_gallery(path))
+        print(f"Embedding store written to {args.write_store}")
 
-    genuine = []
-    for vectors in by_label.values():
-        genuine.extend(pairwise_distances(vectors))
+    labels, counts, matrix = load_embeddings(path)
+    if len(labels) < 2:
+        raise RuntimeError("Need at least 2 identities with >=2 templates each for calibration")
 
-    impostor = make_impostor_distances(by_label)
-    if not genuine or not impostor:
+    genuine = genuine_distances(counts, matrix)
+    row_labels = np.repeat(np.arange(len(labels)), counts)
+    impostor = impostor_distances(row_labels, matrix, budget=args.impostor_budget or None)
+    if not len(genuine) or not len(impostor):
         raise RuntimeError("Insufficient distances for calibration")
 
     best = best_threshold(genuine, impostor)
-    print(f"Identities used: {len(by_label)}")
+    print(f"Identities used: {len(labels)}")
     print(f"Genuine pairs  : {len(genuine)}")
     print(f"Impostor pairs : {len(impostor)}")
     print(f"Recommended FACENET_MATCH_THRESHOLD={best['threshold']:.3f}")
     print(f"Estimated FRR={best['frr']:.4f}, FAR={best['far']:.4f}")
 
+    if args.per_identity > 0:
+        print_identity_report(path, args.per_identity, args.match_threshold, args.impostor_budget or None)
+
+
+def print_identity_report(path, limit, match_threshold, budget):
+    """Per-identity FRR/FAR at the thresholds the server would apply."""
+    labels, counts, matrix = load_gallery(path)
+    counts = np.asarray(counts, dtype=np.int64)
+    thresholds = read_store(path).section("thresholds") if is_store(path) else None
+    if thresholds is None or len(thresholds) != len(labels):
+        thresholds = thresholds_from_stats(*identity_stats(counts, matrix))
+    thresholds = np.minimum(np.asarray(thresholds, dtype=np.float32), match_threshold)
+
+    frr, far, genuine_pairs, impostor_pairs = per_identity_rates(counts, matrix, thresholds, budget)
+    order = np.argsort(-np.nan_to_num(far, nan=-1.0), kind="stable")[:limit]
+    print()
+    print(f"{'Identity':<24} {'Thresh':>6} {'FRR':>7} {'FAR':>8} {'Genuine':>8} {'Impostor':>9}")
+    for i in order:
+        frr_text = f"{frr[i]:.4f}" if np.isfinite(frr[i]) else "-"
+        far_text = f"{far[i]:.5f}" if np.isfinite(far[i]) else "-"
+        print(
+            f"{labels[i]:<24} {thresholds[i]:>6.3f} {frr_text:>7} {far_text:>8} "
+            f"{int(genuine_pairs[i]):>8} {int(impostor_pairs[i]):>9}"
+        )
+    loose = int(np.count_nonzero(np.nan_to_num(far) > 0))
+    print(f"Identities with impostor pairs inside their threshold: {loose}/{len(labels)}")
+
 
 if __name__ == "__main__":
     main()
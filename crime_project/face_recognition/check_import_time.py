@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("tensorflow", "keras", "keras_facenet", "mtcnn", "torch", "ultralytics")
+DEFAULT_BUDGET_SECONDS = float(os.environ.get("FACENET_IMPORT_BUDGET", "3.0"))
+
+TARGETS = {
+    "encoder": "import face_recognition.facenet_encoder",
+    "facenet": "import api.facenet",
+    "django": (
+        "import django\n"
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crime_project.settings')\n"
+        "django.setup()\n"
+        "import api.urls"
+    ),
+}
+
+# Each target runs in a fresh interpreter so nothing is already cached.
+PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - started
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+warmup = None
+if {warmup!r}:
+    from face_recognition.facenet_encoder import warmup as encoder_warmup
+    started = time.perf_counter()
+    encoder_warmup()
+    warmup = time.perf_counter() - started
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy, "warmup": warmup}}))
+"""
+
+
+def measure(body, warmup=False):
+    env = dict(os.environ, FACENET_WARMUP="0")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(body=body, heavy=HEAVY_MODULES, warmup=warmup)],
+        cwd=str(ROOT_DIR),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1:] or ["import failed"]
+    return json.loads(result.stdout.strip().splitlines()[-1]), []
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that importing the recognition modules stays cheap and model-free."
+    )
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="Max seconds per import")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--warmup", action="store_true", help="Also time loading the models after import")
+    args = parser.parse_args()
+
+    failures = 0
+    for name in args.targets:
+        report, errors = measure(TARGETS[name], warmup=args.warmup)
+        if report is None:
+            failures += 1
+            print(f"[WARNING] {name}: {errors[0]}")
+            continue
+
+        line = f"{name:<8} {report['elapsed']:.2f}s"
+        if report["warmup"] is not None:
+            line += f"  warmup {report['warmup']:.2f}s"
+        print(line)
+        if report["elapsed"] > args.budget:
+            failures += 1
+            print(f"[WARNING] {name}: import took {report['elapsed']:.2f}s (budget {args.budget:.2f}s)")
+        if report["heavy"]:
+            failures += 1
+            print(f"[WARNING] {name}: import loaded {', '.join(report['heavy'])}")
+
+    if failures:
+        sys.exit(1)
+    print("[SUCCESS] Imports are within budget")
+
+
+if __name__ == "__main__":
+    main()
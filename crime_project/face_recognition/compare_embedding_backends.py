@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+
+try:
+    from facenet_encoder import EMBEDDING_BACKENDS, ONNX_MODEL_PATH
+except ImportError:
+    from face_recognition.facenet_encoder import EMBEDDING_BACKENDS, ONNX_MODEL_PATH
+
+DATASET_PATH = Path(__file__).resolve().parent.parent / "dataset"
+DEFAULT_MIN_COSINE = 0.999
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def collect_faces(dataset_path, limit_per_person, max_faces, assume_cropped):
+    """Aligned, quality-checked dataset faces, as the encoder sees them.
+
+    Returns ``(labels, batch)`` with one person label per face, or
+    ``([], None)`` when no face passed.
+    """
+    try:
+        from facenet_encoder import _prepare_face, face_batch
+    except ImportError:
+        from face_recognition.facenet_encoder import _prepare_face, face_batch
+
+    labels, faces = [], []
+    for person in sorted(os.listdir(dataset_path)):
+        person_dir = dataset_path / person
+        if not person_dir.is_dir():
+            continue
+        for img_name in sorted(os.listdir(person_dir))[:limit_per_person]:
+            img = cv2.imread(str(person_dir / img_name))
+            if img is None:
+                continue
+            face, _ = _prepare_face(img, assume_cropped=assume_cropped)
+            if face is not None:
+                labels.append(person)
+                faces.append(face)
+            if len(faces) >= max_faces:
+                return labels, face_batch(faces)
+    return labels, face_batch(faces) if faces else None
+
+
+def run_backend(backend, model_path, faces_path, output_path, batch_size, repeats):
+    """Child-process side: load one backend from cold and time it."""
+    started = time.perf_counter()
+    try:
+        from facenet_encoder import load_embedder
+    except ImportError:
+        from face_recognition.facenet_encoder import load_embedder
+    # --model names the float graph; the INT8 backend keeps its own path.
+    embedder = load_embedder(backend, model_path if backend in ("onnx", "opencv") else None)
+    batch = np.load(faces_path)["faces"]
+    first = np.asarray(embedder.embeddings(batch[:1]), dtype=np.float32)
+    startup = time.perf_counter() - started
+
+    single = []
+    for face in batch[: min(len(batch), 32)]:
+        tick = time.perf_counter()
+        embedder.embeddings(face[None, ...])
+        single.append(time.perf_counter() - tick)
+
+    batched = []
+    embeddings = None
+    for _ in range(max(1, repeats)):
+        tick = time.perf_counter()
+        embeddings = np.concatenate(
+            [
+                np.asarray(embedder.embeddings(batch[start : start + batch_size]), dtype=np.float32)
+                for start in range(0, len(batch), batch_size)
+            ]
+        )
+        batched.append(time.perf_counter() - tick)
+
+    np.save(output_path, embeddings)
+    print(
+        json.dumps(
+            {
+                "backend": backend,
+                "dim": int(first.shape[1]),
+                "startup_s": startup,
+                "rss_mb": _rss_mb(),
+                "ms_per_face_single": 1000.0 * float(np.median(single)),
+                "ms_per_face_batched": 1000.0 * min(batched) / len(batch),
+            }
+        )
+    )
+
+
+def _normalize(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def parity(reference, candidate):
+    reference, candidate = _normalize(reference), _normalize(candidate)
+    cosine = np.sum(reference * candidate, axis=1)
+    ref_sims, cand_sims = reference @ reference.T, candidate @ candidate.T
+    # How far any pairwise cosine distance moves, i.e. what a threshold sees.
+    distance_shift = float(np.max(np.abs(ref_sims - cand_sims)))
+    # Nearest neighbour of each face among the others, in both spaces.
+    np.fill_diagonal(ref_sims, -np.inf)
+    np.fill_diagonal(cand_sims, -np.inf)
+    same_neighbor = float(np.mean(np.argmax(ref_sims, axis=1) == np.argmax(cand_sims, axis=1)))
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "max_distance_shift": distance_shift,
+        "same_nearest_neighbor": same_neighbor,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check embedding backends against each other on dataset faces and time them."
+    )
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=["keras", "onnx", "opencv"])
+    parser.add_argument("--reference", choices=EMBEDDING_BACKENDS, default="keras")
+    parser.add_argument("--model", type=Path, default=ONNX_MODEL_PATH, help="ONNX graph for onnx/opencv")
+    parser.add_argument("--dataset", type=Path, default=DATASET_PATH)
+    parser.add_argument("--limit-per-person", type=int, default=5)
+    parser.add_argument("--max-faces", type=int, default=256)
+    parser.add_argument("--assume-cropped", action="store_true", help="Dataset images are already face crops")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--min-cosine", type=float, default=DEFAULT_MIN_COSINE)
+    parser.add_argument("--run-backend", choices=EMBEDDING_BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--faces", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--output", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_backend:
+        run_backend(args.run_backend, args.model, args.faces, args.output, args.batch_size, args.repeats)
+        return
+
+    backends = [args.reference] + [b for b in args.backends if b != args.reference]
+    _, faces = collect_faces(args.dataset, args.limit_per_person, args.max_faces, args.assume_cropped)
+    if faces is None:
+        print("[WARNING] No usable faces in the dataset")
+        sys.exit(1)
+    print(f"[INFO] {len(faces)} faces from {args.dataset}")
+
+    results, embeddings = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        faces_path = Path(tmp) / "faces.npz"
+        np.savez(faces_path, faces=faces)
+        for backend in backends:
+            # A fresh interpreter per backend, so startup and RSS are its own.
+            output_path = Path(tmp) / f"{backend}.npy"
+            child = subprocess.run(
+                [
+                    sys.executable, __file__,
+                    "--run-backend", backend,
+                    "--model", str(args.model),
+                    "--faces", str(faces_path),
+                    "--output", str(output_path),
+                    "--batch-size", str(args.batch_size),
+                    "--repeats", str(args.repeats),
+                ],
+                capture_output=True,
+                text=True,
+            )
+            if child.returncode != 0:
+                reason = (child.stderr.strip().splitlines() or ["failed"])[-1]
+                print(f"[WARNING] {backend}: {reason}")
+                continue
+            results[backend] = json.loads(child.stdout.strip().splitlines()[-1])
+            embeddings[backend] = np.load(output_path)
+
+    if not results:
+        sys.exit(1)
+    print()
+    print(f"{'backend':<8} {'startup':>9} {'rss':>9} {'ms/face x1':>11} {f'ms/face x{args.batch_size}':>11}")
+    for backend, row in results.items():
+        print(
+            f"{backend:<8} {row['startup_s']:>8.2f}s {row['rss_mb']:>7.0f}MB "
+            f"{row['ms_per_face_single']:>11.2f} {row['ms_per_face_batched']:>11.2f}"
+        )
+
+    if args.reference not in embeddings:
+        print(f"\n[WARNING] Reference backend {args.reference} did not run; parity not checked")
+        sys.exit(1)
+    failed = False
+    print(f"\nParity against {args.reference}:")
+    for backend in backends[1:]:
+        if backend not in embeddings:
+            failed = True
+            continue
+        report = parity(embeddings[args.reference], embeddings[backend])
+        print(
+            f"{backend:<8} cosine min {report['min_cosine']:.5f} mean {report['mean_cosine']:.5f}  "
+            f"max distance shift {report['max_distance_shift']:.4f}  "
+            f"same nearest neighbour {100 * report['same_nearest_neighbor']:.1f}%"
+        )
+        if report["min_cosine"] < args.min_cosine:
+            failed = True
+            print(f"[WARNING] {backend}: cosine {report['min_cosine']:.5f} below {args.min_cosine}")
+    if failed:
+        sys.exit(1)
+    print("[SUCCESS] Backends agree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATASET_PATH = ROOT_DIR / "dataset"
+sys.path.insert(0, str(ROOT_DIR))
+os.chdir(ROOT_DIR)
+
+from api import facenet  # noqa: E402
+from face_recognition.facenet_encoder import get_face_embedding  # noqa: E402
+
+
+def dataset_probes(dataset_path, limit_per_person):
+    probes = []
+    for person in sorted(os.listdir(dataset_path)):
+        person_dir = dataset_path / person
+        if not person_dir.is_dir():
+            continue
+        for img_name in sorted(os.listdir(person_dir))[:limit_per_person]:
+            img = cv2.imread(str(person_dir / img_name))
+            if img is None:
+                continue
+            embedding = get_face_embedding(img)
+            if embedding is not None:
+                probes.append(np.asarray(embedding, dtype=np.float32))
+    if not probes:
+        raise RuntimeError(f"No usable probe faces under {dataset_path}")
+    return np.vstack(probes)
+
+
+def decisions(gallery, probes):
+    started = time.perf_counter()
+    distances = facenet._match_distances(gallery, probes)
+    elapsed_ms = (time.perf_counter() - started) * 1000.0 / len(probes)
+    best, _, _, matched = facenet._decide(gallery, distances)
+    return np.where(matched, best, -1), elapsed_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare match decisions of float32 and quantized galleries")
+    parser.add_argument("--dataset", default=str(DATASET_PATH), help="Dataset root with person_* folders")
+    parser.add_argument("--per-person", type=int, default=30, help="Probe images used per person")
+    args = parser.parse_args()
+
+    loaded = facenet.GALLERY
+    reference = facenet.Gallery(loaded.labels, loaded.counts, loaded.matrix, thresholds=loaded.thresholds)
+    if not len(reference):
+        raise RuntimeError("Gallery is empty; build embeddings first")
+
+    probes = dataset_probes(Path(args.dataset), args.per_person)
+    expected, ref_ms = decisions(reference, probes)
+    print(f"Probes: {len(probes)}, identities: {len(reference)}, templates: {len(reference.matrix)}")
+    print(f"float32 : {reference.resident_nbytes() / 1024:.1f} KiB, {ref_ms:.3f} ms/probe")
+
+    for dtype in facenet.GALLERY_DTYPES[1:]:
+        gallery = facenet.Gallery(loaded.labels, loaded.counts, loaded.matrix, thresholds=loaded.thresholds)
+        gallery.quantize(dtype)
+        got, ms = decisions(gallery, probes)
+        changed = int(np.count_nonzero(got != expected))
+        coded = gallery.codes.nbytes + (gallery.code_scale.nbytes if gallery.code_scale is not None else 0)
+        print(
+            f"{dtype:<8}: {coded / 1024:.1f} KiB coarse codes "
+            f"({reference.matrix.nbytes / max(coded, 1):.1f}x smaller), "
+            f"{ms:.3f} ms/probe, changed decisions={changed}"
+        )
+
+
+if __name__ == "__main__":
+    main()
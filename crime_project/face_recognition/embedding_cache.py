@@ -0,0 +1,94 @@
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+import numpy as np
+
+CACHE_PATH = Path(__file__).resolve().parent / "embedding_cache.sqlite3"
+# Rows per transaction. Processes sharing the file (parallel build
+# workers) use 1: an open write transaction holds SQLite's write lock and
+# blocks every other writer until it commits.
+COMMIT_EVERY = 256
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class EmbeddingCache:
+    """Embeddings of dataset images keyed by file content and model.
+
+    Rows are ``(content sha256, model fingerprint) -> (embedding, meta)``.
+    Rejected images are stored too, with a NULL embedding and the skip
+    reason in ``meta``, so unchanged files are never run through the models
+    again. A renamed or moved file still hits; a new model fingerprint
+    misses everything.
+    """
+
+    def __init__(self, path=CACHE_PATH, model="", commit_every=COMMIT_EVERY):
+        self.path = Path(path)
+        self.model = model
+        self.commit_every = max(1, commit_every)
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self.conn = sqlite3.connect(str(self.path), timeout=30)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " digest TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " embedding BLOB,"
+            " meta TEXT NOT NULL,"
+            " PRIMARY KEY (digest, model))"
+        )
+        self.conn.commit()
+
+    def get(self, digest):
+        """Return ``(embedding, meta)`` or None on a miss."""
+        row = self.conn.execute(
+            "SELECT embedding, meta FROM embeddings WHERE digest = ? AND model = ?",
+            (digest, self.model),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        embedding = np.frombuffer(row[0], dtype=np.float32).copy() if row[0] is not None else None
+        return embedding, json.loads(row[1])
+
+    def put(self, digest, embedding, meta):
+        blob = None
+        if embedding is not None:
+            blob = np.asarray(embedding, dtype=np.float32).reshape(-1).tobytes()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO embeddings (digest, model, embedding, meta) VALUES (?, ?, ?, ?)",
+            (digest, self.model, blob, json.dumps(meta, default=float)),
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.flush()
+
+    def prune(self, keep_digests):
+        """Drop rows of other models and of images no longer in the dataset."""
+        keep = set(keep_digests)
+        stale = [
+            (digest, model)
+            for digest, model in self.conn.execute("SELECT digest, model FROM embeddings")
+            if model != self.model or digest not in keep
+        ]
+        self.conn.executemany("DELETE FROM embeddings WHERE digest = ? AND model = ?", stale)
+        self.conn.commit()
+        return len(stale)
+
+    def flush(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
@@ -0,0 +1,395 @@
+import argparse
+import json
+import os
+import pickle
+import struct
+from pathlib import Path
+import numpy as np
+
+FACE_RECOGNITION_DIR = Path(__file__).resolve().parent
+
+
+def _configured_path(env_name, filename):
+    """Gallery file location shared by the server and the build scripts.
+
+    Relative overrides are taken from the project directory, so the path is
+    the same whatever directory a script is started from.
+    """
+    value = os.environ.get(env_name, "").strip()
+    if not value:
+        return FACE_RECOGNITION_DIR / filename
+    path = Path(value)
+    return path if path.is_absolute() else FACE_RECOGNITION_DIR.parent / path
+
+
+STORE_PATH = _configured_path("FACENET_STORE_PATH", "facenet_embeddings.bin")
+PICKLE_PATH = _configured_path("FACENET_PICKLE_PATH", "facenet_embeddings.pkl")
+INDEX_PATH = _configured_path("FACENET_INDEX_PATH", "facenet_index.npz")
+
+# Per-identity thresholds sit IMPOSTOR_MARGIN inside the label's nearest
+# impostor, but never below its own template spread plus GENUINE_MARGIN or
+# THRESHOLD_FLOOR. The matcher caps them at its global threshold.
+GENUINE_MARGIN = float(os.environ.get("FACENET_GENUINE_MARGIN", "0.05"))
+IMPOSTOR_MARGIN = float(os.environ.get("FACENET_IMPOSTOR_MARGIN", "0.05"))
+THRESHOLD_FLOOR = float(os.environ.get("FACENET_THRESHOLD_FLOOR", "0.30"))
+NEIGHBOR_LABELS = 16
+CENTROID_BLOCK = 4096
+
+MAGIC = b"FNETEMB\0"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class EmbeddingStore:
+    """Gallery file opened for reading.
+
+    Layout: an 8-byte magic, a little-endian ``(version, header_len)`` pair,
+    a JSON header holding the label table and a section directory, then
+    64-byte aligned raw arrays. The ``templates`` section is the packed,
+    L2-normalized float32 matrix; label ``i`` owns rows
+    ``offsets[i]:offsets[i + 1]``.
+    """
+
+    def __init__(self, path, header, sections):
+        self.path = Path(path)
+        self.header = header
+        self.labels = list(header["labels"])
+        self.counts = np.asarray(header["counts"], dtype=np.int64)
+        self.offsets = np.zeros(len(self.labels) + 1, dtype=np.int64)
+        np.cumsum(self.counts, out=self.offsets[1:])
+        self.sections = sections
+        self.matrix = sections["templates"]
+
+    @property
+    def generation(self):
+        return int(self.header.get("generation", 0))
+
+    def section(self, name):
+        return self.sections.get(name)
+
+    def to_database(self):
+        return {
+            label: [self.matrix[row] for row in range(self.offsets[i], self.offsets[i + 1])]
+            for i, label in enumerate(self.labels)
+        }
+
+
+def is_store(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        magic, version, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not an embedding store: {path}")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding store version {version}: {path}")
+        return json.loads(f.read(header_len).decode("utf-8"))
+
+
+def next_generation(path):
+    """Generation number for the next write of ``path``."""
+    try:
+        return int(read_header(path).get("generation", 0)) + 1
+    except (OSError, ValueError):
+        return 1
+
+
+def read_store(path, mmap=True):
+    """Open a store; sections are zero-copy read-only memory maps by default."""
+    header = read_header(path)
+
+    sections = {}
+    for name, spec in header["sections"].items():
+        shape = tuple(spec["shape"])
+        dtype = np.dtype(spec["dtype"])
+        if int(np.prod(shape)) == 0:
+            sections[name] = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            sections[name] = np.memmap(path, dtype=dtype, mode="r", offset=spec["offset"], shape=shape)
+        else:
+            with open(path, "rb") as f:
+                f.seek(spec["offset"])
+                sections[name] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return EmbeddingStore(path, header, sections)
+
+
+def label_bounds(counts, matrix):
+    """Per-label unit centroid and per-template spread around it.
+
+    ``spreads[t]`` is the Euclidean distance from template ``t`` to its
+    label's centroid. Together they bound any template's cosine distance to
+    a probe from the probe's distance to the centroid alone.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if not len(counts):
+        return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    centroids = np.add.reduceat(matrix, starts, axis=0)
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    row_labels = np.repeat(np.arange(len(counts)), counts)
+    spreads = np.linalg.norm(matrix - centroids[row_labels], axis=1)
+    return centroids.astype(np.float32), spreads.astype(np.float32)
+
+
+def _genuine_spread(rows):
+    if len(rows) < 2:
+        return np.nan
+    sims = rows @ rows.T
+    return 1.0 - float(sims[np.triu_indices(len(rows), k=1)].min())
+
+
+def thresholds_from_stats(genuine, impostor):
+    floor = np.fmax(np.asarray(genuine) + GENUINE_MARGIN, THRESHOLD_FLOOR)
+    return np.maximum(np.asarray(impostor) - IMPOSTOR_MARGIN, floor).astype(np.float32)
+
+
+def identity_stats(counts, matrix, centroids=None):
+    """Per-label genuine spread and nearest impostor distance.
+
+    ``genuine[i]`` is the widest distance between two of label ``i``'s
+    templates (NaN with a single template) and ``impostor[i]`` the closest
+    any of its templates comes to another label's, searched among the
+    NEIGHBOR_LABELS labels with the nearest centroids (``inf`` when there is
+    no other label).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total = len(counts)
+    genuine = np.full(total, np.nan, dtype=np.float32)
+    impostor = np.full(total, np.inf, dtype=np.float32)
+    if not total:
+        return genuine, impostor
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if centroids is None:
+        centroids, _ = label_bounds(counts, matrix)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    width = min(NEIGHBOR_LABELS, total - 1)
+    neighbors = np.zeros((total, 0), dtype=np.int64)
+    if width > 0:
+        neighbors = np.empty((total, width), dtype=np.int64)
+        for start in range(0, total, CENTROID_BLOCK):
+            stop = min(start + CENTROID_BLOCK, total)
+            sims = centroids[start:stop] @ centroids.T
+            sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+            neighbors[start:stop] = np.argpartition(sims, total - width, axis=1)[:, total - width:]
+
+    for i in range(total):
+        rows = matrix[offsets[i]:offsets[i + 1]]
+        genuine[i] = _genuine_spread(rows)
+        if width > 0:
+            others = np.concatenate([np.arange(offsets[j], offsets[j + 1]) for j in neighbors[i]])
+            impostor[i] = 1.0 - float((rows @ matrix[others].T).max())
+    return genuine, impostor
+
+
+def patch_identity_stats(counts, matrix, genuine, impostor, changed):
+    """Update identity stats after some labels were added or replaced.
+
+    ``genuine``/``impostor`` hold the previous values aligned with the new
+    labels; ``changed`` marks labels whose templates are new. Changed labels
+    are searched exactly against every template. Other labels keep their
+    spread and can only get a closer impostor from the new templates; a
+    removed neighbor leaves their threshold conservatively tight until the
+    next full build.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    genuine = np.array(genuine, dtype=np.float32)
+    impostor = np.array(impostor, dtype=np.float32)
+    changed = np.asarray(changed, dtype=bool)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    row_labels = np.repeat(np.arange(len(counts)), counts)
+
+    best_changed = np.full(len(counts), -np.inf, dtype=np.float32)
+    best_other = np.full(len(counts), -np.inf, dtype=np.float32)
+    changed_rows = np.flatnonzero(changed[row_labels])
+    step = max(1, CENTROID_BLOCK * 256 // max(len(matrix), 1))
+    for start in range(0, len(changed_rows), step):
+        chunk = changed_rows[start:start + step]
+        sims = matrix[chunk] @ matrix.T
+        sims[row_labels[chunk][:, None] == row_labels[None, :]] = -np.inf
+        np.maximum.at(best_changed, row_labels[chunk], sims.max(axis=1))
+        np.maximum.at(best_other, row_labels, sims.max(axis=0))
+
+    for i in np.flatnonzero(changed):
+        genuine[i] = _genuine_spread(matrix[offsets[i]:offsets[i + 1]])
+    impostor = np.where(changed, 1.0 - best_changed, np.minimum(impostor, 1.0 - best_other))
+    return genuine, impostor.astype(np.float32)
+
+
+def write_store(path, labels, counts, matrix, extra_sections=None, generation=None, stats=None):
+    """Atomically write a store (temp file in the same directory, then rename).
+
+    Every write publishes a new generation, one past the replaced file's
+    unless given explicitly, so readers can tell galleries apart. Per-label
+    ``(genuine, impostor)`` stats are computed unless passed in ``stats``;
+    they are stored with the thresholds derived from them.
+    """
+    path = Path(path)
+    if generation is None:
+        generation = next_generation(path)
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    centroids, spreads = label_bounds(counts, matrix)
+    genuine, impostor = stats if stats is not None else identity_stats(counts, matrix, centroids)
+    arrays = {
+        "templates": matrix,
+        "centroids": centroids,
+        "spreads": spreads,
+        "genuine_spread": np.asarray(genuine, dtype=np.float32),
+        "nearest_impostor": np.asarray(impostor, dtype=np.float32),
+        "thresholds": thresholds_from_stats(genuine, impostor),
+    }
+    for name, array in (extra_sections or {}).items():
+        arrays[name] = np.ascontiguousarray(array)
+
+    directory = {}
+    for name, array in arrays.items():
+        directory[name] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+    header = {
+        "version": FORMAT_VERSION,
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "labels": list(labels),
+        "counts": [int(c) for c in counts],
+        "generation": int(generation),
+        "sections": directory,
+    }
+
+    # Section offsets depend on the header length, so size the header with
+    # placeholder offsets wide enough for any file this format can describe.
+    for spec in directory.values():
+        spec["offset"] = 10 ** 15
+    header_len = len(json.dumps(header).encode("utf-8"))
+    cursor = _aligned(_PREAMBLE.size + header_len)
+    for name, array in arrays.items():
+        directory[name]["offset"] = cursor
+        cursor = _aligned(cursor + array.nbytes)
+    encoded = json.dumps(header).encode("utf-8").ljust(header_len)
+
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_len))
+            f.write(encoded)
+            for name, array in arrays.items():
+                f.seek(directory[name]["offset"])
+                f.write(array.tobytes())
+            f.truncate(cursor)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return path
+
+
+def pack_database(raw_database):
+    """Flatten ``{label: [embedding, ...]}`` into ``(labels, counts, matrix)``.
+
+    Labels keep their dict order, empty templates are dropped and every row
+    is L2-normalized.
+    """
+    labels = []
+    counts = []
+    rows = []
+    for label, templates in raw_database.items():
+        cleaned = []
+        for emb in templates:
+            arr = np.asarray(emb, dtype=np.float32).reshape(-1)
+            if arr.size == 0:
+                continue
+            norm = np.linalg.norm(arr)
+            cleaned.append(arr / norm if norm > 1e-12 else arr)
+        if cleaned:
+            labels.append(label)
+            counts.append(len(cleaned))
+            rows.extend(cleaned)
+    matrix = np.vstack(rows).astype(np.float32) if rows else np.zeros((0, 0), dtype=np.float32)
+    return labels, counts, matrix
+
+
+def write_database(path, raw_database, extra_sections=None, generation=None):
+    labels, counts, matrix = pack_database(raw_database)
+    return write_store(path, labels, counts, matrix, extra_sections, generation)
+
+
+def load_gallery(path):
+    """Return ``(labels, counts, matrix)`` from a store or a legacy pickle."""
+    if is_store(path):
+        store = read_store(path)
+        return store.labels, store.counts, store.matrix
+    with open(path, "rb") as f:
+        return pack_database(pickle.load(f))
+
+
+def write_pickle(path, raw_database):
+    """Write the legacy ``label -> templates`` pickle read by older tools.
+
+    Write it after the store: the server only reads the store, so the
+    pickle is a copy for tools that have not moved to it.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(raw_database, f)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def convert_pickle(pickle_path, store_path):
+    with open(pickle_path, "rb") as f:
+        raw = pickle.load(f)
+    return write_database(store_path, raw)
+
+
+def default_embeddings_path():
+    """The store when present, otherwise the legacy pickle."""
+    return STORE_PATH if STORE_PATH.exists() else PICKLE_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the memory-mapped FaceNet embedding store")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="Convert facenet_embeddings.pkl to the binary store")
+    convert.add_argument("--pickle", default=str(PICKLE_PATH), help="Source embeddings pickle")
+    convert.add_argument("--output", default=str(STORE_PATH), help="Destination store")
+
+    info = commands.add_parser("info", help="Describe a store")
+    info.add_argument("path", nargs="?", default=str(STORE_PATH))
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        path = convert_pickle(Path(args.pickle), Path(args.output))
+        store = read_store(path)
+        print(f"[SUCCESS] Wrote {len(store.labels)} identities / {len(store.matrix)} templates to {path}")
+        return
+
+    store = read_store(Path(args.path))
+    print(f"Format version : {store.header['version']}")
+    print(f"Generation     : {store.generation}")
+    print(f"Identities     : {len(store.labels)}")
+    print(f"Templates      : {len(store.matrix)} x {store.header['dim']}")
+    for name, spec in store.header["sections"].items():
+        print(f"Section {name:<8}: {spec['dtype']} {tuple(spec['shape'])} @ {spec['offset']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import argparse
+from pathlib import Path
+
+try:
+    from facenet_encoder import FACE_SIZE, FACENET_MODEL_KEY, ONNX_MODEL_PATH
+except ImportError:
+    from face_recognition.facenet_encoder import FACE_SIZE, FACENET_MODEL_KEY, ONNX_MODEL_PATH
+
+OPSET = 13
+
+
+def export(output_path, opset=OPSET):
+    """Write the keras_facenet graph to ``output_path`` as ONNX (NHWC input)."""
+    import tensorflow as tf
+    import tf2onnx
+    from keras_facenet import FaceNet
+
+    model = FaceNet(key=FACENET_MODEL_KEY).model
+    signature = [tf.TensorSpec((None, FACE_SIZE[1], FACE_SIZE[0], 3), tf.float32, name="input")]
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset, output_path=str(tmp_path))
+    tmp_path.replace(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export the FaceNet model for the onnx/opencv backends.",
+        epilog="Needs the packages in crime_project/requirements-dev.txt.",
+    )
+    parser.add_argument("--output", type=Path, default=ONNX_MODEL_PATH)
+    parser.add_argument("--opset", type=int, default=OPSET)
+    args = parser.parse_args()
+
+    print(f"[INFO] Exporting FaceNet {FACENET_MODEL_KEY} to {args.output}")
+    export(args.output, args.opset)
+    size_mb = args.output.stat().st_size / (1024 * 1024)
+    print(f"[SUCCESS] Wrote {args.output} ({size_mb:.1f} MB)")
+    print("[INFO] Check it with: python compare_embedding_backends.py --backends keras onnx opencv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import os
+import threading
+from pathlib import Path
+import cv2
+
+try:
+    from facenet_encoder import (
+        detection_corners,
+        detection_from_corners,
+        downscale_for_detection,
+        get_detector,
+        mtcnn_faces,
+        scale_detection,
+    )
+except ImportError:
+    from face_recognition.facenet_encoder import (
+        detection_corners,
+        detection_from_corners,
+        downscale_for_detection,
+        get_detector,
+        mtcnn_faces,
+        scale_detection,
+    )
+
+FACE_DETECTION_CONFIDENCE = 0.35
+MIN_BOX_SIZE = 40
+LANDMARK_NAMES = ("left_eye", "right_eye", "nose", "mouth_left", "mouth_right")
+HAAR_CASCADE_NAME = "haarcascade_frontalface_default.xml"
+
+
+def load_haar_cascade():
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + HAAR_CASCADE_NAME)
+    if cascade.empty():
+        raise RuntimeError(f"Could not load {HAAR_CASCADE_NAME}")
+    return cascade
+
+
+def detect_haar(cascade, frame, scale=1.0, max_side=None):
+    """Haar boxes in original coordinates; see ``FaceDetector.detect`` for ``scale``."""
+    small, own_scale = downscale_for_detection(frame, max_side)
+    total_scale = scale * own_scale
+    min_size = max(1, round(MIN_BOX_SIZE * total_scale))
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size))
+    return [
+        (round(x / total_scale), round(y / total_scale), round((x + w) / total_scale), round((y + h) / total_scale))
+        for (x, y, w, h) in faces
+    ]
+
+
+class FaceDetector:
+    def __init__(self):
+        self.mode = "NONE"
+        self.model = None
+        # Ultralytics predictors keep per-call state and are not thread-safe.
+        self._yolo_lock = threading.Lock()
+        self.mtcnn = self._load_mtcnn()
+        self._init_yolo()
+
+    @staticmethod
+    def _load_mtcnn():
+        # Shares the encoder's MTCNN instead of loading a second copy.
+        try:
+            return get_detector()
+        except Exception:
+            return None
+
+    def _candidate_model_paths(self):
+        models = Path(__file__).resolve().parent / "models"
+        from_env = os.environ.get("YOLO_FACE_MODEL", "").strip()
+        defaults = [
+            models / "yolov8n-face.pt",
+            models / "yolov8n-face.onnx",
+            models / "yolov11n-face.pt",
+            models / "yolov11n-face.onnx",
+        ]
+        candidates = [Path(from_env)] if from_env else []
+        candidates.extend(defaults)
+        return [p for p in candidates if p.exists()]
+
+    def _init_yolo(self):
+        model_paths = self._candidate_model_paths()
+        if not model_paths:
+            return
+        try:
+            from ultralytics import YOLO
+        except Exception:
+            return
+
+        for model_path in model_paths:
+            try:
+                self.model = YOLO(str(model_path))
+                self.mode = "YOLO"
+                print(f"[INFO] YOLO face detector loaded: {model_path}")
+                return
+            except Exception:
+                continue
+
+    def detect(self, frame, scale=1.0, max_side=None):
+        """Faces in ``frame`` as MTCNN-style dicts with box, confidence and keypoints.
+
+        ``keypoints`` (eyes, nose, mouth corners) is None when the model
+        gives no landmarks; the encoder then crops without aligning.
+
+        The detector runs on a copy shrunk to ``max_side`` (default
+        DETECT_MAX_SIDE) and the boxes come back in full-resolution
+        coordinates. ``scale`` says how much ``frame`` itself was already
+        shrunk (``read_for_detection``), so results are in the original
+        image's coordinates either way.
+        """
+        small, own_scale = downscale_for_detection(frame, max_side)
+        total_scale = scale * own_scale
+        # MIN_BOX_SIZE is in original pixels.
+        min_size = MIN_BOX_SIZE * total_scale
+        if self.mode == "YOLO" and self.model is not None:
+            detections = self._detect_with_yolo(small, min_size)
+        elif self.mtcnn is not None:
+            detections = self._detect_with_mtcnn(small, min_size)
+        else:
+            return []
+        if total_scale != 1.0:
+            detections = [scale_detection(detection, total_scale) for detection in detections]
+        return detections
+
+    def detect_faces(self, frame):
+        return [detection_corners(detection) for detection in self.detect(frame)]
+
+    def _detect_with_yolo(self, frame, min_size=MIN_BOX_SIZE):
+        detections = []
+        try:
+            with self._yolo_lock:
+                results = self.model(frame, verbose=False)
+        except Exception:
+            return detections
+
+        if not results:
+            return detections
+
+        yolo_result = results[0]
+        if yolo_result.boxes is None:
+            return detections
+
+        # Face models trained with landmarks (yolov8n-face) return five
+        # points per box in the same order as MTCNN's keypoints.
+        landmarks = None
+        if getattr(yolo_result, "keypoints", None) is not None and yolo_result.keypoints.xy is not None:
+            landmarks = yolo_result.keypoints.xy.tolist()
+
+        for index, box in enumerate(yolo_result.boxes):
+            conf = float(box.conf[0]) if box.conf is not None else 0.0
+            if conf < FACE_DETECTION_CONFIDENCE:
+                continue
+            x1, y1, x2, y2 = box.xyxy[0].tolist()
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = max(0, int(x2)), max(0, int(y2))
+            if (x2 - x1) < min_size or (y2 - y1) < min_size:
+                continue
+            keypoints = None
+            if landmarks is not None and len(landmarks[index]) >= 5:
+                keypoints = {name: tuple(point) for name, point in zip(LANDMARK_NAMES, landmarks[index])}
+            detections.append(detection_from_corners(x1, y1, x2, y2, conf, keypoints))
+        return detections
+
+    def _detect_with_mtcnn(self, frame, min_size=MIN_BOX_SIZE):
+        detections = []
+        try:
+            results = mtcnn_faces(frame)
+        except Exception:
+            return detections
+
+        for face in results:
+            x, y, w, h = face["box"]
+            x, y = max(0, int(x)), max(0, int(y))
+            w, h = int(w), int(h)
+            if w < min_size or h < min_size:
+                continue
+            detections.append(
+                detection_from_corners(x, y, x + w, y + h, float(face.get("confidence", 0.0)), face.get("keypoints"))
+            )
+        return detections
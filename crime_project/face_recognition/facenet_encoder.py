@@ -1,11 +1,37 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+from pathlib import Path
 import cv2
 import numpy as np
-from mtcnn.mtcnn import MTCNN
-from keras_facenet import FaceNet
 
-# Initialize models once.
-detector = MTCNN()
-embedder = FaceNet()
+try:
+    from runtime_config import thread_budget
+except ImportError:
+    from face_recognition.runtime_config import thread_budget
+
+FACENET_MODEL_KEY = "20180402-114759"
+# "keras" runs keras_facenet on TensorFlow; "onnx" (ONNX Runtime) and
+# "opencv" (cv2.dnn) run the graph exported by export_facenet_onnx.py, and
+# "onnx-int8" runs the INT8 model written by quantize_facenet.py.
+EMBEDDING_BACKENDS = ("keras", "onnx", "opencv", "onnx-int8")
+EMBEDDING_BACKEND = os.environ.get("FACENET_BACKEND", "keras").strip().lower()
+ONNX_MODEL_PATH = Path(
+    os.environ.get("FACENET_ONNX_MODEL", Path(__file__).resolve().parent / "facenet.onnx")
+)
+ONNX_INT8_MODEL_PATH = Path(
+    os.environ.get("FACENET_ONNX_INT8_MODEL", Path(__file__).resolve().parent / "facenet_int8.onnx")
+)
+# Bump when preprocessing changes in a way that alters embeddings or meta.
+ENCODER_VERSION = 1
+
+# Models are created on first use (or by warmup()), not at import, so
+# processes that never embed a face never start TensorFlow.
+_MODEL_LOCK = threading.Lock()
+_detector = None
+_embedder = None
 
 FACE_SIZE = (160, 160)
 MIN_FACE_SIZE = 60
@@ -17,12 +43,153 @@ RELAXED_MIN_LAPLACIAN_VAR = 35.0
 MAX_ROLL_ANGLE = 30.0
 BOX_MARGIN_RATIO = 0.18
 
+# Detectors see frames shrunk to at most this many pixels on the long side
+# (0 keeps full size); boxes are mapped back and faces are still cropped
+# from the full-resolution frame. benchmark_detection_size.py shows the
+# speed and recall at each size.
+DETECT_MAX_SIDE = max(0, int(os.environ.get("FACE_DETECT_MAX_SIDE", "1280")))
+_REDUCED_READ_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# Cheap first-stage quality check on a GATE_SIZE grayscale thumbnail, run
+# before alignment so clearly unusable crops never reach FaceNet. Thumbnail
+# sharpness is compared against GATE_SHARPNESS_RATIO times the full-size
+# limit; at 1.0 it rejected none of the dataset/ crops (and blurred or
+# darkened copies of them) that the full check passed.
+QUALITY_GATE = os.environ.get("FACENET_QUALITY_GATE", "1").strip().lower() not in {"0", "false", "no"}
+GATE_SIZE = 96
+GATE_SHARPNESS_RATIO = 1.0
+GATE_BRIGHTNESS_MARGIN = 2.0
+
+_QUALITY_STATS_LOCK = threading.Lock()
+QUALITY_STATS = {"gated": 0, "gate_rejected": 0, "too_dark": 0, "too_bright": 0, "blurry": 0, "late_low_quality": 0}
+
+
+def get_detector():
+    """This process's MTCNN detector, created on first use.
+
+    Web workers with FACENET_INFERENCE_SOCKET set detect through the
+    inference server and only create it if they fall back to local work.
+    """
+    global _detector
+    if _detector is None:
+        with _MODEL_LOCK:
+            if _detector is None:
+                from mtcnn.mtcnn import MTCNN
+
+                _detector = MTCNN()
+    return _detector
+
+
+def _standardize(batch):
+    """Per-image standardization, the preprocessing keras_facenet applies."""
+    batch = batch.astype(np.float32)
+    mean = batch.mean(axis=(1, 2, 3), keepdims=True)
+    std = batch.std(axis=(1, 2, 3), keepdims=True)
+    return (batch - mean) / np.maximum(std, 1.0 / float(np.sqrt(batch[0].size)))
+
+
+class OnnxRuntimeEmbedder:
+    """The exported FaceNet graph on ONNX Runtime's CPU provider.
+
+    onnxruntime is an optional dependency: install requirements-onnx.txt.
+    """
+
+    def __init__(self, model_path, budgeted=True):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        # Unbudgeted sessions keep ONNX Runtime's own defaults (all cores);
+        # benchmark_concurrency.py uses one as its baseline.
+        if budgeted:
+            budget = thread_budget()
+            options.intra_op_num_threads = budget["intra_op"]
+            options.inter_op_num_threads = budget["inter_op"]
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # tf2onnx keeps Keras' NHWC layout; accept NCHW exports as well.
+        self.channels_first = len(model_input.shape) == 4 and model_input.shape[1] == 3
+
+    def embeddings(self, images):
+        batch = _standardize(np.asarray(images))
+        if self.channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch)})[0]
+
+
+class OpenCVEmbedder:
+    """The exported FaceNet graph on OpenCV's DNN module.
+
+    A cv2.dnn Net is not safe to run from two threads at once, hence the lock.
+    """
+
+    def __init__(self, model_path):
+        self.net = cv2.dnn.readNetFromONNX(str(model_path))
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.lock = threading.Lock()
+
+    def embeddings(self, images):
+        batch = np.ascontiguousarray(_standardize(np.asarray(images)))
+        with self.lock:
+            self.net.setInput(batch)
+            return np.array(self.net.forward())
+
+
+def load_embedder(backend=None, model_path=None, budgeted=True):
+    """Build a fresh embedder for ``backend`` (default FACENET_BACKEND).
+
+    ``budgeted=False`` leaves ONNX Runtime sessions at the library's own
+    thread counts instead of the runtime_config budget.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown FACENET_BACKEND {backend!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    if backend == "keras":
+        from keras_facenet import FaceNet
+
+        return FaceNet(key=FACENET_MODEL_KEY)
+
+    if backend == "onnx-int8":
+        model_path = Path(model_path or ONNX_INT8_MODEL_PATH)
+        if not model_path.exists():
+            raise FileNotFoundError(f"{model_path} not found; run quantize_facenet.py first")
+        return OnnxRuntimeEmbedder(model_path, budgeted)
 
-def _l2_normalize(vec):
-    norm = np.linalg.norm(vec)
-    if norm <= 1e-12:
-        return vec
-    return vec / norm
+    model_path = Path(model_path or ONNX_MODEL_PATH)
+    if not model_path.exists():
+        raise FileNotFoundError(f"{model_path} not found; run export_facenet_onnx.py first")
+    if backend == "onnx":
+        return OnnxRuntimeEmbedder(model_path, budgeted)
+    return OpenCVEmbedder(model_path)
+
+
+def get_embedder():
+    """The process-wide FaceNet embedder, created on first use."""
+    global _embedder
+    if _embedder is None:
+        with _MODEL_LOCK:
+            if _embedder is None:
+                _embedder = load_embedder()
+    return _embedder
+
+
+def mtcnn_faces(frame):
+    """MTCNN results for a BGR frame; MTCNN itself expects RGB."""
+    return get_detector().detect_faces(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+def warmup():
+    """Load both models and run one pass through each.
+
+    Meant for web workers at boot, so the first recognition request does not
+    pay for model loading and graph tracing.
+    """
+    blank = np.zeros((FACE_SIZE[1], FACE_SIZE[0], 3), dtype=np.uint8)
+    get_detector().detect_faces(blank)
+    get_embedder().embeddings(blank[None, ...])
 
 
 def _largest_face(results):
@@ -116,77 +283,350 @@ def _quality_metrics(face_crop, relaxed=False):
     }
 
 
-def get_face_embedding(frame, return_meta=False, assume_cropped=False, relaxed_quality=False):
+def quality_gate(crops, relaxed=False):
+    """Cheap quality verdicts for a batch of BGR crops.
+
+    Crops larger than GATE_SIZE are shrunk to a GATE_SIZE grayscale
+    thumbnail with INTER_AREA; smaller ones are scored at their own size.
+    Shrinking only ever raises the Laplacian variance, so the gate stays
+    more lenient than the full check, whereas enlarging a small crop would
+    smooth it and reject faces the full check accepts. Returns
+    ``(reasons, brightness, sharpness)``: ``reasons[i]`` is None when crop
+    ``i`` should go on to the full check, else ``"too_dark"``,
+    ``"too_bright"`` or ``"blurry"``.
+    """
+    brightness = np.empty(len(crops))
+    sharpness = np.empty(len(crops))
+    for index, crop in enumerate(crops):
+        height, width = crop.shape[:2]
+        size = (min(GATE_SIZE, width), min(GATE_SIZE, height))
+        if size != (width, height):
+            crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+        thumb = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        brightness[index] = float(np.mean(thumb))
+        sharpness[index] = float(cv2.Laplacian(thumb, cv2.CV_64F).var())
+
+    min_laplacian_var = RELAXED_MIN_LAPLACIAN_VAR if relaxed else MIN_LAPLACIAN_VAR
+    reasons = [None] * len(crops)
+    for index in np.flatnonzero(sharpness < GATE_SHARPNESS_RATIO * min_laplacian_var):
+        reasons[index] = "blurry"
+    for index in np.flatnonzero(brightness > MAX_BRIGHTNESS + GATE_BRIGHTNESS_MARGIN):
+        reasons[index] = "too_bright"
+    for index in np.flatnonzero(brightness < MIN_BRIGHTNESS - GATE_BRIGHTNESS_MARGIN):
+        reasons[index] = "too_dark"
+    return reasons, brightness, sharpness
+
+
+def quality_stats():
+    """Counts of crops seen by the gate and what it turned away.
+
+    ``gate_rejected`` is the alignment and embedding work saved;
+    ``late_low_quality`` counts crops the gate let through that the full
+    check still rejected.
+    """
+    with _QUALITY_STATS_LOCK:
+        stats = dict(QUALITY_STATS)
+    stats["gate_reject_rate"] = stats["gate_rejected"] / stats["gated"] if stats["gated"] else 0.0
+    return stats
+
+
+def detection_from_corners(x1, y1, x2, y2, confidence=None, keypoints=None):
+    """A detector result in MTCNN's format: ``box`` is ``[x, y, w, h]``."""
+    return {
+        "box": [int(x1), int(y1), int(x2) - int(x1), int(y2) - int(y1)],
+        "confidence": confidence,
+        "keypoints": keypoints,
+    }
+
+
+def detection_corners(detection):
+    x, y, w, h = (int(value) for value in detection["box"])
+    return x, y, x + w, y + h
+
+
+def scale_detection(detection, scale):
+    """``detection`` found on a frame shrunk by ``scale``, in full-frame coordinates."""
+    x1, y1, x2, y2 = detection_corners(detection)
+    keypoints = detection.get("keypoints")
+    if keypoints:
+        keypoints = {name: (float(x) / scale, float(y) / scale) for name, (x, y) in keypoints.items()}
+    scaled = dict(detection)
+    scaled.update(
+        detection_from_corners(
+            round(x1 / scale), round(y1 / scale), round(x2 / scale), round(y2 / scale),
+            detection.get("confidence"), keypoints,
+        )
+    )
+    return scaled
+
+
+def downscale_for_detection(frame, max_side=None):
+    """``(small_frame, scale)`` with the long side at most ``max_side``."""
+    max_side = DETECT_MAX_SIDE if max_side is None else max_side
+    longest = max(frame.shape[:2])
+    if not max_side or longest <= max_side:
+        return frame, 1.0
+    scale = max_side / float(longest)
+    size = (max(1, round(frame.shape[1] * scale)), max(1, round(frame.shape[0] * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), scale
+
+
+def _image_size(path):
+    """``(width, height)`` from a JPEG or PNG header, None for anything else."""
+    try:
+        with open(path, "rb") as handle:
+            head = handle.read(24)
+            if head.startswith(b"\x89PNG\r\n\x1a\n"):
+                return struct.unpack(">II", head[16:24])
+            if not head.startswith(b"\xff\xd8"):
+                return None
+            handle.seek(2)
+            while True:
+                marker = handle.read(2)
+                while marker[1:] == b"\xff":
+                    marker = marker[1:] + handle.read(1)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                code = marker[1]
+                if code == 0x01 or 0xD0 <= code <= 0xD8:
+                    continue
+                (length,) = struct.unpack(">H", handle.read(2))
+                # Start-of-frame markers; C4, C8 and CC share the range but are not frames.
+                if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">xHH", handle.read(5))
+                    return width, height
+                handle.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+
+def read_for_detection(path, max_side=None):
+    """Decode an image only as large as detection needs: ``(image, scale)``.
+
+    Huge stills are decoded with IMREAD_REDUCED_COLOR_*, so the full-size
+    bitmap is never held. ``scale`` is image pixels per original pixel;
+    ``(None, 1.0)`` when the file cannot be read.
+    """
+    max_side = DETECT_MAX_SIDE if max_side is None else max_side
+    size = _image_size(path) if max_side else None
+    flag, factor = cv2.IMREAD_COLOR, 1
+    if size is not None:
+        for candidate, reduced_flag in _REDUCED_READ_FLAGS:
+            if max(size) / candidate >= max_side:
+                flag, factor = reduced_flag, candidate
+                break
+    image = cv2.imread(str(path), flag)
+    if image is None:
+        return None, 1.0
+    image, scale = downscale_for_detection(image, max_side)
+    return image, scale / factor
+
+
+def _crop_detection(frame, face_item, min_size):
+    x, y, w, h = face_item["box"]
+    if int(w) < min_size or int(h) < min_size:
+        return None, None, None, {"reason": "face_too_small"}
+
+    face_crop, crop_origin = _extract_face_with_margin(frame, face_item["box"])
+    if face_crop is None:
+        return None, None, None, {"reason": "invalid_crop"}
+    return face_crop, face_item.get("keypoints"), crop_origin, {}
+
+
+def _locate_face(frame, assume_cropped=False):
+    """Find the face to embed without aligning it yet.
+
+    Returns ``(face_crop, keypoints, crop_origin, meta)``; ``face_crop`` is
+    None when there is nothing usable and ``meta["reason"]`` says why.
+    """
     if assume_cropped:
-        face_crop = frame
-        roll_angle = 0.0
-        h, w = face_crop.shape[:2]
+        h, w = frame.shape[:2]
         if w < MIN_FACE_SIZE_CROPPED or h < MIN_FACE_SIZE_CROPPED:
-            if return_meta:
-                return None, {"reason": "face_too_small", "assume_cropped": True}
-            return None
-        aligned_face = face_crop
+            return None, None, None, {"reason": "face_too_small", "assume_cropped": True}
+        return frame, None, None, {}
+
+    try:
+        results = mtcnn_faces(frame)
+    except Exception:
+        return None, None, None, {"reason": "detector_error"}
+
+    face_item = _largest_face(results)
+    if not face_item:
+        return None, None, None, {"reason": "no_face"}
+    return _crop_detection(frame, face_item, MIN_FACE_SIZE)
+
+
+def _finish_face(face_crop, keypoints, crop_origin, assume_cropped=False, relaxed_quality=False):
+    """Align a located face and run the full-resolution quality check."""
+    if assume_cropped:
+        aligned_face, roll_angle = face_crop, 0.0
     else:
-        try:
-            results = detector.detect_faces(frame)
-        except Exception:
-            if return_meta:
-                return None, {"reason": "detector_error"}
-            return None
-
-        face_item = _largest_face(results)
-        if not face_item:
-            if return_meta:
-                return None, {"reason": "no_face"}
-            return None
-
-        x, y, w, h = face_item["box"]
-        if int(w) < MIN_FACE_SIZE or int(h) < MIN_FACE_SIZE:
-            if return_meta:
-                return None, {"reason": "face_too_small"}
-            return None
-
-        face_crop, crop_origin = _extract_face_with_margin(frame, face_item["box"])
-        if face_crop is None:
-            if return_meta:
-                return None, {"reason": "invalid_crop"}
-            return None
-
-        aligned_face, roll_angle = _align_face_by_eyes(face_crop, face_item.get("keypoints"), crop_origin)
+        aligned_face, roll_angle = _align_face_by_eyes(face_crop, keypoints, crop_origin)
         if aligned_face is None:
-            if return_meta:
-                return None, {"reason": "pose_roll_too_high", "roll_angle": roll_angle}
-            return None
+            return None, {"reason": "pose_roll_too_high", "roll_angle": roll_angle}
 
     quality_ok, quality_info = _quality_metrics(aligned_face, relaxed=relaxed_quality)
+    meta = {
+        "reason": "ok" if quality_ok else "low_quality",
+        "roll_angle": roll_angle,
+        "assume_cropped": bool(assume_cropped),
+    }
+    meta.update(quality_info)
     if not quality_ok:
-        if return_meta:
-            meta = {
+        return None, meta
+    return aligned_face, meta
+
+
+def _prepare_located(located, assume_cropped=False, relaxed_quality=False):
+    """Gate, align and quality-check located faces ahead of embedding.
+
+    Returns one ``(aligned_face, meta)`` per located face; ``aligned_face``
+    is None when the face was rejected and ``meta["reason"]`` says why.
+    """
+    output = [(None, meta) for _, _, _, meta in located]
+    pending = [index for index, (crop, _, _, _) in enumerate(located) if crop is not None]
+    if not pending:
+        return output
+
+    if QUALITY_GATE:
+        reasons, brightness, sharpness = quality_gate([located[index][0] for index in pending], relaxed_quality)
+        passed = []
+        for row, index in enumerate(pending):
+            if reasons[row] is None:
+                passed.append(index)
+                continue
+            output[index] = (None, {
                 "reason": "low_quality",
-                "roll_angle": roll_angle,
+                "gate": reasons[row],
+                "brightness": float(brightness[row]),
+                "sharpness": float(sharpness[row]),
+                "quality_score": 0.0,
                 "assume_cropped": bool(assume_cropped),
-            }
-            meta.update(quality_info)
-            return None, meta
-        return None
+            })
+        with _QUALITY_STATS_LOCK:
+            QUALITY_STATS["gated"] += len(pending)
+            QUALITY_STATS["gate_rejected"] += len(pending) - len(passed)
+            for reason in reasons:
+                if reason is not None:
+                    QUALITY_STATS[reason] += 1
+        pending = passed
+
+    late = 0
+    for index in pending:
+        crop, keypoints, crop_origin, _ = located[index]
+        output[index] = _finish_face(crop, keypoints, crop_origin, assume_cropped, relaxed_quality)
+        late += output[index][1]["reason"] == "low_quality"
+    if QUALITY_GATE and late:
+        with _QUALITY_STATS_LOCK:
+            QUALITY_STATS["late_low_quality"] += late
+    return output
+
+
+def _prepare_faces(frames, assume_cropped=False, relaxed_quality=False):
+    """Detect, gate, align and quality-check the largest face of each frame."""
+    return _prepare_located([_locate_face(frame, assume_cropped) for frame in frames], assume_cropped, relaxed_quality)
+
+
+def _prepare_face(frame, assume_cropped=False, relaxed_quality=False):
+    return _prepare_faces([frame], assume_cropped, relaxed_quality)[0]
+
+
+def prepare_detections(frame, detections, relaxed_quality=False):
+    """Crop and align faces another detector already found in ``frame``.
+
+    ``detections`` are MTCNN-style dicts (see ``detection_from_corners``).
+    Crops get the same margin as enrolment crops and are aligned on their
+    ``keypoints`` when the detector gave any, so no second detection pass
+    runs. Returns one ``(aligned_face, meta)`` per detection.
+    """
+    located = [_crop_detection(frame, detection, MIN_FACE_SIZE_CROPPED) for detection in detections]
+    return _prepare_located(located, relaxed_quality=relaxed_quality)
+
+
+def face_batch(faces):
+    """Stack aligned BGR face crops into the RGB batch the embedders take."""
+    return np.stack(
+        [
+            cv2.cvtColor(cv2.resize(face, FACE_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+            for face in faces
+        ]
+    )
+
+
+def embed_aligned_faces(faces):
+    """L2-normalized embeddings of already aligned, accepted face crops."""
+    embeddings = np.asarray(get_embedder().embeddings(face_batch(faces)), dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def get_face_embeddings(frames, assume_cropped=False, relaxed_quality=False):
+    """Embed many faces with a single FaceNet forward pass.
+
+    Every frame is prepared and quality-checked first; the survivors are
+    embedded together. Returns a list of ``(embedding, meta)`` pairs in input
+    order, with ``embedding`` None for rejected faces.
+    """
+    return embed_prepared(_prepare_faces(frames, assume_cropped, relaxed_quality))
+
+
+def embed_prepared(results, embed=None):
+    """Embed the accepted faces of ``(aligned_face, meta)`` pairs in one pass.
+
+    ``embed`` maps a list of aligned faces to their embeddings; the local
+    FaceNet model by default.
+    """
+    accepted = [index for index, (face, _) in enumerate(results) if face is not None]
+    output = [(None, meta) for _, meta in results]
+    if not accepted:
+        return output
 
     try:
-        face = cv2.resize(aligned_face, FACE_SIZE, interpolation=cv2.INTER_AREA)
-        face = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
-        face = np.expand_dims(face, axis=0)
-        embedding = embedder.embeddings(face)[0]
-        embedding = _l2_normalize(embedding)
+        embeddings = (embed or embed_aligned_faces)([results[index][0] for index in accepted])
     except Exception:
-        if return_meta:
-            return None, {"reason": "embedding_error"}
-        return None
+        for index in accepted:
+            output[index] = (None, {"reason": "embedding_error"})
+        return output
+
+    for row, index in enumerate(accepted):
+        output[index] = (embeddings[row], results[index][1])
+    return output
 
+
+def get_face_embedding(frame, return_meta=False, assume_cropped=False, relaxed_quality=False):
+    embedding, meta = get_face_embeddings(
+        [frame],
+        assume_cropped=assume_cropped,
+        relaxed_quality=relaxed_quality,
+    )[0]
     if return_meta:
-        meta = {
-            "reason": "ok",
-            "roll_angle": roll_angle,
-            "assume_cropped": bool(assume_cropped),
-        }
-        meta.update(quality_info)
         return embedding, meta
     return embedding
+
+
+def _backend_settings():
+    # Keras embeddings hash as before, so caches built before backends were
+    # selectable stay valid.
+    if EMBEDDING_BACKEND == "keras":
+        return {}
+    model_path = ONNX_INT8_MODEL_PATH if EMBEDDING_BACKEND == "onnx-int8" else ONNX_MODEL_PATH
+    return {"backend": EMBEDDING_BACKEND, "onnx_model": model_path.name}
+
+
+def model_fingerprint():
+    """Short hash of every setting that shapes an embedding or its meta."""
+    settings = {
+        "encoder_version": ENCODER_VERSION,
+        "detector": "mtcnn",
+        "model": FACENET_MODEL_KEY,
+        **_backend_settings(),
+        "face_size": FACE_SIZE,
+        "min_face_size": MIN_FACE_SIZE,
+        "min_brightness": MIN_BRIGHTNESS,
+        "max_brightness": MAX_BRIGHTNESS,
+        "min_laplacian_var": MIN_LAPLACIAN_VAR,
+        "max_roll_angle": MAX_ROLL_ANGLE,
+        "box_margin_ratio": BOX_MARGIN_RATIO,
+        "quality_gate": [GATE_SIZE, GATE_SHARPNESS_RATIO, GATE_BRIGHTNESS_MARGIN] if QUALITY_GATE else None,
+    }
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
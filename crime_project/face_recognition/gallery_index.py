@@ -0,0 +1,186 @@
+import hashlib
+import os
+from pathlib import Path
+import numpy as np
+
+INDEX_KINDS = ("exact", "ivf")
+KMEANS_ITERATIONS = 20
+KMEANS_MAX_TRAIN_ROWS = 100000
+ASSIGN_CHUNK_ROWS = 65536
+
+
+def gallery_fingerprint(matrix):
+    """Hash of the packed template matrix; ties an index to one gallery."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    digest = hashlib.sha1()
+    digest.update(np.asarray(matrix.shape, dtype=np.int64).tobytes())
+    # Hash the buffer in place; tobytes() would copy the whole gallery first.
+    digest.update(memoryview(matrix).cast("B"))
+    return digest.hexdigest()
+
+
+def _top_n_rows(sims, n):
+    n = min(n, sims.shape[-1])
+    if n <= 0:
+        return np.zeros(sims.shape[:-1] + (0,), dtype=np.int64)
+    if n < sims.shape[-1]:
+        top = np.argpartition(-sims, n - 1, axis=-1)[..., :n]
+    else:
+        top = np.broadcast_to(np.arange(sims.shape[-1]), sims.shape).copy()
+    order = np.argsort(-np.take_along_axis(sims, top, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(top, order, axis=-1)
+
+
+def _assign_cells(matrix, centroids):
+    assignment = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), ASSIGN_CHUNK_ROWS):
+        chunk = matrix[start:start + ASSIGN_CHUNK_ROWS]
+        assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignment
+
+
+class ExactIndex:
+    """Reference backend: scores every template."""
+
+    kind = "exact"
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def search(self, queries, n):
+        """Return (queries, n) template row ids, best first; -1 pads."""
+        if not len(self.matrix):
+            return np.full((len(queries), 0), -1, dtype=np.int64)
+        return _top_n_rows(queries @ self.matrix.T, n)
+
+
+class IVFIndex:
+    """Inverted-file index over spherical k-means cells.
+
+    Rows of list ``c`` are ``order[list_offsets[c]:list_offsets[c + 1]]``. A
+    search probes the ``nprobe`` closest cells and scores only their rows
+    exactly, so recall is traded for speed through ``nprobe`` alone.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, matrix, centroids, order, list_offsets, nprobe=8, fingerprint=None):
+        self.matrix = matrix
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.order = np.asarray(order, dtype=np.int64)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.nprobe = max(1, int(nprobe))
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, matrix, nlist=None, nprobe=8, seed=42):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        total = len(matrix)
+        if nlist is None:
+            nlist = int(round(4 * np.sqrt(max(total, 1))))
+        rng = np.random.default_rng(seed)
+        train = matrix
+        if total > KMEANS_MAX_TRAIN_ROWS:
+            train = matrix[rng.choice(total, KMEANS_MAX_TRAIN_ROWS, replace=False)]
+        nlist = max(1, min(int(nlist), len(train)))
+
+        centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(train @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, train)
+            counts = np.bincount(assignment, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Reseed empty cells so every list stays usable.
+                sums[empty] = train[rng.choice(len(train), int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        return cls.from_assignment(matrix, centroids, _assign_cells(matrix, centroids), nprobe)
+
+    @classmethod
+    def from_assignment(cls, matrix, centroids, assignment, nprobe=8):
+        """Index ``matrix`` with row ``i`` in cell ``assignment[i]``; no training."""
+        order = np.argsort(assignment, kind="stable")
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=list_offsets[1:])
+        return cls(matrix, centroids, order, list_offsets, nprobe, gallery_fingerprint(matrix))
+
+    def assignments(self):
+        """Cell of every indexed row, in row order."""
+        cells = np.empty(len(self.order), dtype=np.int64)
+        cells[self.order] = np.repeat(np.arange(len(self.centroids)), np.diff(self.list_offsets))
+        return cells
+
+    def assign(self, rows):
+        """Nearest existing cell for each of ``rows``."""
+        return _assign_cells(np.ascontiguousarray(rows, dtype=np.float32), self.centroids)
+
+    def search(self, queries, n):
+        return self.rerank(queries, self.probe(queries), n)
+
+    def probe(self, queries):
+        """The ``nprobe`` closest cells for each query, best first."""
+        nprobe = min(self.nprobe, len(self.centroids))
+        return _top_n_rows(queries @ self.centroids.T, nprobe)
+
+    def rerank(self, queries, cells, n):
+        """Score every row of the probed ``cells`` exactly; top ``n`` row ids, -1 pads."""
+        results = np.full((len(queries), n), -1, dtype=np.int64)
+        for qi, query_cells in enumerate(cells):
+            rows = np.concatenate(
+                [self.order[self.list_offsets[c]:self.list_offsets[c + 1]] for c in query_cells]
+            )
+            if not len(rows):
+                continue
+            best = _top_n_rows(self.matrix[rows] @ queries[qi], n)
+            results[qi, :len(best)] = rows[best]
+        return results
+
+    def save(self, path):
+        # Same temp-then-rename publish as the store, so a serving worker
+        # never loads a half-written index.
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                kind=np.array(self.kind),
+                centroids=self.centroids,
+                order=self.order,
+                list_offsets=self.list_offsets,
+                nprobe=np.array(self.nprobe),
+                fingerprint=np.array(self.fingerprint or ""),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, matrix, nprobe=None):
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["kind"]) != cls.kind:
+                raise ValueError(f"Not an IVF index: {path}")
+            fingerprint = str(data["fingerprint"])
+            if fingerprint != gallery_fingerprint(matrix):
+                raise ValueError(f"Index {path} was built for a different gallery")
+            return cls(
+                matrix,
+                data["centroids"],
+                data["order"],
+                data["list_offsets"],
+                nprobe if nprobe is not None else int(data["nprobe"]),
+                fingerprint,
+            )
+
+
+def recall_at_k(index, reference, queries, k):
+    """Fraction of the reference top-k template rows that ``index`` also returns."""
+    found = index.search(queries, k)
+    expected = reference.search(queries, k)
+    hits = 0
+    total = 0
+    for got, want in zip(found, expected):
+        want = want[want >= 0]
+        hits += len(np.intersect1d(got[got >= 0], want))
+        total += len(want)
+    return hits / total if total else 1.0
@@ -0,0 +1,163 @@
+import json
+import os
+import socket
+import struct
+import threading
+import numpy as np
+
+SOCKET_PATH = os.environ.get("FACENET_INFERENCE_SOCKET", "/tmp/facenet_inference.sock")
+TIMEOUT_SECONDS = float(os.environ.get("FACENET_INFERENCE_TIMEOUT", "10"))
+
+# Every message is a fixed prefix (header length, payload length), a JSON
+# header and a raw payload: uint8 crops or frames going in, float32
+# embeddings out. Detections come back in the JSON header.
+_PREFIX = struct.Struct(">II")
+
+
+class InferenceServerError(RuntimeError):
+    pass
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        chunk = sock.recv_into(view[received:], size - received)
+        if not chunk:
+            if received == 0:
+                return None
+            raise ConnectionError("Connection closed mid-message")
+        received += chunk
+    return buffer
+
+
+def send_message(sock, header, payload=b""):
+    header_bytes = json.dumps(header, default=float).encode("utf-8")
+    sock.sendall(_PREFIX.pack(len(header_bytes), len(payload)) + header_bytes)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    """Return ``(header, payload)``, or None when the peer closed cleanly."""
+    prefix = _recv_exact(sock, _PREFIX.size)
+    if prefix is None:
+        return None
+    header_size, payload_size = _PREFIX.unpack(prefix)
+    header = _recv_exact(sock, header_size)
+    payload = _recv_exact(sock, payload_size) if payload_size else bytearray()
+    if header is None or payload is None:
+        raise ConnectionError("Connection closed mid-message")
+    return json.loads(bytes(header)), payload
+
+
+def pack_frames(frames):
+    """Crops as (shapes, one contiguous uint8 payload)."""
+    arrays = [np.ascontiguousarray(frame, dtype=np.uint8) for frame in frames]
+    return [list(array.shape) for array in arrays], b"".join(array.tobytes() for array in arrays)
+
+
+def unpack_frames(shapes, payload):
+    frames, offset = [], 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        frames.append(np.frombuffer(payload, dtype=np.uint8, count=size, offset=offset).reshape(shape))
+        offset += size
+    return frames
+
+
+class InferenceClient:
+    """Talks to inference_server.py over its Unix socket.
+
+    Each thread keeps one connection open, so concurrent callers reach the
+    server at the same time and land in the same micro-batch.
+    """
+
+    def __init__(self, path=SOCKET_PATH, timeout=TIMEOUT_SECONDS):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _drop_connection(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _call(self, header, payload=b""):
+        # A kept-alive connection may have gone stale when the server
+        # restarted; retry once on a fresh one.
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                send_message(sock, header, payload)
+                reply = recv_message(sock)
+                if reply is None:
+                    raise ConnectionError("Inference server closed the connection")
+                break
+            except TimeoutError:
+                self._drop_connection()
+                raise
+            except OSError:
+                self._drop_connection()
+                if attempt:
+                    raise
+        response, body = reply
+        if "error" in response:
+            raise InferenceServerError(response["error"])
+        return response, body
+
+    def embed(self, frames, assume_cropped=False, relaxed_quality=False):
+        """Same contract as ``facenet_encoder.get_face_embeddings``."""
+        if not len(frames):
+            return []
+        shapes, payload = pack_frames(frames)
+        response, body = self._call(
+            {
+                "op": "embed",
+                "shapes": shapes,
+                "assume_cropped": bool(assume_cropped),
+                "relaxed_quality": bool(relaxed_quality),
+            },
+            payload,
+        )
+        embeddings = np.frombuffer(body, dtype=np.float32).reshape(len(response["rows"]), response["dim"])
+        output = [(None, meta) for meta in response["metas"]]
+        for row, index in enumerate(response["rows"]):
+            output[index] = (embeddings[row].copy(), response["metas"][index])
+        return output
+
+    def embed_aligned(self, faces):
+        """Same contract as ``facenet_encoder.embed_aligned_faces``."""
+        shapes, payload = pack_frames(faces)
+        response, body = self._call({"op": "embed_aligned", "shapes": shapes}, payload)
+        if len(response["rows"]) != len(faces):
+            raise InferenceServerError("Server returned fewer embeddings than faces")
+        return np.frombuffer(body, dtype=np.float32).reshape(len(faces), response["dim"]).copy()
+
+    def detect(self, frame, scale=1.0):
+        """Same contract as ``FaceDetector.detect``, run by the server's detector."""
+        shapes, payload = pack_frames([frame])
+        response, _ = self._call({"op": "detect", "shapes": shapes, "scale": float(scale)}, payload)
+        detections = response["detections"][0]
+        for detection in detections:
+            if detection.get("keypoints"):
+                detection["keypoints"] = {name: tuple(point) for name, point in detection["keypoints"].items()}
+        return detections
+
+    def stats(self):
+        return self._call({"op": "stats"})[0]
@@ -0,0 +1,236 @@
+import argparse
+import os
+import queue
+import socketserver
+import threading
+import time
+import numpy as np
+
+try:
+    from facenet_encoder import EMBEDDING_BACKEND, embed_aligned_faces, get_face_embeddings, quality_stats, warmup
+    from face_detector import FaceDetector
+    from inference_client import SOCKET_PATH, recv_message, send_message, unpack_frames
+    from runtime_config import configure_runtime
+except ImportError:
+    from face_recognition.facenet_encoder import (
+        EMBEDDING_BACKEND,
+        embed_aligned_faces,
+        get_face_embeddings,
+        quality_stats,
+        warmup,
+    )
+    from face_recognition.face_detector import FaceDetector
+    from face_recognition.inference_client import SOCKET_PATH, recv_message, send_message, unpack_frames
+    from face_recognition.runtime_config import configure_runtime
+
+MAX_BATCH = int(os.environ.get("FACENET_SERVER_MAX_BATCH", "32"))
+MAX_DELAY_MS = float(os.environ.get("FACENET_SERVER_MAX_DELAY_MS", "5"))
+
+
+class _Request:
+    def __init__(self, frames, options):
+        self.frames = frames
+        self.options = options
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Merges concurrent embed requests into one forward pass.
+
+    A batch closes when it holds ``max_batch`` crops or ``max_delay``
+    seconds after its first request arrived, whichever comes first. Detect
+    requests queue in the same way but run frame by frame on ``detector``.
+    Only the batching thread touches the models.
+    """
+
+    def __init__(self, max_batch=MAX_BATCH, max_delay=MAX_DELAY_MS / 1000.0, detector=None):
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max(0.0, max_delay)
+        self.detector = detector
+        self.detected_frames = 0
+        self.pending = queue.Queue()
+        self.stats_lock = threading.Lock()
+        self.batches = 0
+        self.faces = 0
+        self.requests = 0
+        self.busy_seconds = 0.0
+        self.thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, frames, options):
+        request = _Request(frames, options)
+        self.pending.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        size = len(batch[0].frames)
+        deadline = time.monotonic() + self.max_delay
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.frames)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.options, []).append(request)
+            for options, requests in groups.items():
+                self._run(requests, dict(options))
+            with self.stats_lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.faces += sum(len(request.frames) for request in batch)
+                self.busy_seconds += time.perf_counter() - started
+
+    def _run(self, requests, options):
+        frames = [frame for request in requests for frame in request.frames]
+        try:
+            if options.pop("detect", False):
+                if self.detector is None:
+                    raise RuntimeError("Server started without a face detector")
+                results = [self.detector.detect(frame, scale=options["scale"]) for frame in frames]
+                with self.stats_lock:
+                    self.detected_frames += len(frames)
+            elif options.pop("aligned", False):
+                # Already aligned and quality-checked by the caller.
+                results = [(embedding, {"reason": "ok"}) for embedding in embed_aligned_faces(frames)]
+            else:
+                results = get_face_embeddings(frames, **options)
+        except Exception as exc:
+            for request in requests:
+                request.error = exc
+                request.done.set()
+            return
+        offset = 0
+        for request in requests:
+            request.results = results[offset : offset + len(request.frames)]
+            offset += len(request.frames)
+            request.done.set()
+
+    def summary(self):
+        with self.stats_lock:
+            return {
+                "backend": EMBEDDING_BACKEND,
+                "detector": self.detector.mode if self.detector is not None else None,
+                "detected_frames": self.detected_frames,
+                "batches": self.batches,
+                "requests": self.requests,
+                "faces": self.faces,
+                "mean_batch": self.faces / self.batches if self.batches else 0.0,
+                "busy_seconds": self.busy_seconds,
+                "queued": self.pending.qsize(),
+                "quality": quality_stats(),
+            }
+
+
+class InferenceHandler(socketserver.BaseRequestHandler):
+    """One client connection; serves requests until the client hangs up."""
+
+    def handle(self):
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ValueError):
+                return
+            if message is None:
+                return
+            header, payload = message
+            try:
+                response, body = self._dispatch(header, payload)
+            except Exception as exc:
+                response, body = {"error": f"{type(exc).__name__}: {exc}"}, b""
+            try:
+                send_message(self.request, response, body)
+            except OSError:
+                return
+
+    def _dispatch(self, header, payload):
+        op = header.get("op")
+        if op == "stats":
+            return self.server.batcher.summary(), b""
+        frames = unpack_frames(header["shapes"], payload)
+        if op == "detect":
+            detections = self.server.batcher.submit(frames, (("detect", True), ("scale", float(header.get("scale", 1.0)))))
+            return {"detections": detections}, b""
+        if op == "embed_aligned":
+            options = (("aligned", True),)
+        elif op == "embed":
+            options = (
+                ("assume_cropped", bool(header.get("assume_cropped"))),
+                ("relaxed_quality", bool(header.get("relaxed_quality"))),
+            )
+        else:
+            raise ValueError(f"Unknown op {op!r}")
+        results = self.server.batcher.submit(frames, options)
+        rows = [index for index, (embedding, _) in enumerate(results) if embedding is not None]
+        embeddings = [np.asarray(results[index][0], dtype=np.float32).reshape(-1) for index in rows]
+        return (
+            {
+                "rows": rows,
+                "dim": int(embeddings[0].shape[0]) if embeddings else 0,
+                "metas": [meta for _, meta in results],
+            },
+            np.concatenate(embeddings).tobytes() if embeddings else b"",
+        )
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, batcher):
+        self.batcher = batcher
+        super().__init__(path, InferenceHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve face detection and FaceNet embeddings to every worker on this host over a Unix socket."
+    )
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="Most crops per forward pass")
+    parser.add_argument("--max-delay-ms", type=float, default=MAX_DELAY_MS, help="Longest wait to fill a batch")
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+
+    budget = configure_runtime("server")
+    print(f"[INFO] Loading models ({EMBEDDING_BACKEND} backend, {budget['intra_op']} threads)")
+    started = time.perf_counter()
+    warmup()
+    detector = FaceDetector()
+    print(f"[INFO] Models ready in {time.perf_counter() - started:.1f}s (detector {detector.mode})")
+
+    batcher = MicroBatcher(args.max_batch, args.max_delay_ms / 1000.0, detector)
+    server = InferenceServer(args.socket, batcher)
+    print(f"[SUCCESS] Listening on {args.socket} (batch <= {args.max_batch}, wait <= {args.max_delay_ms:g} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        summary = batcher.summary()
+        print(f"[INFO] Served {summary['faces']} faces in {summary['batches']} batches (mean {summary['mean_batch']:.1f})")
+
+
+if __name__ == "__main__":
+    main()
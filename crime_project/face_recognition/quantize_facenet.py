@@ -0,0 +1,181 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from calibrate_threshold import best_threshold, genuine_distances, impostor_distances, roc_sweep, rates_at
+from compare_embedding_backends import DATASET_PATH, collect_faces, parity
+
+try:
+    from facenet_encoder import ONNX_INT8_MODEL_PATH, ONNX_MODEL_PATH, _standardize, load_embedder
+except ImportError:
+    from face_recognition.facenet_encoder import ONNX_INT8_MODEL_PATH, ONNX_MODEL_PATH, _standardize, load_embedder
+
+DEFAULT_CALIBRATION_FACES = 200
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+class FaceCalibrationReader:
+    """Feeds standardized dataset faces to the static quantizer, one at a time."""
+
+    def __init__(self, input_name, faces, channels_first=False):
+        self.input_name = input_name
+        self.faces = faces
+        self.channels_first = channels_first
+        self.position = 0
+
+    def get_next(self):
+        if self.position >= len(self.faces):
+            return None
+        batch = _standardize(self.faces[self.position : self.position + 1])
+        self.position += 1
+        if self.channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        return {self.input_name: np.ascontiguousarray(batch)}
+
+    def rewind(self):
+        self.position = 0
+
+
+def quantize(float_path, int8_path, faces, mode):
+    """Write an INT8 copy of ``float_path``.
+
+    ``static`` calibrates activation ranges on ``faces`` and quantizes
+    weights per channel (QDQ); ``dynamic`` quantizes weights only and picks
+    activation ranges at run time.
+    """
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference and graph cleanup first, as the quantizer asks.
+        prepared = Path(tmp) / "prepared.onnx"
+        quant_pre_process(str(float_path), str(prepared), skip_symbolic_shape=True)
+        if mode == "dynamic":
+            quantize_dynamic(str(prepared), str(int8_path), weight_type=QuantType.QInt8)
+            return
+
+        model_input = onnxruntime.InferenceSession(str(prepared), providers=["CPUExecutionProvider"]).get_inputs()[0]
+        channels_first = len(model_input.shape) == 4 and model_input.shape[1] == 3
+        quantize_static(
+            str(prepared),
+            str(int8_path),
+            FaceCalibrationReader(model_input.name, faces, channels_first),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+
+
+def embed(embedder, faces, batch_size):
+    """Normalized embeddings and the best-of-three ms/face."""
+    timings, embeddings = [], None
+    embedder.embeddings(faces[:1])
+    for _ in range(3):
+        started = time.perf_counter()
+        embeddings = np.concatenate(
+            [
+                np.asarray(embedder.embeddings(faces[start : start + batch_size]), dtype=np.float32)
+                for start in range(0, len(faces), batch_size)
+            ]
+        )
+        timings.append(time.perf_counter() - started)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return embeddings, 1000.0 * min(timings) / len(faces)
+
+
+def distance_report(labels, embeddings):
+    """Genuine/impostor distances and the calibrated threshold for one model."""
+    # The calibration helpers expect rows grouped by label.
+    order = np.argsort(np.asarray(labels), kind="stable")
+    _, counts = np.unique(np.asarray(labels)[order], return_counts=True)
+    matrix = embeddings[order]
+    keep = np.repeat(counts >= 2, counts)
+    counts = counts[counts >= 2]
+    matrix = matrix[keep]
+    genuine = genuine_distances(counts, matrix)
+    impostor = impostor_distances(np.repeat(np.arange(len(counts)), counts), matrix, budget=None)
+    return genuine, impostor, best_threshold(genuine, impostor)
+
+
+def _percentile_row(name, distances):
+    values = np.percentile(distances, PERCENTILES) if len(distances) else [np.nan] * len(PERCENTILES)
+    return f"{name:<16}" + "".join(f"{value:>8.3f}" for value in values)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build an INT8 FaceNet model calibrated on dataset faces and report what it costs.",
+        epilog="Needs the packages in crime_project/requirements-dev.txt.",
+    )
+    parser.add_argument("--float-model", type=Path, default=ONNX_MODEL_PATH)
+    parser.add_argument("--output", type=Path, default=ONNX_INT8_MODEL_PATH)
+    parser.add_argument("--mode", choices=("static", "dynamic"), default="static")
+    parser.add_argument("--dataset", type=Path, default=DATASET_PATH)
+    parser.add_argument("--limit-per-person", type=int, default=10)
+    parser.add_argument("--max-faces", type=int, default=2000)
+    parser.add_argument("--calibration-faces", type=int, default=DEFAULT_CALIBRATION_FACES)
+    parser.add_argument("--assume-cropped", action="store_true", help="Dataset images are already face crops")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--report-only", action="store_true", help="Skip quantization and report on --output")
+    args = parser.parse_args()
+
+    if not args.float_model.exists():
+        print(f"[WARNING] {args.float_model} not found; run export_facenet_onnx.py first")
+        sys.exit(1)
+    labels, faces = collect_faces(args.dataset, args.limit_per_person, args.max_faces, args.assume_cropped)
+    if faces is None:
+        print("[WARNING] No usable faces in the dataset")
+        sys.exit(1)
+    print(f"[INFO] {len(faces)} faces of {len(set(labels))} people from {args.dataset}")
+
+    if not args.report_only:
+        # Spread calibration faces over every person rather than the first few.
+        step = max(1, len(faces) // max(1, args.calibration_faces))
+        calibration = faces[::step][: args.calibration_faces]
+        print(f"[INFO] Quantizing ({args.mode}, {len(calibration)} calibration faces) to {args.output}")
+        quantize(args.float_model, args.output, calibration, args.mode)
+        print(f"[SUCCESS] Wrote {args.output} ({args.output.stat().st_size / (1024 * 1024):.1f} MB)")
+
+    reports = {}
+    for name, backend, path in (("float", "onnx", args.float_model), ("int8", "onnx-int8", args.output)):
+        embeddings, ms_per_face = embed(load_embedder(backend, path), faces, args.batch_size)
+        reports[name] = (embeddings, ms_per_face) + distance_report(labels, embeddings)
+
+    float_embeddings, float_ms, float_genuine, float_impostor, float_best = reports["float"]
+    int8_embeddings, int8_ms, int8_genuine, int8_impostor, int8_best = reports["int8"]
+    agreement = parity(float_embeddings, int8_embeddings)
+
+    print()
+    print(f"{'distances':<16}" + "".join(f"{f'p{p}':>8}" for p in PERCENTILES))
+    print(_percentile_row("genuine float", float_genuine))
+    print(_percentile_row("genuine int8", int8_genuine))
+    print(_percentile_row("impostor float", float_impostor))
+    print(_percentile_row("impostor int8", int8_impostor))
+
+    print()
+    print(f"{'model':<6} {'threshold':>9} {'FRR':>7} {'FAR':>7} {'ms/face':>8} {'MB':>6}")
+    for name, best, ms_per_face, path in (
+        ("float", float_best, float_ms, args.float_model),
+        ("int8", int8_best, int8_ms, args.output),
+    ):
+        size_mb = path.stat().st_size / (1024 * 1024)
+        print(f"{name:<6} {best['threshold']:>9.3f} {best['frr']:>7.4f} {best['far']:>7.4f} {ms_per_face:>8.2f} {size_mb:>6.1f}")
+
+    # What the int8 model does at the threshold tuned for the float model.
+    frr, far = rates_at(roc_sweep(int8_genuine, int8_impostor), np.array([float_best["threshold"]]))
+    print(f"\nint8 at the float threshold {float_best['threshold']:.3f}: FRR={frr[0]:.4f}, FAR={far[0]:.4f}")
+    print(
+        f"Embedding cosine vs float: min {agreement['min_cosine']:.4f} mean {agreement['mean_cosine']:.4f}; "
+        f"same nearest neighbour {100 * agreement['same_nearest_neighbor']:.1f}%"
+    )
+    print(f"Speedup: {float_ms / max(int8_ms, 1e-9):.2f}x")
+    print(f"[INFO] Serve it with FACENET_BACKEND=onnx-int8 and FACENET_MATCH_THRESHOLD={int8_best['threshold']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
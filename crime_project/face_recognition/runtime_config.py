@@ -0,0 +1,210 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+# Nothing here may import numpy or cv2 at module level: configure_thread_env
+# has to run before either loads its BLAS or OpenMP pool.
+
+# What each kind of process runs:
+#   stream  many concurrent single-face calls from live camera streams
+#   upload  a few heavy image/video uploads at a time
+#   build   one process of a parallel gallery build (gets its share of cores)
+#   server  inference_server.py, one batching thread owning the models
+ROLES = ("stream", "upload", "build", "server")
+DEFAULT_ROLE = "upload"
+
+# Per-library overrides; unset means the role's default below.
+_OVERRIDES = {
+    "intra_op": "FACENET_TF_THREADS",
+    "inter_op": "FACENET_TF_INTEROP_THREADS",
+    "opencv": "FACENET_OPENCV_THREADS",
+    "blas": "FACENET_BLAS_THREADS",
+    "embed_slots": "FACENET_EMBED_SLOTS",
+}
+_BLAS_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+# Variables configure_runtime set itself rather than the user. Child
+# processes inherit the list, so a pool worker or a build started from a web
+# worker replaces its parent's budget with its own.
+_OWNED_ENV = "FACENET_RUNTIME_OWNED_ENV"
+
+_CONFIG_LOCK = threading.RLock()
+_budget = None
+_slots = None
+# BLAS thread count exported before numpy was imported, if any.
+_early_blas = None
+
+
+class EmbeddingSlots:
+    """A counting semaphore that hands out slots first come, first served.
+
+    threading.Semaphore lets the releasing thread grab the slot straight
+    back, which starves every other caller under steady load.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.free = size
+        self.condition = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+
+    def acquire(self):
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.condition.wait_for(lambda: ticket == self.serving and self.free > 0)
+            self.serving += 1
+            self.free -= 1
+            self.condition.notify_all()
+
+    def release(self):
+        with self.condition:
+            self.free += 1
+            self.condition.notify_all()
+
+    def waiting(self):
+        with self.condition:
+            return self.next_ticket - self.serving
+
+
+def available_cores():
+    if os.environ.get("FACENET_CPU_CORES"):
+        return max(1, int(os.environ["FACENET_CPU_CORES"]))
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def role_budget(role, cores):
+    """Thread budget of ``role`` on ``cores`` cores.
+
+    ``intra_op * embed_slots`` stays at or below ``cores``, so concurrent
+    embedding calls can never ask for more threads than the box has.
+    """
+    if role == "stream":
+        budget = {"intra_op": 1, "inter_op": 1, "opencv": 1, "blas": 1, "embed_slots": max(1, cores // 2)}
+    elif role == "upload":
+        intra_op = min(4, cores)
+        budget = {"intra_op": intra_op, "inter_op": 1, "opencv": 2, "blas": 2, "embed_slots": max(1, cores // intra_op)}
+    elif role in ("build", "server"):
+        budget = {"intra_op": cores, "inter_op": 1, "opencv": 1, "blas": 1, "embed_slots": 1}
+    else:
+        raise ValueError(f"Unknown runtime role {role!r}; expected one of {', '.join(ROLES)}")
+
+    for key, name in _OVERRIDES.items():
+        if os.environ.get(name):
+            budget[key] = max(1, int(os.environ[name]))
+    return budget
+
+
+def _set_thread_env(values):
+    owned = {name for name in os.environ.get(_OWNED_ENV, "").split(",") if name}
+    for name, value in values.items():
+        if name in os.environ and name not in owned:
+            continue
+        os.environ[name] = value
+        owned.add(name)
+    os.environ[_OWNED_ENV] = ",".join(sorted(owned))
+
+
+def configure_thread_env(role=None, cores=None):
+    """Export the role's thread variables for libraries not loaded yet.
+
+    BLAS reads OMP_NUM_THREADS and friends when numpy is first imported, so
+    entry points (manage.py, wsgi.py, asgi.py) call this before anything
+    imports numpy. Explicit environment settings (TF_NUM_INTRAOP_THREADS,
+    OMP_NUM_THREADS, ...) are left alone; values inherited from a parent's
+    configure_runtime are replaced.
+    """
+    global _early_blas
+    role = (role or os.environ.get("FACENET_RUNTIME_ROLE", DEFAULT_ROLE)).strip().lower()
+    budget = role_budget(role, cores or available_cores())
+    budget["role"] = role
+
+    thread_env = {
+        "TF_NUM_INTRAOP_THREADS": str(budget["intra_op"]),
+        "TF_NUM_INTEROP_THREADS": str(budget["inter_op"]),
+    }
+    thread_env.update((name, str(budget["blas"])) for name in _BLAS_ENV)
+    _set_thread_env(thread_env)
+    if "numpy" not in sys.modules:
+        _early_blas = budget["blas"]
+    return budget
+
+
+def _limit_loaded_blas(threads):
+    """Resize the BLAS pool of an already imported numpy in place."""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        print(f"[WARNING] threadpoolctl is not installed; BLAS keeps its own thread count instead of {threads}")
+        return
+    try:
+        threadpool_limits(limits=threads, user_api="blas")
+    except Exception as exc:
+        print(f"[WARNING] Could not limit BLAS to {threads} threads ({exc})")
+
+
+def configure_runtime(role=None, cores=None):
+    """Apply the thread budget of this process's role; call once at start.
+
+    TensorFlow and BLAS read their settings when they initialize, so this
+    has to run before the first model is loaded. When numpy is already
+    imported (configure_thread_env was not called early enough), its BLAS
+    pool is resized with threadpoolctl instead.
+    """
+    global _budget, _slots
+    numpy_loaded = "numpy" in sys.modules
+    budget = configure_thread_env(role, cores)
+
+    import cv2
+
+    cv2.setNumThreads(budget["opencv"])
+    if numpy_loaded and budget["blas"] != _early_blas:
+        _limit_loaded_blas(budget["blas"])
+
+    if "tensorflow" in sys.modules:
+        try:
+            tf = sys.modules["tensorflow"]
+            tf.config.threading.set_intra_op_parallelism_threads(budget["intra_op"])
+            tf.config.threading.set_inter_op_parallelism_threads(budget["inter_op"])
+        except Exception:
+            print("[WARNING] TensorFlow already initialized; its thread pools keep their size")
+
+    with _CONFIG_LOCK:
+        _budget = budget
+        _slots = EmbeddingSlots(budget["embed_slots"])
+    return budget
+
+
+def thread_budget():
+    """The applied budget, configuring the default role on first use."""
+    with _CONFIG_LOCK:
+        if _budget is None:
+            configure_runtime()
+        return _budget
+
+
+def runtime_status():
+    """The applied budget plus how many callers are queued for a slot."""
+    status = dict(thread_budget())
+    status["embed_waiting"] = _slots.waiting()
+    return status
+
+
+@contextmanager
+def embedding_slot():
+    """Hold one of the role's ``embed_slots`` for the duration of a call.
+
+    Callers beyond the limit wait here instead of piling more threads onto
+    cores that are already busy.
+    """
+    thread_budget()
+    slots = _slots
+    slots.acquire()
+    try:
+        yield
+    finally:
+        slots.release()
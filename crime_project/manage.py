@@ -7,6 +7,10 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crime_project.settings')
+    # Thread variables have to be set before anything imports numpy.
+    from face_recognition.runtime_config import configure_thread_env
+
+    configure_thread_env()
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
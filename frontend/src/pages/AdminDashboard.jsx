@@ -619,7 +619,24 @@ export default function AdminDashboard() {
     setMessage("Re-training face dataset...");
     const response = await apiFetch("/api/admin/retrain/", { method: "POST" });
     const data = await response.json();
-    setMessage(data.message || (data.success ? "Dataset retrained." : "Dataset retrain failed."));
+    setMessage(data.message || (data.success ? "Dataset re-training queued." : "Dataset retrain failed."));
+    if (!data.success || !data.job_id) return;
+
+    // The rebuild runs in the background; follow the job until it settles.
+    let job = { status: data.status };
+    while (job && (job.status === "queued" || job.status === "running")) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      const statusResponse = await apiFetch(`/api/admin/retrain/${data.job_id}/`);
+      const statusData = await statusResponse.json();
+      if (!statusData.success) return;
+      job = statusData.job;
+      if (job.status === "running") {
+        setMessage(`Re-training face dataset... ${job.progress}%`);
+      }
+    }
+    if (job) {
+      setMessage(job.message || (job.status === "succeeded" ? "Dataset retrained." : "Dataset retrain failed."));
+    }
   };
 
   const downloadEvidenceReport = () => {